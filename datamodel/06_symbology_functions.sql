@@ -217,6 +217,11 @@ DECLARE
   symb_attribs RECORD;
   re_obj_id TEXT;
 BEGIN
+  -- Skipped by batch updates which refresh the symbology once, see qgep_od.reach_direction_change
+  IF current_setting('qgep.skip_symbology_triggers', true) = 'true' THEN
+    RETURN NEW;
+  END IF;
+
   CASE
     WHEN TG_OP = 'UPDATE' THEN
       re_obj_id = OLD.obj_id;
@@ -492,6 +497,11 @@ DECLARE
   _ws_obj_id TEXT;
   rps RECORD;
 BEGIN
+  -- Skipped by batch updates which refresh the symbology once, see qgep_od.reach_direction_change
+  IF current_setting('qgep.skip_symbology_triggers', true) = 'true' THEN
+    RETURN NEW;
+  END IF;
+
   CASE
     WHEN TG_OP = 'UPDATE' THEN
       rp_obj_ids = ARRAY[OLD.fk_reach_point_from, OLD.fk_reach_point_to];
@@ -0,0 +1,169 @@
+/***************************************************************************
+    reach_direction_change.sql
+    ---------------------
+    begin                : August 2018
+    copyright            : (C) 2018 by Matthias Kuhn, OPENGIS.ch
+    email                : matthias@opengis.ch
+ ***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+/**
+ * This function changes the direction of a set of reaches.
+ * It will change the direction of the line itself as well as switch the two reach points
+ * to make sure the topology and reach point attributes stay the way they were.
+ * 
+ * With the parameter `reach_obj_ids` it is possible to specify on which reaches this operation
+ * should be performed by passing in an array of obj_ids
+ *
+ * The symbology row triggers of the reaches are skipped during the update with the transaction
+ * local setting `qgep.skip_symbology_triggers`, they would recalculate the structures at both
+ * ends for every single reach. Instead, the symbology, labels and depth of every affected
+ * wastewater structure and node are recalculated once at the end.
+ */
+CREATE OR REPLACE FUNCTION qgep_od.reach_direction_change(reach_obj_ids text[])RETURNS void AS $BODY$
+
+BEGIN 
+
+PERFORM set_config('qgep.skip_symbology_triggers', 'true', true);
+
+UPDATE qgep_od.reach 
+  SET
+    progression_geometry = (ST_ForceCurve(ST_Reverse(ST_CurveToLine(progression_geometry)))),
+    fk_reach_point_from = fk_reach_point_to,
+    fk_reach_point_to = fk_reach_point_from
+  WHERE obj_id = ANY(reach_obj_ids);
+
+PERFORM set_config('qgep.skip_symbology_triggers', 'false', true);
+
+CREATE TEMP TABLE _reach_direction_change_ne ON COMMIT DROP AS
+  SELECT DISTINCT ne.obj_id, ne.fk_wastewater_structure
+  FROM qgep_od.reach re
+  JOIN qgep_od.reach_point rp ON rp.obj_id IN (re.fk_reach_point_from, re.fk_reach_point_to)
+  JOIN qgep_od.wastewater_networkelement ne ON ne.obj_id = rp.fk_wastewater_networkelement
+  WHERE re.obj_id = ANY(reach_obj_ids);
+
+PERFORM qgep_od.update_wastewater_structure_symbology(ws_obj_id),
+        qgep_od.update_wastewater_structure_label(ws_obj_id),
+        qgep_od.update_depth(ws_obj_id)
+  FROM (
+    SELECT DISTINCT fk_wastewater_structure AS ws_obj_id
+    FROM _reach_direction_change_ne
+    WHERE fk_wastewater_structure IS NOT NULL
+  ) ws;
+
+PERFORM qgep_od.update_wastewater_node_symbology(obj_id)
+  FROM _reach_direction_change_ne;
+
+DROP TABLE _reach_direction_change_ne;
+END;
+$BODY$
+LANGUAGE plpgsql VOLATILE
+COST 100;
+
+-- The symbology triggers of the reaches are skipped with the transaction local setting
+-- qgep.skip_symbology_triggers, see 06_symbology_functions.sql
+
+CREATE OR REPLACE FUNCTION qgep_od.ws_symbology_update_by_reach()
+  RETURNS trigger AS
+$BODY$
+DECLARE
+  _ws_from_id TEXT;
+  _ne_from_id TEXT;
+  _ws_to_id TEXT;
+  _ne_to_id TEXT;
+  symb_attribs RECORD;
+  re_obj_id TEXT;
+BEGIN
+  -- Skipped by batch updates which refresh the symbology once, see qgep_od.reach_direction_change
+  IF current_setting('qgep.skip_symbology_triggers', true) = 'true' THEN
+    RETURN NEW;
+  END IF;
+
+  CASE
+    WHEN TG_OP = 'UPDATE' THEN
+      re_obj_id = OLD.obj_id;
+    WHEN TG_OP = 'INSERT' THEN
+      re_obj_id = NEW.obj_id;
+    WHEN TG_OP = 'DELETE' THEN
+      re_obj_id = OLD.obj_id;
+  END CASE;
+
+  BEGIN
+    SELECT ws.obj_id, ne.obj_id INTO STRICT _ws_from_id, _ne_from_id
+      FROM qgep_od.reach re
+      LEFT JOIN qgep_od.reach_point rp ON rp.obj_id = re.fk_reach_point_from
+      LEFT JOIN qgep_od.wastewater_networkelement ne ON ne.obj_id = rp.fk_wastewater_networkelement
+      LEFT JOIN qgep_od.wastewater_structure ws ON ws.obj_id = ne.fk_wastewater_structure
+      WHERE re.obj_id = re_obj_id;
+    EXECUTE qgep_od.update_wastewater_structure_symbology(_ws_from_id);
+    EXECUTE qgep_od.update_wastewater_node_symbology(_ne_from_id);
+  EXCEPTION
+    WHEN NO_DATA_FOUND THEN
+      -- DO NOTHING, THIS CAN HAPPEN
+    WHEN TOO_MANY_ROWS THEN
+        RAISE EXCEPTION 'TRIGGER ERROR ws_symbology_update_by_reach. Subquery shoud return exactly one row. This is not supposed to happen and indicates an isue with the trigger. The issue must be fixed in QGEP.';
+  END;
+
+  BEGIN
+    SELECT ws.obj_id, ne.obj_id INTO STRICT _ws_to_id, _ne_to_id
+      FROM qgep_od.reach re
+      LEFT JOIN qgep_od.reach_point rp ON rp.obj_id = re.fk_reach_point_to
+      LEFT JOIN qgep_od.wastewater_networkelement ne ON ne.obj_id = rp.fk_wastewater_networkelement
+      LEFT JOIN qgep_od.wastewater_structure ws ON ws.obj_id = ne.fk_wastewater_structure
+      WHERE re.obj_id = re_obj_id;
+    EXECUTE qgep_od.update_wastewater_structure_symbology(_ws_to_id);
+    EXECUTE qgep_od.update_wastewater_node_symbology(_ne_to_id);
+  EXCEPTION
+    WHEN NO_DATA_FOUND THEN
+      -- DO NOTHING, THIS CAN HAPPEN
+    WHEN TOO_MANY_ROWS THEN
+        RAISE EXCEPTION 'TRIGGER ERROR ws_symbology_update_by_reach. Subquery shoud return exactly one row. This is not supposed to happen and indicates an isue with the trigger. The issue must be fixed in QGEP.';
+  END;
+
+
+  RETURN NEW;
+END; $BODY$
+LANGUAGE plpgsql VOLATILE;
+
+CREATE OR REPLACE FUNCTION qgep_od.on_reach_change()
+  RETURNS trigger AS
+$BODY$
+DECLARE
+  rp_obj_ids TEXT[];
+  _ws_obj_id TEXT;
+  rps RECORD;
+BEGIN
+  -- Skipped by batch updates which refresh the symbology once, see qgep_od.reach_direction_change
+  IF current_setting('qgep.skip_symbology_triggers', true) = 'true' THEN
+    RETURN NEW;
+  END IF;
+
+  CASE
+    WHEN TG_OP = 'UPDATE' THEN
+      rp_obj_ids = ARRAY[OLD.fk_reach_point_from, OLD.fk_reach_point_to];
+    WHEN TG_OP = 'INSERT' THEN
+      rp_obj_ids = ARRAY[NEW.fk_reach_point_from, NEW.fk_reach_point_to];
+    WHEN TG_OP = 'DELETE' THEN
+      rp_obj_ids = ARRAY[OLD.fk_reach_point_from, OLD.fk_reach_point_to];
+  END CASE;
+
+  FOR _ws_obj_id IN
+    SELECT ws.obj_id
+      FROM qgep_od.wastewater_structure ws
+      LEFT JOIN qgep_od.wastewater_networkelement ne ON ws.obj_id = ne.fk_wastewater_structure
+      LEFT JOIN qgep_od.reach_point rp ON ne.obj_id = rp.fk_wastewater_networkelement
+      WHERE rp.obj_id = ANY ( rp_obj_ids )
+  LOOP
+    EXECUTE qgep_od.update_wastewater_structure_label(_ws_obj_id);
+    EXECUTE qgep_od.update_depth(_ws_obj_id);
+  END LOOP;
+
+  RETURN NEW;
+END; $BODY$
+LANGUAGE plpgsql VOLATILE;
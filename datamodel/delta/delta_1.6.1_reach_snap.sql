@@ -0,0 +1,123 @@
+/***************************************************************************
+    reach_snap.sql
+    ---------------------
+    begin                : October 2026
+    copyright            : (C) 2026 by the QGEP project
+ ***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+/**
+ * This function snaps the start and end vertices of a set of reaches to the network
+ * elements they are connected to, it is the server side counterpart of the
+ * "Snap reach geometry" processing algorithm.
+ *
+ * The start vertex is snapped to the wastewater node of the from reach point. The end
+ * vertex is snapped to the wastewater node of the to reach point or, for blind connections,
+ * to the closest point on the target reach. The level (Z) of the vertices is kept and the
+ * reach points are moved along.
+ *
+ * With the parameter `reach_obj_ids` it is possible to specify on which reaches this operation
+ * should be performed by passing in an array of obj_ids, NULL snaps all reaches.
+ * Vertices farther than `tolerance` from their target are left untouched, 0 means no maximum.
+ * With `dry_run` nothing is modified.
+ *
+ * Only the start and end vertices are replaced, the other vertices are kept. Reaches with
+ * circular arcs can not be edited vertex by vertex in SQL without turning the arcs into
+ * segments, they are left untouched and reported as skipped.
+ *
+ * Returns the reaches which are (or would be) modified, with the distance each of
+ * their vertices is moved by, NULL if it is not moved, and whether the reach is skipped.
+ */
+DROP FUNCTION IF EXISTS qgep_od.reach_snap(text[], double precision, boolean);
+CREATE OR REPLACE FUNCTION qgep_od.reach_snap(reach_obj_ids text[] DEFAULT NULL, tolerance double precision DEFAULT 10, dry_run boolean DEFAULT FALSE)
+RETURNS TABLE(obj_id text, from_distance double precision, to_distance double precision, skipped boolean) AS $BODY$
+#variable_conflict use_column
+BEGIN
+  DROP TABLE IF EXISTS _reach_snap;
+
+  CREATE TEMP TABLE _reach_snap ON COMMIT DROP AS
+  WITH connected AS (
+    SELECT re.obj_id,
+           re.fk_reach_point_from,
+           re.fk_reach_point_to,
+           ST_CurveToLine(re.progression_geometry) AS geom,
+           ST_HasArc(re.progression_geometry) AS skipped,
+           wn_from.situation_geometry AS from_target,
+           COALESCE(
+             wn_to.situation_geometry,
+             ST_ClosestPoint(ST_CurveToLine(re_to.progression_geometry), ST_EndPoint(ST_CurveToLine(re.progression_geometry)))
+           ) AS to_target
+    FROM qgep_od.reach re
+    LEFT JOIN qgep_od.reach_point rp_from ON rp_from.obj_id = re.fk_reach_point_from
+    LEFT JOIN qgep_od.reach_point rp_to ON rp_to.obj_id = re.fk_reach_point_to
+    LEFT JOIN qgep_od.wastewater_node wn_from ON wn_from.obj_id = rp_from.fk_wastewater_networkelement
+    LEFT JOIN qgep_od.wastewater_node wn_to ON wn_to.obj_id = rp_to.fk_wastewater_networkelement
+    LEFT JOIN qgep_od.reach re_to ON re_to.obj_id = rp_to.fk_wastewater_networkelement
+    WHERE (reach_obj_ids IS NULL OR re.obj_id = ANY(reach_obj_ids))
+      AND re.progression_geometry IS NOT NULL
+  ), distance AS (
+    SELECT connected.*,
+           NULLIF(ST_Distance(ST_StartPoint(geom), from_target), 0) AS from_distance,
+           NULLIF(ST_Distance(ST_EndPoint(geom), to_target), 0) AS to_distance
+    FROM connected
+  ), snap AS (
+    SELECT obj_id,
+           fk_reach_point_from,
+           fk_reach_point_to,
+           geom,
+           skipped,
+           from_target,
+           to_target,
+           CASE WHEN tolerance = 0 OR from_distance < tolerance THEN from_distance END AS from_distance,
+           CASE WHEN tolerance = 0 OR to_distance < tolerance THEN to_distance END AS to_distance
+    FROM distance
+  )
+  SELECT obj_id,
+         fk_reach_point_from,
+         fk_reach_point_to,
+         from_distance,
+         to_distance,
+         skipped,
+         ST_SetPoint(
+           CASE WHEN from_distance IS NULL THEN geom
+           ELSE ST_SetPoint(geom, 0, ST_SetSRID(ST_MakePoint(ST_X(from_target), ST_Y(from_target), ST_Z(ST_StartPoint(geom))), ST_SRID(geom)))
+           END,
+           ST_NumPoints(geom) - 1,
+           CASE WHEN to_distance IS NULL THEN ST_EndPoint(geom)
+           ELSE ST_SetSRID(ST_MakePoint(ST_X(to_target), ST_Y(to_target), ST_Z(ST_EndPoint(geom))), ST_SRID(geom))
+           END
+         ) AS geom
+  FROM snap
+  WHERE from_distance IS NOT NULL OR to_distance IS NOT NULL;
+
+  IF NOT dry_run THEN
+    -- Without arcs, the segments have the same vertices as the curve
+    UPDATE qgep_od.reach re
+      SET progression_geometry = ST_ForceCurve(s.geom)
+    FROM _reach_snap s
+    WHERE re.obj_id = s.obj_id AND NOT s.skipped;
+
+    UPDATE qgep_od.reach_point rp
+      SET situation_geometry = ST_StartPoint(s.geom)
+    FROM _reach_snap s
+    WHERE rp.obj_id = s.fk_reach_point_from AND s.from_distance IS NOT NULL AND NOT s.skipped;
+
+    UPDATE qgep_od.reach_point rp
+      SET situation_geometry = ST_EndPoint(s.geom)
+    FROM _reach_snap s
+    WHERE rp.obj_id = s.fk_reach_point_to AND s.to_distance IS NOT NULL AND NOT s.skipped;
+  END IF;
+
+  RETURN QUERY
+  SELECT s.obj_id::text, s.from_distance, s.to_distance, s.skipped
+  FROM _reach_snap s
+  ORDER BY s.obj_id;
+END;
+$BODY$
+LANGUAGE plpgsql VOLATILE;
@@ -0,0 +1,214 @@
+/***************************************************************************
+    sum_up_upstream.sql
+    ---------------------
+    begin                : October 2026
+    copyright            : (C) 2026 by the QGEP project
+ ***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+
+/**
+ * This function sums up values of all reaches downstream of every wastewater node,
+ * it is the server side counterpart of the "Sum up upstream" processing algorithm.
+ *
+ * `value_expressions` are SQL expressions evaluated on qgep_od.vw_qgep_reach,
+ * e.g. `COALESCE("clear_height", 0)`. Reaches which are subdivided by blind connections
+ * contribute proportionally to the length of each segment.
+ *
+ * `branch_behaviors` define for each expression how the values of several downstream paths
+ * are aggregated, one of `minimum`, `maximum` or `average`, `minimum` for all by default.
+ *
+ * All the values are summed up in a single pass over the network (qgep_network.node and
+ * qgep_network.segment), which is processed in reverse topological order, starting at the
+ * outlets. Loops are cut at one of their nodes, where the path closing the loop contributes
+ * nothing, these nodes are returned with `in_loop`.
+ * The network is not refreshed, call qgep_network.refresh_network_simple() before if needed.
+ *
+ * Returns the values of each wastewater node, in the order of the expressions.
+ */
+DROP FUNCTION IF EXISTS qgep_network.sum_up_upstream(text[], text[]);
+CREATE OR REPLACE FUNCTION qgep_network.sum_up_upstream(value_expressions text[], branch_behaviors text[] DEFAULT NULL)
+RETURNS TABLE(obj_id text, "values" double precision[], in_loop boolean) AS $BODY$
+#variable_conflict use_column
+DECLARE
+  value_count integer;
+  aggregate_functions text[];
+  reach_values text;
+  segment_values text;
+  node_values text;
+  loop_values text;
+  loop_assignments text;
+  frontier_values text;
+  frontier_assignments text;
+  result_values text;
+  frontier integer[];
+  resolved_nodes integer[];
+  loop_node integer;
+  visited integer[];
+BEGIN
+  value_count := COALESCE(array_length(value_expressions, 1), 0);
+  IF value_count = 0 THEN
+    RAISE EXCEPTION 'No value expression';
+  END IF;
+  branch_behaviors := COALESCE(branch_behaviors, array_fill('minimum'::text, ARRAY[value_count]));
+  IF COALESCE(array_length(branch_behaviors, 1), 0) <> value_count THEN
+    RAISE EXCEPTION 'Expected % branch behaviors, got %', value_count, COALESCE(array_length(branch_behaviors, 1), 0);
+  END IF;
+
+  SELECT array_agg(
+    CASE lower(b.branch_behavior)
+      WHEN 'minimum' THEN 'min'
+      WHEN 'maximum' THEN 'max'
+      WHEN 'average' THEN 'avg'
+    END ORDER BY b.i)
+  INTO aggregate_functions
+  FROM unnest(branch_behaviors) WITH ORDINALITY AS b(branch_behavior, i);
+  IF array_position(aggregate_functions, NULL) IS NOT NULL THEN
+    RAISE EXCEPTION 'Unknown branch behavior: %', branch_behaviors[array_position(aggregate_functions, NULL)];
+  END IF;
+
+  -- One column value_<i> per expression in the temporary tables
+  SELECT string_agg(format('(%s)::double precision AS value_%s', value_expressions[i], i), ', ' ORDER BY i),
+         string_agg(format('CASE WHEN s.segment_type = ''reach'' THEN COALESCE(r.value_%1$s, 0) * s.share ELSE 0 END AS value_%1$s', i), ', ' ORDER BY i),
+         string_agg(format('0::double precision AS value_%s', i), ', ' ORDER BY i),
+         string_agg(format('%1$s(s.value_%2$s + CASE WHEN d.resolved THEN d.value_%2$s ELSE 0 END) AS value_%2$s', aggregate_functions[i], i), ', ' ORDER BY i),
+         string_agg(format('value_%1$s = c.value_%1$s', i), ', ' ORDER BY i),
+         string_agg(format('%1$s(s.value_%2$s + d.value_%2$s) AS value_%2$s', aggregate_functions[i], i), ', ' ORDER BY i),
+         string_agg(format('value_%1$s = COALESCE(c.value_%1$s, 0)', i), ', ' ORDER BY i),
+         string_agg(format('u.value_%s', i), ', ' ORDER BY i)
+  INTO reach_values, segment_values, node_values, loop_values, loop_assignments,
+       frontier_values, frontier_assignments, result_values
+  FROM generate_series(1, value_count) AS i;
+
+  DROP TABLE IF EXISTS _sum_up_upstream_segment;
+  DROP TABLE IF EXISTS _sum_up_upstream_node;
+
+  -- Segment values, reaches are split proportionally to the segment lengths
+  EXECUTE format($$
+    CREATE TEMP TABLE _sum_up_upstream_segment ON COMMIT DROP AS
+    SELECT s.from_node,
+           s.to_node,
+           %s
+    FROM (
+      SELECT s.*,
+             COALESCE(
+               ST_Length(s.geom) / NULLIF(SUM(ST_Length(s.geom)) OVER (PARTITION BY s.ne_id), 0),
+               1
+             ) AS share
+      FROM qgep_network.segment s
+    ) s
+    LEFT JOIN (
+      SELECT obj_id, %s FROM qgep_od.vw_qgep_reach
+    ) r ON r.obj_id = s.ne_id AND s.segment_type = 'reach'
+  $$, segment_values, reach_values);
+
+  CREATE INDEX ON _sum_up_upstream_segment(from_node);
+  CREATE INDEX ON _sum_up_upstream_segment(to_node);
+
+  -- pending: the number of segments leading to a node which is not resolved yet
+  EXECUTE format($$
+    CREATE TEMP TABLE _sum_up_upstream_node ON COMMIT DROP AS
+    SELECT n.id,
+           (SELECT COUNT(*) FROM _sum_up_upstream_segment s WHERE s.from_node = n.id)::integer AS pending,
+           %s,
+           FALSE AS resolved,
+           FALSE AS in_loop
+    FROM qgep_network.node n
+  $$, node_values);
+
+  ALTER TABLE _sum_up_upstream_node ADD PRIMARY KEY (id);
+  ANALYZE _sum_up_upstream_segment;
+  ANALYZE _sum_up_upstream_node;
+
+  -- Start at the outlets
+  SELECT array_agg(n.id) INTO frontier FROM _sum_up_upstream_node n WHERE n.pending = 0;
+
+  LOOP
+    IF frontier IS NULL THEN
+      -- Every unresolved node left is in a loop or upstream of one. Following unresolved
+      -- segments from any of them ends up in a loop, cut it at the first repeated node.
+      SELECT n.id INTO loop_node FROM _sum_up_upstream_node n WHERE NOT n.resolved LIMIT 1;
+      EXIT WHEN loop_node IS NULL;
+
+      visited := ARRAY[]::integer[];
+      WHILE NOT loop_node = ANY(visited) LOOP
+        visited := visited || loop_node;
+        SELECT s.to_node INTO loop_node
+        FROM _sum_up_upstream_segment s
+        JOIN _sum_up_upstream_node d ON d.id = s.to_node
+        WHERE s.from_node = loop_node AND NOT d.resolved
+        LIMIT 1;
+      END LOOP;
+
+      EXECUTE format($$
+        UPDATE _sum_up_upstream_node n
+          SET %s, resolved = TRUE, in_loop = TRUE
+        FROM (
+          SELECT %s
+          FROM _sum_up_upstream_segment s
+          JOIN _sum_up_upstream_node d ON d.id = s.to_node
+          WHERE s.from_node = $1
+        ) c
+        WHERE n.id = $1
+      $$, loop_assignments, loop_values) USING loop_node;
+
+      resolved_nodes := ARRAY[loop_node];
+      loop_node := NULL;
+    ELSE
+      EXECUTE format($$
+        UPDATE _sum_up_upstream_node n
+          SET %s, resolved = TRUE
+        FROM (
+          SELECT f.id, %s
+          FROM unnest($1) AS f(id)
+          LEFT JOIN _sum_up_upstream_segment s ON s.from_node = f.id
+          LEFT JOIN _sum_up_upstream_node d ON d.id = s.to_node
+          GROUP BY f.id
+        ) c
+        WHERE n.id = c.id
+      $$, frontier_assignments, frontier_values) USING frontier;
+
+      resolved_nodes := frontier;
+    END IF;
+
+    UPDATE _sum_up_upstream_node n
+      SET pending = n.pending - c.segment_count
+    FROM (
+      SELECT s.from_node, COUNT(*)::integer AS segment_count
+      FROM unnest(resolved_nodes) AS r(id)
+      JOIN _sum_up_upstream_segment s ON s.to_node = r.id
+      GROUP BY s.from_node
+    ) c
+    WHERE n.id = c.from_node AND NOT n.resolved;
+
+    SELECT array_agg(DISTINCT s.from_node) INTO frontier
+    FROM unnest(resolved_nodes) AS r(id)
+    JOIN _sum_up_upstream_segment s ON s.to_node = r.id
+    JOIN _sum_up_upstream_node n ON n.id = s.from_node
+    WHERE n.pending = 0 AND NOT n.resolved;
+  END LOOP;
+
+  RETURN QUERY EXECUTE format($$
+    SELECT n.ne_id::text, ARRAY[%s], u.in_loop
+    FROM _sum_up_upstream_node u
+    JOIN qgep_network.node n ON n.id = u.id
+    WHERE n.node_type = 'wastewater_node'
+  $$, result_values);
+END;
+$BODY$
+LANGUAGE plpgsql VOLATILE;
+
+/**
+ * Sums up a single value, see qgep_network.sum_up_upstream(text[], text[])
+ */
+CREATE OR REPLACE FUNCTION qgep_network.sum_up_upstream(value_expression text, branch_behavior text DEFAULT 'minimum')
+RETURNS TABLE(obj_id text, value double precision, in_loop boolean) AS $BODY$
+  SELECT s.obj_id, s."values"[1], s.in_loop
+  FROM qgep_network.sum_up_upstream(ARRAY[value_expression], ARRAY[branch_behavior]) s;
+$BODY$
+LANGUAGE sql VOLATILE;
@@ -20,17 +20,47 @@
  * 
  * With the parameter `reach_obj_ids` it is possible to specify on which reaches this operation
  * should be performed by passing in an array of obj_ids
+ *
+ * The symbology row triggers of the reaches are skipped during the update with the transaction
+ * local setting `qgep.skip_symbology_triggers`, they would recalculate the structures at both
+ * ends for every single reach. Instead, the symbology, labels and depth of every affected
+ * wastewater structure and node are recalculated once at the end.
  */
 CREATE OR REPLACE FUNCTION qgep_od.reach_direction_change(reach_obj_ids text[])RETURNS void AS $BODY$
 
 BEGIN 
- 
+
+PERFORM set_config('qgep.skip_symbology_triggers', 'true', true);
+
 UPDATE qgep_od.reach 
   SET
     progression_geometry = (ST_ForceCurve(ST_Reverse(ST_CurveToLine(progression_geometry)))),
     fk_reach_point_from = fk_reach_point_to,
     fk_reach_point_to = fk_reach_point_from
   WHERE obj_id = ANY(reach_obj_ids);
+
+PERFORM set_config('qgep.skip_symbology_triggers', 'false', true);
+
+CREATE TEMP TABLE _reach_direction_change_ne ON COMMIT DROP AS
+  SELECT DISTINCT ne.obj_id, ne.fk_wastewater_structure
+  FROM qgep_od.reach re
+  JOIN qgep_od.reach_point rp ON rp.obj_id IN (re.fk_reach_point_from, re.fk_reach_point_to)
+  JOIN qgep_od.wastewater_networkelement ne ON ne.obj_id = rp.fk_wastewater_networkelement
+  WHERE re.obj_id = ANY(reach_obj_ids);
+
+PERFORM qgep_od.update_wastewater_structure_symbology(ws_obj_id),
+        qgep_od.update_wastewater_structure_label(ws_obj_id),
+        qgep_od.update_depth(ws_obj_id)
+  FROM (
+    SELECT DISTINCT fk_wastewater_structure AS ws_obj_id
+    FROM _reach_direction_change_ne
+    WHERE fk_wastewater_structure IS NOT NULL
+  ) ws;
+
+PERFORM qgep_od.update_wastewater_node_symbology(obj_id)
+  FROM _reach_direction_change_ne;
+
+DROP TABLE _reach_direction_change_ne;
 END;
 $BODY$
 LANGUAGE plpgsql VOLATILE
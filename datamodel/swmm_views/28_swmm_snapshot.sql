@@ -0,0 +1,237 @@
+--------
+-- Snapshot of the swmm views
+--------
+-- The swmm views are computed again by every export. qgep_swmm.refresh_snapshot()
+-- copies each qgep_swmm.vw_* view into a table qgep_swmm.snapshot_*, indexed on
+-- obj_id, state and hierarchy, which the exports can read instead.
+
+CREATE TABLE IF NOT EXISTS qgep_swmm.snapshot_info (
+  view_name text PRIMARY KEY,
+  snapshot_name text NOT NULL,
+  refreshed_at timestamp with time zone,
+  last_event_id bigint
+);
+
+COMMENT ON TABLE qgep_swmm.snapshot_info IS 'Snapshot tables of the swmm views, see qgep_swmm.refresh_snapshot()';
+COMMENT ON COLUMN qgep_swmm.snapshot_info.last_event_id IS 'Last event of qgep_sys.logged_actions included in the snapshot';
+
+/**
+ * Refreshes the snapshot tables of the swmm views.
+ *
+ * With `changed_only`, only the rows of the objects changed since the last refresh are
+ * computed again. The changes are read from the audit log (qgep_sys.logged_actions),
+ * the tables of qgep_od must be audited. The rows of the changed wastewater nodes and
+ * reaches are refreshed, together with the ones of their wastewater structures, of the
+ * reaches connected to them, of the end nodes of the reaches and of the nodes of the
+ * changed catchment areas. Changes of the lookup tables are followed to the nodes and
+ * reaches using them: pipe profiles to their reaches, hydraulic geometries and their
+ * relations to their nodes, overflows (pumps and weirs) and their characteristics to
+ * their nodes.
+ * Views without obj_id, views whose rows do not depend on the obj_id only and views
+ * whose columns changed are always refreshed fully. All the views are refreshed fully
+ * after a change of a table which is not followed, see full_refresh_tables, and when
+ * a table read by the views is not audited, see audited_tables.
+ */
+CREATE OR REPLACE FUNCTION qgep_swmm.refresh_snapshot(changed_only boolean DEFAULT FALSE)
+RETURNS TABLE(view_name text, refreshed_rows bigint, full_refresh boolean) AS $BODY$
+#variable_conflict use_column
+DECLARE
+  -- The curves and the orifices are not identified by the node or reach they belong to
+  always_full_views text[] := ARRAY['vw_curves', 'vw_orifices'];
+  -- Tables joined by the views which are not followed to the nodes and reaches, e.g.
+  -- the planning zones intersected with the subcatchments in vw_coverages
+  full_refresh_tables text[] := ARRAY['qgep_od.planning_zone'];
+  -- Tables read by the views, their changes are only known if they are audited
+  audited_tables text[] := ARRAY[
+    'qgep_od.wastewater_structure', 'qgep_od.channel', 'qgep_od.manhole', 'qgep_od.special_structure',
+    'qgep_od.discharge_point', 'qgep_od.infiltration_installation', 'qgep_od.cover',
+    'qgep_od.wastewater_networkelement', 'qgep_od.wastewater_node', 'qgep_od.reach', 'qgep_od.reach_point',
+    'qgep_od.pipe_profile', 'qgep_od.hydr_geometry', 'qgep_od.hydr_geom_relation',
+    'qgep_od.overflow', 'qgep_od.pump', 'qgep_od.prank_weir', 'qgep_od.leapingweir', 'qgep_od.overflow_char',
+    'qgep_od.throttle_shut_off_unit', 'qgep_od.catchment_area', 'qgep_od.surface_runoff_parameters',
+    'qgep_od.planning_zone'
+  ];
+  unaudited_tables text[];
+  current_event_id bigint;
+  previous_event_id bigint;
+  incremental boolean;
+  v record;
+  snapshot_table text;
+  view_columns text[];
+  snapshot_columns text[];
+  indexed_column text;
+  row_count bigint;
+BEGIN
+  SELECT COALESCE(max(la.event_id), 0) INTO current_event_id FROM qgep_sys.logged_actions la;
+
+  incremental := changed_only;
+  IF incremental THEN
+    SELECT array_agg(t.table_name ORDER BY t.table_name) INTO unaudited_tables
+    FROM unnest(audited_tables) t(table_name)
+    WHERE NOT EXISTS (
+      SELECT 1 FROM pg_trigger tg
+      WHERE tg.tgrelid = t.table_name::regclass
+      AND tg.tgfoid = 'qgep_sys.if_modified_func'::regproc
+      AND tg.tgenabled <> 'D'
+      AND tg.tgtype & 1 = 1  -- FOR EACH ROW
+    );
+    IF unaudited_tables IS NOT NULL THEN
+      RAISE WARNING 'The tables % are not audited, the snapshot is refreshed fully', array_to_string(unaudited_tables, ', ');
+      incremental := FALSE;
+    END IF;
+  END IF;
+
+  IF incremental THEN
+    SELECT min(si.last_event_id) INTO previous_event_id FROM qgep_swmm.snapshot_info si;
+    -- Never refreshed, tables truncated, value lists or tables not followed changed since
+    incremental := previous_event_id IS NOT NULL AND NOT EXISTS (
+      SELECT 1 FROM qgep_sys.logged_actions la
+      WHERE la.event_id > previous_event_id
+      AND (
+        (la.schema_name = 'qgep_od' AND la.action = 'T')
+        OR la.schema_name = 'qgep_vl'
+        OR la.schema_name || '.' || la.table_name = ANY(full_refresh_tables)
+      )
+    );
+  END IF;
+
+  IF incremental THEN
+    -- Objects referenced by the changed rows, before and after the change
+    DROP TABLE IF EXISTS _swmm_snapshot_changed;
+    CREATE TEMP TABLE _swmm_snapshot_changed ON COMMIT DROP AS
+    SELECT DISTINCT e.value AS obj_id
+    FROM qgep_sys.logged_actions la,
+    LATERAL each(COALESCE(la.row_data, ''::hstore) || COALESCE(la.changed_fields, ''::hstore)) e
+    WHERE la.event_id > previous_event_id
+    AND la.schema_name = 'qgep_od'
+    AND (e.key = 'obj_id' OR e.key LIKE 'fk\_%')
+    AND e.value IS NOT NULL;
+
+    -- Wastewater nodes and reaches whose rows may have changed
+    DROP TABLE IF EXISTS _swmm_snapshot_affected;
+    CREATE TEMP TABLE _swmm_snapshot_affected ON COMMIT DROP AS
+    WITH element AS (
+      SELECT c.obj_id FROM _swmm_snapshot_changed c
+      UNION
+      SELECT ne.obj_id
+      FROM qgep_od.wastewater_networkelement ne
+      JOIN _swmm_snapshot_changed c ON c.obj_id IN (ne.obj_id, ne.fk_wastewater_structure)
+      UNION
+      SELECT sibling.obj_id
+      FROM qgep_od.wastewater_networkelement ne
+      JOIN _swmm_snapshot_changed c ON c.obj_id = ne.obj_id
+      JOIN qgep_od.wastewater_networkelement sibling ON sibling.fk_wastewater_structure = ne.fk_wastewater_structure
+      UNION
+      SELECT re.obj_id
+      FROM qgep_od.reach re
+      JOIN _swmm_snapshot_changed c ON c.obj_id IN (re.fk_reach_point_from, re.fk_reach_point_to)
+      UNION
+      SELECT unnest(ARRAY[
+        ca.fk_wastewater_networkelement_rw_current, ca.fk_wastewater_networkelement_rw_planned,
+        ca.fk_wastewater_networkelement_ww_current, ca.fk_wastewater_networkelement_ww_planned
+      ])
+      FROM qgep_od.catchment_area ca
+      JOIN _swmm_snapshot_changed c ON c.obj_id = ca.obj_id
+      UNION
+      -- Reaches of the changed pipe profiles
+      SELECT re.obj_id
+      FROM qgep_od.reach re
+      JOIN _swmm_snapshot_changed c ON c.obj_id = re.fk_pipe_profile
+      UNION
+      -- Nodes of the changed hydraulic geometries, the relations reference them with fk_hydr_geometry
+      SELECT wn.obj_id
+      FROM qgep_od.wastewater_node wn
+      JOIN _swmm_snapshot_changed c ON c.obj_id = wn.fk_hydr_geometry
+      UNION
+      -- Nodes of the changed overflows (pumps, prank weirs, leaping weirs share the obj_id of
+      -- the overflow) and overflow characteristics, the hq and q relations reference them
+      SELECT ov.fk_wastewater_node
+      FROM qgep_od.overflow ov
+      JOIN _swmm_snapshot_changed c ON c.obj_id IN (ov.obj_id, ov.fk_overflow_characteristic)
+    )
+    SELECT e.obj_id FROM element e
+    WHERE e.obj_id IS NOT NULL
+    UNION
+    -- Reaches connected to the changed nodes
+    SELECT re.obj_id
+    FROM element e
+    JOIN qgep_od.reach_point rp ON rp.fk_wastewater_networkelement = e.obj_id
+    JOIN qgep_od.reach re ON rp.obj_id IN (re.fk_reach_point_from, re.fk_reach_point_to)
+    UNION
+    -- End nodes of the changed reaches, e.g. the junctions without structure take the
+    -- state and hierarchy of their channel
+    SELECT rp.fk_wastewater_networkelement
+    FROM element e
+    JOIN qgep_od.reach re ON re.obj_id = e.obj_id
+    JOIN qgep_od.reach_point rp ON rp.obj_id IN (re.fk_reach_point_from, re.fk_reach_point_to)
+    WHERE rp.fk_wastewater_networkelement IS NOT NULL;
+
+    ALTER TABLE _swmm_snapshot_affected ADD PRIMARY KEY (obj_id);
+    ANALYZE _swmm_snapshot_affected;
+  END IF;
+
+  FOR v IN
+    SELECT c.relname AS view_name
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'qgep_swmm' AND c.relkind = 'v' AND c.relname LIKE 'vw\_%'
+    ORDER BY c.relname
+  LOOP
+    snapshot_table := 'snapshot_' || substr(v.view_name, 4);
+
+    SELECT array_agg(a.attname::text ORDER BY a.attnum) INTO view_columns
+    FROM pg_attribute a
+    WHERE a.attrelid = format('qgep_swmm.%I', v.view_name)::regclass
+    AND a.attnum > 0 AND NOT a.attisdropped;
+
+    SELECT array_agg(a.attname::text ORDER BY a.attnum) INTO snapshot_columns
+    FROM pg_attribute a
+    WHERE a.attrelid = to_regclass(format('qgep_swmm.%I', snapshot_table))
+    AND a.attnum > 0 AND NOT a.attisdropped;
+
+    IF snapshot_columns IS DISTINCT FROM view_columns THEN
+      -- New view or columns changed, the table is created again
+      EXECUTE format('DROP TABLE IF EXISTS qgep_swmm.%I', snapshot_table);
+      EXECUTE format('CREATE TABLE qgep_swmm.%I AS SELECT * FROM qgep_swmm.%I', snapshot_table, v.view_name);
+      GET DIAGNOSTICS row_count = ROW_COUNT;
+      FOREACH indexed_column IN ARRAY ARRAY['obj_id', 'state', 'hierarchy'] LOOP
+        IF indexed_column = ANY(view_columns) THEN
+          EXECUTE format('CREATE INDEX ON qgep_swmm.%I (%I)', snapshot_table, indexed_column);
+        END IF;
+      END LOOP;
+      full_refresh := TRUE;
+    ELSIF incremental AND 'obj_id' = ANY(view_columns) AND NOT v.view_name = ANY(always_full_views) THEN
+      EXECUTE format(
+        'DELETE FROM qgep_swmm.%I s USING _swmm_snapshot_affected a WHERE s.obj_id = a.obj_id',
+        snapshot_table
+      );
+      EXECUTE format(
+        'INSERT INTO qgep_swmm.%I SELECT * FROM qgep_swmm.%I WHERE obj_id IN (SELECT obj_id FROM _swmm_snapshot_affected)',
+        snapshot_table, v.view_name
+      );
+      GET DIAGNOSTICS row_count = ROW_COUNT;
+      full_refresh := FALSE;
+    ELSE
+      EXECUTE format('TRUNCATE qgep_swmm.%I', snapshot_table);
+      EXECUTE format('INSERT INTO qgep_swmm.%I SELECT * FROM qgep_swmm.%I', snapshot_table, v.view_name);
+      GET DIAGNOSTICS row_count = ROW_COUNT;
+      full_refresh := TRUE;
+    END IF;
+    EXECUTE format('ANALYZE qgep_swmm.%I', snapshot_table);
+
+    INSERT INTO qgep_swmm.snapshot_info (view_name, snapshot_name, refreshed_at, last_event_id)
+    VALUES (v.view_name, snapshot_table, now(), current_event_id)
+    ON CONFLICT ON CONSTRAINT snapshot_info_pkey DO UPDATE
+    SET snapshot_name = EXCLUDED.snapshot_name,
+        refreshed_at = EXCLUDED.refreshed_at,
+        last_event_id = EXCLUDED.last_event_id;
+
+    view_name := v.view_name;
+    refreshed_rows := row_count;
+    RETURN NEXT;
+  END LOOP;
+END;
+$BODY$
+LANGUAGE plpgsql VOLATILE SECURITY DEFINER
+-- Runs with the rights of its owner, the temporary schema is searched last
+SET search_path = pg_catalog, public, pg_temp;
@@ -400,5 +400,203 @@ class TestNetwork(unittest.TestCase, DbTestBase):
         self.assertEqual( len(down_depths), 1)
 
 
+    def sum_up_upstream(self, value_expression, branch_behavior):
+        """returns a dict with the upstream value by wastewater node obj_id"""
+        cur = self.cursor()
+        cur.execute(
+            "SELECT obj_id, value FROM qgep_network.sum_up_upstream(%s, %s)",
+            (value_expression, branch_behavior),
+        )
+        return {row['obj_id']: row['value'] for row in cur.fetchall()}
+
+    def test_sum_up_upstream(self):
+        """
+                      MH2
+                       ⇓
+                       *
+                       | third
+                       v
+                       *
+                       ⇓
+         MH1 ⇐ *-------o------->*
+               ⇓     first
+               *
+               |
+               | second
+               v
+               *
+
+        first and second are connected FROM MH1, third is connected FROM MH2 and TO first (blind connection)
+        """
+
+        manhole_1_id, manhole_1_wn_id = self.make_manhole('manhole_1', 0, 0)
+        manhole_2_id, manhole_2_wn_id = self.make_manhole('manhole_2', 5, 10)
+        reach_1_id, rp_1a_id, rp_1b_id = self.make_reach('first', 0, 0, 10, 0)
+        reach_2_id, rp_2a_id, rp_2b_id = self.make_reach('second', 0, 0, 0, -20)
+        reach_3_id, rp_3a_id, rp_3b_id = self.make_reach('third', 5, 10, 5, 0)
+
+        self.connect_reach(reach_1_id, from_id=manhole_1_wn_id)
+        self.connect_reach(reach_2_id, from_id=manhole_1_wn_id)
+        self.connect_reach(reach_3_id, from_id=manhole_2_wn_id, to_id=reach_1_id)
+
+        self.refresh_graph()
+
+        expression = 'ST_Length(progression_geometry)'
+
+        values = self.sum_up_upstream(expression, 'minimum')
+        self.assertAlmostEqual(values[manhole_1_wn_id], 10)
+        # the downstream half of first is added for the blind connection
+        self.assertAlmostEqual(values[manhole_2_wn_id], 15)
+
+        values = self.sum_up_upstream(expression, 'maximum')
+        self.assertAlmostEqual(values[manhole_1_wn_id], 20)
+        self.assertAlmostEqual(values[manhole_2_wn_id], 15)
+
+        values = self.sum_up_upstream(expression, 'average')
+        self.assertAlmostEqual(values[manhole_1_wn_id], 15)
+
+        # several values in a single pass
+        cur = self.cursor()
+        cur.execute(
+            'SELECT obj_id, "values" FROM qgep_network.sum_up_upstream(%s::text[], %s::text[])',
+            ([expression, expression, '1'], ['minimum', 'maximum', 'average']),
+        )
+        values = {row['obj_id']: row['values'] for row in cur.fetchall()}
+        self.assertEqual(len(values[manhole_1_wn_id]), 3)
+        self.assertAlmostEqual(values[manhole_1_wn_id][0], 10)
+        self.assertAlmostEqual(values[manhole_1_wn_id][1], 20)
+        self.assertAlmostEqual(values[manhole_2_wn_id][0], 15)
+        self.assertAlmostEqual(values[manhole_2_wn_id][1], 15)
+
+    def reach_snap(self, reach_ids, tolerance, dry_run):
+        """returns a dict with the (from_distance, to_distance, skipped) by snapped reach obj_id"""
+        cur = self.cursor()
+        cur.execute(
+            "SELECT obj_id, from_distance, to_distance, skipped FROM qgep_od.reach_snap(%s, %s, %s)",
+            (reach_ids, tolerance, dry_run),
+        )
+        return {row['obj_id']: (row['from_distance'], row['to_distance'], row['skipped']) for row in cur.fetchall()}
+
+    def reach_end_points(self, reach_id):
+        cur = self.cursor()
+        cur.execute(
+            """SELECT ST_X(ST_StartPoint(progression_geometry)), ST_Y(ST_StartPoint(progression_geometry)),
+                      ST_X(ST_EndPoint(progression_geometry)), ST_Y(ST_EndPoint(progression_geometry))
+               FROM qgep_od.reach WHERE obj_id = %s""",
+            (reach_id, ),
+        )
+        return tuple(cur.fetchone())
+
+    def test_reach_snap(self):
+        """
+                      *
+                      |
+                      | second
+                      v
+                      *
+                      ⇓
+         MH ⇐ *  ---------------->*
+                     first
+
+        first starts 1 away from the manhole, second ends 1 above first (blind connection)
+        """
+
+        manhole_id, manhole_wn_id = self.make_manhole('manhole', 0, 0)
+        reach_1_id, rp_1a_id, rp_1b_id = self.make_reach('first', 1, 0, 10, 0)
+        reach_2_id, rp_2a_id, rp_2b_id = self.make_reach('second', 5, 10, 5, 1)
+
+        self.connect_reach(reach_1_id, from_id=manhole_wn_id)
+        self.connect_reach(reach_2_id, to_id=reach_1_id)
+
+        reach_ids = [reach_1_id, reach_2_id]
+
+        # out of tolerance
+        self.assertEqual(self.reach_snap(reach_ids, 0.5, False), {})
+
+        # dry run reports without modifying
+        changes = self.reach_snap(reach_ids, 10, True)
+        self.assertEqual(len(changes), 2)
+        self.assertAlmostEqual(changes[reach_1_id][0], 1)
+        self.assertIsNone(changes[reach_1_id][1])
+        self.assertIsNone(changes[reach_2_id][0])
+        self.assertAlmostEqual(changes[reach_2_id][1], 1)
+        self.assertEqual(self.reach_end_points(reach_1_id), (1, 0, 10, 0))
+
+        changes = self.reach_snap(reach_ids, 10, False)
+        self.assertEqual(len(changes), 2)
+        self.assertEqual(self.reach_end_points(reach_1_id), (0, 0, 10, 0))
+        self.assertEqual(self.reach_end_points(reach_2_id), (5, 10, 5, 0))
+        self.assertEqual(self.execute("ST_X(situation_geometry) FROM qgep_od.reach_point WHERE obj_id = %s", [rp_1a_id]), 0)
+        self.assertEqual(self.execute("ST_Y(situation_geometry) FROM qgep_od.reach_point WHERE obj_id = %s", [rp_2b_id]), 0)
+
+        self.assertFalse(changes[reach_1_id][2])
+
+        # nothing left to snap
+        self.assertEqual(self.reach_snap(reach_ids, 0, False), {})
+
+    def test_reach_snap_arc(self):
+        """
+               .-----.
+             /         \\
+         MH ⇐ *         *
+                curved
+
+        curved starts 1 away from the manhole and has a circular arc, it is reported but not modified
+        """
+
+        manhole_id, manhole_wn_id = self.make_manhole('manhole', 0, 0)
+        reach_id, rp_a_id, rp_b_id = self.make_reach('curved', 1, 0, 11, 0)
+        self.connect_reach(reach_id, from_id=manhole_wn_id)
+        cur = self.cursor()
+        cur.execute(
+            """UPDATE qgep_od.reach
+               SET progression_geometry = ST_GeomFromText('COMPOUNDCURVE Z(CIRCULARSTRING Z(1 0 100, 6 5 100, 11 0 100))', 2056)
+               WHERE obj_id = %s""",
+            (reach_id, ),
+        )
+        geometry = self.execute("ST_AsText(progression_geometry) FROM qgep_od.reach WHERE obj_id = %s", [reach_id])
+
+        changes = self.reach_snap([reach_id], 10, False)
+        self.assertEqual(len(changes), 1)
+        self.assertAlmostEqual(changes[reach_id][0], 1)
+        self.assertTrue(changes[reach_id][2])
+
+        # the arc is kept
+        self.assertEqual(self.execute("ST_AsText(progression_geometry) FROM qgep_od.reach WHERE obj_id = %s", [reach_id]), geometry)
+        self.assertTrue(self.execute("ST_HasArc(progression_geometry) FROM qgep_od.reach WHERE obj_id = %s", [reach_id]))
+        self.assertEqual(self.execute("ST_X(situation_geometry) FROM qgep_od.reach_point WHERE obj_id = %s", [rp_a_id]), 1)
+
+    def test_reach_direction_change(self):
+        """
+         MH ⇐ *----------------->*
+                     first
+
+        first is connected FROM the manhole and then turned around
+        """
+
+        manhole_id, manhole_wn_id = self.make_manhole('manhole', 0, 0)
+        reach_1_id, rp_1a_id, rp_1b_id = self.make_reach('first', 0, 0, 10, 0)
+        self.connect_reach(reach_1_id, from_id=manhole_wn_id)
+
+        self.assertIn('\nO', self.select('wastewater_structure', manhole_id)['_output_label'])
+
+        cur = self.cursor()
+        cur.execute("SELECT qgep_od.reach_direction_change(%s)", ([reach_1_id], ))
+
+        reach = self.select('reach', reach_1_id)
+        self.assertEqual(reach['fk_reach_point_from'], rp_1b_id)
+        self.assertEqual(reach['fk_reach_point_to'], rp_1a_id)
+        self.assertEqual(self.reach_end_points(reach_1_id), (10, 0, 0, 0))
+
+        # the label is recalculated once at the end
+        self.assertNotIn('\nO', self.select('wastewater_structure', manhole_id)['_output_label'] or '')
+
+        # the symbology triggers are left in place and run again for the next updates
+        self.assertEqual(
+            self.execute("COUNT(*) FROM pg_trigger WHERE tgname = 'ws_symbology_update_by_reach'"), 1
+        )
+        self.assertEqual(self.execute("current_setting('qgep.skip_symbology_triggers', true)"), 'false')
+
+
 if __name__ == '__main__':
     unittest.main()
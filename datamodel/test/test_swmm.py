@@ -83,5 +83,99 @@ class TestSwmm(unittest.TestCase, DbTestBase):
     def test_count_vw_xsections(self):
         self.assert_count("vw_xsections", "qgep_swmm", 5095)
 
+    def test_refresh_snapshot(self):
+        cur = self.conn.cursor()
+        cur.execute("SELECT view_name, refreshed_rows FROM qgep_swmm.refresh_snapshot()")
+        refreshed_rows = dict(cur.fetchall())
+        assert refreshed_rows["vw_junctions"] == 5864, refreshed_rows["vw_junctions"]
+        self.assert_count("snapshot_junctions", "qgep_swmm", 5864)
+        self.assert_count("snapshot_conduits", "qgep_swmm", 5095)
+
+    # The tables read by the swmm views, see audited_tables in qgep_swmm.refresh_snapshot
+    SNAPSHOT_AUDITED_TABLES = [
+        'wastewater_structure', 'channel', 'manhole', 'special_structure', 'discharge_point',
+        'infiltration_installation', 'cover', 'wastewater_networkelement', 'wastewater_node', 'reach',
+        'reach_point', 'pipe_profile', 'hydr_geometry', 'hydr_geom_relation', 'overflow', 'pump',
+        'prank_weir', 'leapingweir', 'overflow_char', 'throttle_shut_off_unit', 'catchment_area',
+        'surface_runoff_parameters', 'planning_zone',
+    ]
+
+    def audit_snapshot_tables(self):
+        cur = self.conn.cursor()
+        for table in self.SNAPSHOT_AUDITED_TABLES:
+            cur.execute("SELECT qgep_sys.audit_table(%s::regclass)", ('qgep_od.' + table,))
+
+    def assert_snapshot_equals_view(self, name):
+        cur = self.conn.cursor()
+        for first, second in (('vw_', 'snapshot_'), ('snapshot_', 'vw_')):
+            cur.execute("""SELECT COUNT(*) FROM (
+                             SELECT * FROM qgep_swmm.{first}{name}
+                             EXCEPT SELECT * FROM qgep_swmm.{second}{name}
+                           ) diff""".format(first=first, second=second, name=name))
+            assert cur.fetchone()[0] == 0, "{}{} has rows which are not in {}{}".format(first, name, second, name)
+
+    def test_refresh_snapshot_changed_only(self):
+        self.audit_snapshot_tables()
+        cur = self.conn.cursor()
+        cur.execute("SELECT * FROM qgep_swmm.refresh_snapshot()")
+        # Nothing changed since the previous refresh
+        cur.execute("SELECT view_name, refreshed_rows, full_refresh FROM qgep_swmm.refresh_snapshot(TRUE)")
+        for view_name, refreshed_rows, full_refresh in cur.fetchall():
+            if not full_refresh:
+                assert refreshed_rows == 0, "{}: {} rows refreshed".format(view_name, refreshed_rows)
+        self.assert_count("snapshot_junctions", "qgep_swmm", 5864)
+
+    def test_refresh_snapshot_changed_pipe_profile(self):
+        self.audit_snapshot_tables()
+        cur = self.conn.cursor()
+        cur.execute("SELECT * FROM qgep_swmm.refresh_snapshot()")
+        cur.execute("""SELECT re.fk_pipe_profile FROM qgep_od.reach re
+                       JOIN qgep_swmm.vw_xsections xs ON xs.obj_id = re.obj_id
+                       LIMIT 1""")
+        pipe_profile_id = cur.fetchone()[0]
+        cur.execute("UPDATE qgep_od.pipe_profile SET profile_type = 3353, height_width_ratio = 2 WHERE obj_id = %s", (pipe_profile_id,))
+
+        # The reaches of the pipe profile are refreshed
+        cur.execute("SELECT view_name, full_refresh FROM qgep_swmm.refresh_snapshot(TRUE)")
+        assert not dict(cur.fetchall())["vw_xsections"]
+        cur.execute("""SELECT xs.shape FROM qgep_swmm.snapshot_xsections xs
+                       JOIN qgep_od.reach re ON re.obj_id = xs.obj_id
+                       WHERE re.fk_pipe_profile = %s""", (pipe_profile_id,))
+        shapes = [row[0] for row in cur.fetchall()]
+        assert shapes and all(shape == "RECT_CLOSED" for shape in shapes), shapes
+        self.assert_snapshot_equals_view("xsections")
+
+    def test_refresh_snapshot_changed_channel(self):
+        self.audit_snapshot_tables()
+        cur = self.conn.cursor()
+        cur.execute("SELECT * FROM qgep_swmm.refresh_snapshot()")
+        # A channel ending at a junction without structure, which takes its hierarchy
+        cur.execute("""SELECT ne.fk_wastewater_structure FROM qgep_swmm.vw_junctions j
+                       JOIN qgep_od.reach_point rp ON rp.fk_wastewater_networkelement = j.obj_id
+                       JOIN qgep_od.reach re ON rp.obj_id IN (re.fk_reach_point_from, re.fk_reach_point_to)
+                       JOIN qgep_od.wastewater_networkelement ne ON ne.obj_id = re.obj_id
+                       JOIN qgep_od.channel ch ON ch.obj_id = ne.fk_wastewater_structure
+                       WHERE j.tag = 'junction without structure'
+                       LIMIT 1""")
+        channel_id = cur.fetchone()[0]
+        cur.execute("""UPDATE qgep_od.channel
+                       SET function_hierarchic = CASE WHEN function_hierarchic = 5062 THEN 5063 ELSE 5062 END
+                       WHERE obj_id = %s""", (channel_id,))
+
+        cur.execute("SELECT view_name, full_refresh FROM qgep_swmm.refresh_snapshot(TRUE)")
+        assert not dict(cur.fetchall())["vw_junctions"]
+        self.assert_snapshot_equals_view("junctions")
+        self.assert_snapshot_equals_view("conduits")
+
+    def test_refresh_snapshot_not_audited(self):
+        self.audit_snapshot_tables()
+        cur = self.conn.cursor()
+        cur.execute("DROP TRIGGER audit_trigger_row ON qgep_od.reach")
+        cur.execute("SELECT * FROM qgep_swmm.refresh_snapshot()")
+        # The changes of the reaches are unknown
+        cur.execute("SELECT view_name, full_refresh FROM qgep_swmm.refresh_snapshot(TRUE)")
+        for view_name, full_refresh in cur.fetchall():
+            assert full_refresh, view_name
+
 if __name__ == '__main__':
     unittest.main()
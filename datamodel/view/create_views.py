@@ -114,6 +114,7 @@ def create_views(srid: int,
     run_sql('swmm_views/25_vw_swmm_tags.sql', pg_service, variables)
     run_sql('swmm_views/26_vw_swmm_symbols.sql', pg_service, variables)
     run_sql('swmm_views/27_vw_swmm_results.sql', pg_service, variables)
+    run_sql('swmm_views/28_swmm_snapshot.sql', pg_service, variables)
 
     SimpleJoins(safe_load(open('view/export/vw_export_reach.yaml')), pg_service).create()
     SimpleJoins(safe_load(open('view/export/vw_export_wastewater_structure.yaml')), pg_service).create()
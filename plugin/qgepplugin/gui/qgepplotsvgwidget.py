@@ -23,6 +23,7 @@
 #
 # ---------------------------------------------------------------------
 
+import json
 import logging
 
 from qgis.PyQt.QtCore import QSettings, Qt, QUrl, pyqtSignal, pyqtSlot
@@ -68,6 +69,7 @@ class QgepPlotSVGWidget(QWidget):
     # Signals emitted for javascript
     profileChanged = pyqtSignal([str], name="profileChanged")
     verticalExaggerationChanged = pyqtSignal([int], name="verticalExaggerationChanged")
+    surfaceSamplesAdded = pyqtSignal([str], name="surfaceSamplesAdded")
 
     def __init__(self, parent, network_analyzer: QgepGraphManager, url: str = None):
         QWidget.__init__(self, parent)
@@ -76,6 +78,7 @@ class QgepPlotSVGWidget(QWidget):
         self.webView.setPage(QgepWebPage(self.webView))
 
         self.networkAnalyzer = network_analyzer
+        self.surfaceSamples = []
 
         settings = QSettings()
 
@@ -105,9 +108,19 @@ class QgepPlotSVGWidget(QWidget):
 
     def setProfile(self, profile):
         self.profile = profile
+        self.surfaceSamples = []
         # Forward to javascript
         self.profileChanged.emit(profile.asJson())
 
+    def addSurfaceSamples(self, samples):
+        """
+        Appends terrain samples to the surface of the current profile
+        :param samples: A list of {"offset": ..., "level": ...} dicts
+        """
+        self.surfaceSamples.extend(samples)
+        # Only forward the new samples, javascript appends them
+        self.surfaceSamplesAdded.emit(json.dumps(samples))
+
     def initJs(self):
         self.frame.addToJavaScriptWindowObject("profileProxy", self)
         self.frame.addToJavaScriptWindowObject("i18n", self.jsTranslator)
@@ -173,4 +186,6 @@ class QgepPlotSVGWidget(QWidget):
     def updateProfile(self):
         if self.profile:
             self.profileChanged.emit(self.profile.asJson())
+            if self.surfaceSamples:
+                self.surfaceSamplesAdded.emit(json.dumps(self.surfaceSamples))
             self.verticalExaggerationChanged.emit(self.verticalExaggeration)
@@ -24,8 +24,14 @@
 # ---------------------------------------------------------------------
 
 from builtins import str
+from concurrent.futures import ThreadPoolExecutor
 
-from qgis.core import QgsFeatureRequest, QgsProject
+from qgis.core import (
+    QgsExpression,
+    QgsFeatureRequest,
+    QgsProject,
+    QgsVectorLayerFeatureSource,
+)
 from qgis.PyQt.QtCore import Qt, pyqtSignal, pyqtSlot
 from qgis.PyQt.QtWidgets import (
     QAction,
@@ -38,9 +44,61 @@ from qgis.PyQt.QtWidgets import (
 
 from ..utils import get_ui_class
 from ..utils.qgeplayermanager import QgepLayerManager
+from ..utils.qt_utils import OverrideCursor
 
 DOCK_WIDGET_UI = get_ui_class("qgepdockwidget.ui")
 
+# Maximum number of values in a single IN (...) filter expression
+FILTER_BATCH_SIZE = 1000
+
+
+def in_filter_expressions(fields, values):
+    """
+    Creates properly quoted filter expressions which match features where any of
+    the fields has any of the values. The values are split into batches, so a
+    single expression never grows too large for the database.
+    :param fields: A list of field names
+    :param values: A collection of values
+    :return:       A list of expression strings
+    """
+    values = [QgsExpression.quotedValue(value) for value in values]
+    expressions = list()
+    for i in range(0, len(values), FILTER_BATCH_SIZE):
+        value_list = ",".join(values[i : i + FILTER_BATCH_SIZE])
+        expressions.append(
+            " OR ".join(
+                "{} IN ({})".format(QgsExpression.quotedColumnRef(field), value_list)
+                for field in fields
+            )
+        )
+    return expressions
+
+
+def fetch_feature_ids(source, expressions, attribute_index=None):
+    """
+    Collects the ids of all features of a source which match any of the expressions.
+    The expressions are compiled and evaluated on the database, no geometries are
+    fetched. Can be run from a worker thread.
+    :param source:          A QgsVectorLayerFeatureSource
+    :param expressions:     A list of filter expression strings
+    :param attribute_index: Optionally, an attribute whose values are collected too
+    :return:                A (feature ids, attribute values) tuple
+    """
+    ids = list()
+    values = list()
+    for expression in expressions:
+        request = QgsFeatureRequest().setFilterExpression(expression)
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        if attribute_index is None:
+            request.setNoAttributes()
+        else:
+            request.setSubsetOfAttributes([attribute_index])
+        for feature in source.getFeatures(request):
+            ids.append(feature.id())
+            if attribute_index is not None:
+                values.append(feature.attribute(attribute_index))
+    return ids, values
+
 
 class QgepProfileDockWidget(QDockWidget, DOCK_WIDGET_UI):
     # Signal emitted when the widget is closed
@@ -159,7 +217,6 @@ class QgepProfileDockWidget(QDockWidget, DOCK_WIDGET_UI):
     def onSelectCurrentPathAction(self):
         reaches = list()
         wastewater_nodes = list()
-        wastewater_structures = list()
 
         for item in self.edges:
             item_information = item[2]
@@ -177,77 +234,76 @@ class QgepProfileDockWidget(QDockWidget, DOCK_WIDGET_UI):
         qgep_reach_layer = QgepLayerManager.layer("vw_qgep_reach")
         catchment_areas_layer = QgepLayerManager.layer("od_catchment_area")
 
-        wastewater_node_list = ",".join(("'" + id + "'" for id in wastewater_nodes))
-        reach_list = ",".join(("'" + id + "'" for id in reaches))
+        # Feature sources are created here on the main thread, they can then
+        # safely be iterated in the worker threads
+        jobs = dict()
 
         if catchment_areas_layer:
-            request = QgsFeatureRequest()
-            filters = list()
+            fields = list()
             if QgsProject.instance().readBoolEntry(
                 "Qgep", "FollowWastewaterCurrent", True
             )[0]:
-                filters.append(
-                    "fk_wastewater_networkelement_ww_current IN ({})".format(
-                        wastewater_node_list
-                    )
-                )
+                fields.append("fk_wastewater_networkelement_ww_current")
             if QgsProject.instance().readBoolEntry(
                 "Qgep", "FollowWastewaterPlanned", True
             )[0]:
-                filters.append(
-                    "fk_wastewater_networkelement_ww_planned IN ({})".format(
-                        wastewater_node_list
-                    )
-                )
+                fields.append("fk_wastewater_networkelement_ww_planned")
             if QgsProject.instance().readBoolEntry(
                 "Qgep", "FollowRainwaterCurrent", True
             )[0]:
-                filters.append(
-                    "fk_wastewater_networkelement_rw_current IN ({})".format(
-                        wastewater_node_list
-                    )
-                )
+                fields.append("fk_wastewater_networkelement_rw_current")
             if QgsProject.instance().readBoolEntry(
                 "Qgep", "FollowRainwaterPlanned", True
             )[0]:
-                filters.append(
-                    "fk_wastewater_networkelement_rw_planned IN ({})".format(
-                        wastewater_node_list
-                    )
-                )
+                fields.append("fk_wastewater_networkelement_rw_planned")
 
-            if filters:
-                request.setFilterExpression(" OR ".join(filters))
-                features = catchment_areas_layer.getFeatures(request)
-                catchment_areas_layer.select([f.id() for f in features])
+            if fields:
+                jobs[catchment_areas_layer] = (
+                    QgsVectorLayerFeatureSource(catchment_areas_layer),
+                    in_filter_expressions(fields, wastewater_nodes),
+                    None,
+                )
 
         if qgep_reach_layer:
-            request = QgsFeatureRequest()
-            request.setFilterExpression("obj_id IN ({})".format(reach_list))
-            features = qgep_reach_layer.getFeatures(request)
-            qgep_reach_layer.select([f.id() for f in features])
+            jobs[qgep_reach_layer] = (
+                QgsVectorLayerFeatureSource(qgep_reach_layer),
+                in_filter_expressions(["obj_id"], reaches),
+                None,
+            )
 
         if wastewater_nodes_layer:
-            request = QgsFeatureRequest()
-            request.setFilterExpression("obj_id IN ({})".format(wastewater_node_list))
-            features = wastewater_nodes_layer.getFeatures(request)
-            ids = list()
-            for feature in features:
-                ids.append(feature.id())
-                wastewater_structures.append(feature["fk_wastewater_structure"])
-            wastewater_nodes_layer.select(ids)
-
-        wastewater_structure_list = ",".join(
-            ("'" + id + "'" for id in wastewater_structures if type(id) is str)
-        )
-
-        if qgep_wastewater_structures_layer:
-            request = QgsFeatureRequest()
-            request.setFilterExpression(
-                "obj_id IN ({})".format(wastewater_structure_list)
+            jobs[wastewater_nodes_layer] = (
+                QgsVectorLayerFeatureSource(wastewater_nodes_layer),
+                in_filter_expressions(["obj_id"], wastewater_nodes),
+                wastewater_nodes_layer.fields().indexOf("fk_wastewater_structure"),
             )
-            features = qgep_wastewater_structures_layer.getFeatures(request)
-            qgep_wastewater_structures_layer.select([f.id() for f in features])
+
+        with OverrideCursor(Qt.WaitCursor):
+            with ThreadPoolExecutor(max_workers=len(jobs) or 1) as executor:
+                futures = {
+                    layer: executor.submit(fetch_feature_ids, *job)
+                    for layer, job in jobs.items()
+                }
+                results = {layer: future.result() for layer, future in futures.items()}
+
+            # The structures can only be looked up once the nodes are known
+            if qgep_wastewater_structures_layer and wastewater_nodes_layer:
+                wastewater_structures = {
+                    value
+                    for value in results[wastewater_nodes_layer][1]
+                    if type(value) is str
+                }
+                results[qgep_wastewater_structures_layer] = fetch_feature_ids(
+                    QgsVectorLayerFeatureSource(qgep_wastewater_structures_layer),
+                    in_filter_expressions(["obj_id"], wastewater_structures),
+                )
+
+            # Only repaint the canvas once for all layers
+            self.canvas.freeze(True)
+            for layer, (ids, _) in results.items():
+                layer.select(ids)
+            self.canvas.freeze(False)
+            self.canvas.refresh()
 
     def setTree(self, nodes, edges):
         self.nodes = nodes
@@ -26,7 +26,7 @@
 import logging
 from builtins import str
 
-from qgis.core import QgsProject
+from qgis.core import QgsMapLayer, QgsProject
 from qgis.PyQt.QtCore import QSettings, pyqtSlot
 from qgis.PyQt.QtGui import QColor
 from qgis.PyQt.QtWidgets import QDialog, QFileDialog
@@ -68,6 +68,16 @@ class QgepSettingsDialog(QDialog, DIALOG_UI):
         self.initLayerCombobox(self.mCbGraphEdges, lyr_graph_edges)
         self.initLayerCombobox(self.mCbGraphNodes, lyr_graph_nodes)
 
+        lyr_terrain, _ = project.readEntry("QGEP", "TerrainLayer")
+        self.mCbTerrainLayer.addItem(self.tr("None"), "")
+        self.initLayerCombobox(
+            self.mCbTerrainLayer, lyr_terrain, QgsMapLayer.RasterLayer
+        )
+        terrain_sampling_distance, _ = project.readDoubleEntry(
+            "QGEP", "TerrainSamplingDistance", 1.0
+        )
+        self.mSbTerrainSamplingDistance.setValue(terrain_sampling_distance)
+
         self.mCurrentProfileColorButton.setColor(
             QColor(self.settings.value("/QGEP/CurrentProfileColor", "#FF9500"))
         )
@@ -96,9 +106,11 @@ class QgepSettingsDialog(QDialog, DIALOG_UI):
         else:
             self.mGbLogToFile.setChecked(False)
 
-    def initLayerCombobox(self, combobox, default):
+    def initLayerCombobox(self, combobox, default, layer_type=None):
         reg = QgsProject.instance()
         for (key, layer) in list(reg.mapLayers().items()):
+            if layer_type is not None and layer.type() != layer_type:
+                continue
             combobox.addItem(layer.name(), key)
 
         idx = combobox.findData(default)
@@ -180,6 +192,16 @@ class QgepSettingsDialog(QDialog, DIALOG_UI):
         project.writeEntry(
             "QGEP", "GraphNodeLayer", self.mCbGraphNodes.itemData(graph_nodelayer_idx)
         )
+        project.writeEntry(
+            "QGEP",
+            "TerrainLayer",
+            self.mCbTerrainLayer.itemData(self.mCbTerrainLayer.currentIndex()),
+        )
+        project.writeEntryDouble(
+            "QGEP",
+            "TerrainSamplingDistance",
+            self.mSbTerrainSamplingDistance.value(),
+        )
 
     @pyqtSlot()
     def onChooseProfileTemplateFileClicked(self):
@@ -18,8 +18,17 @@
  ***************************************************************************/
 """
 
-import codecs
+import concurrent.futures
+import functools
+import io
+import locale
+import os
+import queue
+import re
+import shutil
 import subprocess
+import tempfile
+import threading
 from datetime import datetime, timedelta
 
 MEASURING_POINT_KIND = "Diverse kind of SWMM simulation parameters"
@@ -104,14 +113,111 @@ SWMM_RESULTS_PARAMETERS["head"] = {
     "qgep_measurement_type": 5732,
 }
 
+# Columns of the time series of the report, after the date and time
+SWMM_TIME_SERIES_PARAMETERS = {
+    "node": ["inflow", "flooding", "depth", "head"],
+    "link": ["flow", "velocity", "depth", "capacity"],
+}
+
+# Number of measurement results sent to the database per COPY
+COPY_BATCH_SIZE = 100000
+
+# Number of rows of a swmm view fetched at once by the server side cursor
+SWMM_TABLE_FETCH_SIZE = 5000
+# Size of the write buffer of the input file
+INPUT_FILE_BUFFER_SIZE = 1024 * 1024
+# Number of swmm views extracted concurrently
+SWMM_EXTRACTION_WORKERS = 4
+# Size of a section kept in memory before it is spooled to disk
+SECTION_SPOOL_SIZE = 16 * 1024 * 1024
+# Number of parsed template files kept in memory
+TEMPLATE_CACHE_SIZE = 16
+# Interval in seconds at which a running swmm is checked for cancellation
+SWMM_POLL_INTERVAL = 0.2
+# Time in seconds left to swmm to stop before it is killed
+SWMM_TERMINATE_TIMEOUT = 5
+# Size of the end of the swmm output searched for the progress
+SWMM_PROGRESS_WINDOW = 256
+# Progress printed by swmm, e.g. "Simulating day: 2     hour: 13" where only
+# the numbers are rewritten afterwards, or "45% complete". The continuity
+# errors printed at the end, e.g. "Runoff Error: 0.01%", are not a progress.
+SWMM_DAY_HOUR_PATTERN = re.compile(rb"(\d+)\s+hour:\s*(\d+)")
+SWMM_PERCENT_PATTERN = re.compile(rb"(\d+(?:\.\d+)?)\s*%\s*complete", re.IGNORECASE)
+# Columns of the swmm views which are not written in the input file
+NOT_PRINTED_FIELDS = [
+    "description",
+    "tag",
+    "geom",
+    "state",
+    "ws_obj_id",
+    "hierarchy",
+    "message",
+]
+
 NON_PHYSICAL_REM = "Non-physical point which materializes swmm simulations"
 
 import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+
+try:
+    from .swmm_output import SwmmOutput
+    from .swmm_report import SwmmReport
+except ImportError:
+    # Used as a standalone module, see swmm_templates/example_qgep_swmm_commands.py
+    from swmm_output import SwmmOutput
+    from swmm_report import SwmmReport
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def parse_template_sections(template_file, mtime):
+    """
+    Split a template file into its sections
+
+    A section starts at an opening bracket and ends before the next one, the
+    last section is followed by an empty line. The modification time is part
+    of the cache key, a modified template is parsed again.
+
+    Parameters:
+    template_file (path): path of the template INP file
+    mtime (integer): modification time of the file
+
+    Returns:
+    dictionary: content of each section by name, the first one is kept if a
+                name appears several times
+    """
+    with open(template_file, "r") as f:
+        options_template = f.read()
+
+    sections = {}
+    index_start = options_template.find("[")
+    while index_start != -1:
+        index_stop = options_template.find("[", index_start + 1)
+        if index_stop == -1:
+            # Copies text until the end of the file
+            option_text = options_template[index_start:] + "\n\n"
+        else:
+            option_text = options_template[index_start:index_stop]
+        index_name = option_text.find("]")
+        if index_name != -1:
+            sections.setdefault(option_text[1:index_name], option_text)
+        index_start = index_stop
+    return sections
 
 
 class QgepSwmm:
     def __init__(
-        self, title, service, state, inpfile, inptemplate, rptfile, binfile, feedback
+        self,
+        title,
+        service,
+        state,
+        inpfile,
+        inptemplate,
+        rptfile,
+        binfile,
+        feedback,
+        outfile=None,
+        use_snapshot=False,
     ):
 
         """
@@ -126,6 +232,9 @@ class QgepSwmm:
         rptfile (path): path of the OUT file which contains swmm results
         binfile (path): path of the swmm executable
         feedback (pyQGIS feedback)
+        outfile (path): path of the binary output file of swmm (optional)
+        use_snapshot (boolean): read the snapshot tables of the swmm views instead of
+                                the views, where they exist (optional)
         """
         self.title = title
         self.service = service
@@ -135,6 +244,16 @@ class QgepSwmm:
         self.bin_file = binfile
         self.feedback = feedback
         self.state = state
+        self.out_file = outfile
+        self.report = None
+        self.output = None
+        # Whether the output file is fresh and valid, checked on first use
+        self.output_usable = None
+        self.use_snapshot = use_snapshot
+        # Names of the views which have a snapshot table, loaded on first use
+        self.snapshot_tables = None
+        # The feedback is shared by the threads extracting the swmm views
+        self.feedback_lock = threading.Lock()
 
     def __enter__(self):
         if self.service is not None:
@@ -144,42 +263,119 @@ class QgepSwmm:
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.service is not None:
             del self.con
+        self.close_report()
+        self.close_output()
+
+    def get_report(self):
+        """
+        Index of the report file, it is read once on first use
+
+        Returns:
+        SwmmReport: the index
+        """
+        if self.report is None:
+            self.report = SwmmReport(self.rpt_file)
+        return self.report
+
+    def close_report(self):
+        if self.report is not None:
+            self.report.close()
+            self.report = None
+
+    def use_output(self):
+        """
+        Whether the results are read from the binary output file instead of the
+        report, which is the case if the output file exists, is not older than
+        the input file and is valid. A stale or invalid output file is reported
+        and the report is used instead.
+
+        Returns:
+        boolean
+        """
+        if self.output_usable is None:
+            self.output_usable = False
+            if self.out_file is None or not os.path.isfile(self.out_file):
+                return False
+            if (
+                self.input_file is not None
+                and os.path.isfile(self.input_file)
+                and os.path.getmtime(self.out_file) < os.path.getmtime(self.input_file)
+            ):
+                self.feedback_push(
+                    "error",
+                    "{} is older than {}, the results are read from the report".format(
+                        self.out_file, self.input_file
+                    ),
+                )
+                return False
+            try:
+                self.get_output()
+            except ValueError as e:
+                self.feedback_push(
+                    "error", "{}, the results are read from the report".format(e)
+                )
+                return False
+            self.output_usable = True
+        return self.output_usable
+
+    def get_output(self):
+        """
+        Reader of the binary output file, its header is read once on first use
+
+        Returns:
+        SwmmOutput: the reader
+        """
+        if self.output is None:
+            self.output = SwmmOutput(self.out_file)
+        return self.output
+
+    def close_output(self):
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+        self.output_usable = None
 
     def feedback_push(self, level, message):
         if self.feedback is not None and message != "" and message is not None:
-            if level == "info":
-                self.feedback.pushInfo(message)
-            elif level == "warning":
-                self.feedback.pushWarning(message)
-            elif level == "error":
-                self.feedback.reportError(message)
-            else:
-                self.feedback.pushInfo(message)
+            with self.feedback_lock:
+                if level == "info":
+                    self.feedback.pushInfo(message)
+                elif level == "warning":
+                    self.feedback.pushWarning(message)
+                elif level == "error":
+                    self.feedback.reportError(message)
+                else:
+                    self.feedback.pushInfo(message)
         return
 
     def feedback_set_progress(self, progress):
         if self.feedback is not None:
-            self.feedback.setProgress(progress)
+            with self.feedback_lock:
+                self.feedback.setProgress(progress)
         return
 
-    def get_swmm_table(self, table_name, state, selected_structures, hierarchy):
+    def get_swmm_table(
+        self, table_name, state, selected_structures, hierarchy, con=None
+    ):
         """
         Extract data from the swmm views in the database
 
+        The rows are streamed by a server side cursor, which is closed once all
+        the rows are read.
+
         Parameters:
         table_name (string): Name of the view or table
         state (string): current or planned
         selected_structures ([string]): List of obj_id of the selected structures
+        con (connection): connection to read from, the connection of the service
+                          by default
 
         Returns:
-        dic: table content
+        iterator: table content
         array: table attributes
 
         """
 
-        # Connects to service and get data and attributes from tableName
-        cur = self.con.cursor()
-
         # Configure the filters
         where_clauses = []
         if state == "planned":
@@ -187,22 +383,19 @@ class QgepSwmm:
         elif state == "current":
             where_clauses.append("state = 'current'")
         if selected_structures:
-            where_clauses.append(
-                """
-                obj_id in ('{ids}')
-                """.format(
-                    ids="','".join(selected_structures)
-                )
-            )
+            where_clauses.append("obj_id = ANY(%(selected_structures)s)")
         if hierarchy:
-            where_clauses.append(
-                """hierarchy = '{hierarchy}'""".format(hierarchy=hierarchy)
-            )
+            where_clauses.append("hierarchy = %(hierarchy)s")
+
+        relation = "vw_{table_name}".format(table_name=table_name)
+        # The section names are upper case, the relation names lower case
+        if self.use_snapshot and relation.lower() in self.get_snapshot_tables():
+            relation = "snapshot_{table_name}".format(table_name=table_name)
 
         sql = """
-        select * from qgep_swmm.vw_{table_name}
+        select * from qgep_swmm.{relation}
         """.format(
-            table_name=table_name
+            relation=relation
         )
         # Add the filters to the sql
         if len(where_clauses) > 0:
@@ -211,82 +404,185 @@ class QgepSwmm:
                 """.format(
                 sql=sql, where_clauses=" AND ".join(where_clauses)
             )
+
+        if con is None:
+            con = self.con
+
+        # Connects to service and get data and attributes from tableName
+        cur = con.cursor(name="swmm_{table_name}".format(table_name=table_name))
+        cur.itersize = SWMM_TABLE_FETCH_SIZE
         try:
-            cur.execute(sql)
+            cur.execute(
+                sql,
+                {
+                    "selected_structures": list(selected_structures or []),
+                    "hierarchy": hierarchy,
+                },
+            )
+            # The description of a named cursor is known after the first fetch
+            rows = iter(cur)
+            first_row = next(rows, None)
         except psycopg2.ProgrammingError:
             self.feedback_push("error", "Error while executing: {sql}".format(sql=sql))
+            # Leave the aborted transaction, the next tables can still be read
+            con.rollback()
             return None, None
-        self.feedback_push(
-            "info", "Process vw_{table_name}".format(table_name=table_name)
-        )
-        data = cur.fetchall()
+        self.feedback_push("info", "Process {relation}".format(relation=relation))
         attributes = [desc[0] for desc in cur.description]
-        del cur
 
-        return data, attributes
+        def data():
+            try:
+                if first_row is not None:
+                    yield first_row
+                    yield from rows
+            finally:
+                cur.close()
 
-    def swmm_table(
-        self, table_name, hierarchy=None, state=None, selected_structures=[]
+        return data(), attributes
+
+    def get_snapshot_tables(self):
+        """
+        Names of the swmm views which have a snapshot table, read once on first use
+
+        Returns:
+        set: the view names, e.g. "vw_junctions"
+        """
+        if self.snapshot_tables is None:
+            cur = self.con.cursor()
+            try:
+                cur.execute("SELECT view_name FROM qgep_swmm.snapshot_info")
+                self.snapshot_tables = {row[0] for row in cur.fetchall()}
+            except psycopg2.ProgrammingError:
+                # The datamodel has no snapshot, the views are read
+                self.con.rollback()
+                self.snapshot_tables = set()
+                self.feedback_push(
+                    "warning",
+                    "No snapshot of the swmm views found, the views are read instead",
+                )
+            cur.close()
+        return self.snapshot_tables
+
+    def refresh_snapshot(self, changed_only=False):
+        """
+        Refresh the snapshot tables of the swmm views
+
+        Parameters:
+        changed_only (boolean): refresh only the rows of the objects changed since
+                                the last refresh, read from the audit log
+
+        Returns:
+        integer: number of refreshed rows
+        """
+        cur = self.con.cursor()
+        cur.execute(
+            "SELECT view_name, refreshed_rows, full_refresh FROM qgep_swmm.refresh_snapshot(%s)",
+            (changed_only,),
+        )
+        refreshed_rows = 0
+        for view_name, rows, full_refresh in cur.fetchall():
+            refreshed_rows += rows
+            self.feedback_push(
+                "info",
+                "Refreshed {rows} rows of the snapshot of {view_name}{mode}".format(
+                    rows=rows,
+                    view_name=view_name,
+                    mode="" if full_refresh else " (changed structures)",
+                ),
+            )
+        self.con.commit()
+        cur.close()
+        # The snapshot tables may have been created
+        self.snapshot_tables = None
+        return refreshed_rows
+
+    def write_swmm_table(
+        self,
+        f,
+        table_name,
+        hierarchy=None,
+        state=None,
+        selected_structures=[],
+        con=None,
     ):
         """
         Write swmm objects extracted from QGEP in swmm input file. Selects according
         to the state planned or current. If the object is a qgep wastewater structure
         when the state is "planned" both "planned" and "operational" wastewater structures are selected
 
+        The rows are written to the file as they are read from the database.
+
         Parameters:
+        f (file): the input file
         table_name (string): Name of the swmm section
         state (string): current or planned
         selected_structre ([string]). List of obj_id of the selected wastewater structures
-        ws (boolean): if the origin table is a wastewater structure
+        con (connection): connection to read from, the connection of the service
+                          by default
+
+        """
+        data, attributes = self.get_swmm_table(
+            table_name, state, selected_structures, hierarchy, con
+        )
+        if data is None:
+            f.write("\n")
+            return
+
+        # Does not write values stored in columns descriptions, tags and geom
+        printed_fields = [
+            i for i, field in enumerate(attributes) if field not in NOT_PRINTED_FIELDS
+        ]
+        description_field = (
+            attributes.index("description") if "description" in attributes else None
+        )
+        message_field = attributes.index("message") if "message" in attributes else None
+
+        # Create input paragraph with a commented line which contains the field names
+        f.write("[" + table_name + "]\n")
+        f.write(";;" + "".join(attributes[i] + "\t" for i in printed_fields) + "\n")
+        for feature in data:
+            # Write description
+            if description_field is not None:
+                description = feature[description_field]
+                if description is not None:
+                    f.write(";" + str(description) + "\n")
+            if message_field is not None and feature[message_field] != "":
+                self.feedback_push("warning", feature[message_field])
+            f.write(
+                "".join(
+                    ("" if feature[i] is None else str(feature[i])) + "\t"
+                    for i in printed_fields
+                )
+                + "\n"
+            )
+        f.write("\n")
+
+    def swmm_table(
+        self, table_name, hierarchy=None, state=None, selected_structures=[]
+    ):
+        """
+        Extract swmm objects from QGEP as a section of the swmm input file, see
+        write_swmm_table
 
         Returns:
         String: table content
 
         """
-        notPrintedFields = [
-            "description",
-            "tag",
-            "geom",
-            "state",
-            "ws_obj_id",
-            "hierarchy",
-            "message",
-        ]
-        # Create commented line which contains the field names
-        fields = ""
-        data, attributes = self.get_swmm_table(
-            table_name, state, selected_structures, hierarchy
+        tbl = io.StringIO()
+        self.write_swmm_table(tbl, table_name, hierarchy, state, selected_structures)
+        return tbl.getvalue()
+
+    def get_template_sections(self):
+        """
+        Sections of the template file, parsed once for each version of the file
+
+        Returns:
+        dictionary: content of each section by name
+        """
+        return parse_template_sections(
+            self.options_template_file,
+            os.stat(self.options_template_file).st_mtime_ns,
         )
-        if data is not None:
-            for i, field in enumerate(attributes):
-                # Does not write values stored in columns descriptions, tags and geom
-                if field not in notPrintedFields:
-                    fields += field + "\t"
-
-            # Create input paragraph
-            tbl = "[" + table_name + "]\n" ";;" + fields + "\n"
-            for feature in data:
-                for i, v in enumerate(feature):
-                    # Write description
-                    if attributes[i] == "description" and v is not None:
-                        tbl += ";"
-                        tbl += str(v)
-                        tbl += "\n"
-
-                for i, v in enumerate(feature):
-                    # Does not write values stored in columns descriptions, tags and geom
-                    if attributes[i] not in notPrintedFields:
-                        if v is not None:
-                            tbl += str(v) + "\t"
-                        else:
-                            tbl += "\t"
-                    if attributes[i] == "message" and v != "":
-                        self.feedback_push("warning", v)
-                tbl += "\n"
-            tbl += "\n"
-            return tbl
-        else:
-            return "\n"
 
     def copy_parameters_from_template(self, parameter_name):
         """
@@ -299,13 +595,8 @@ class QgepSwmm:
         String: section content
 
         """
-        # Read template
-        options_template = open(self.options_template_file, "r").read()
-        # Find and extract options
-        index_start = options_template.find(
-            "[{parameter_name}]".format(parameter_name=parameter_name)
-        )
-        if index_start == -1:
+        option_text = self.get_template_sections().get(parameter_name)
+        if option_text is None:
             # The balise options is not found
             self.feedback_push(
                 "info",
@@ -314,195 +605,256 @@ class QgepSwmm:
                 ),
             )
             return ""
-        else:
-            # Search for the next opening bracket
-            index_stop = options_template[index_start + 1 :].find("[")
-            if index_stop == -1:
-                # Copies text until the end of the file
-                index_stop = len(options_template)
-                option_text = options_template[index_start:index_stop] + "\n\n"
-            else:
-                index_stop = index_start + 1 + index_stop
-                option_text = options_template[index_start:index_stop]
-            return option_text
+        return option_text
 
     def write_input(self, hierarchy, selected_structures, selected_reaches):
         """
         Write the swmm input file
 
+        The swmm views are extracted concurrently if a service is configured, the
+        sections are then written in the order required by swmm.
+
+        """
+        sections = self.input_sections(hierarchy, selected_structures, selected_reaches)
+
+        self.feedback_set_progress(5)
+        contents = None
+        if self.service is not None:
+            if self.use_snapshot:
+                # Read once, before the views are extracted by the threads
+                self.get_snapshot_tables()
+            contents = self.extract_swmm_tables(
+                [section[1:] for section in sections if section[0] == "table"]
+            )
+        try:
+            self.write_input_sections(sections, contents)
+        finally:
+            for content in contents or []:
+                content.close()
+        self.feedback_set_progress(96)
+        return
+
+    def input_sections(self, hierarchy, selected_structures, selected_reaches):
         """
+        Sections of the swmm input file, in the order required by swmm
 
-        # From qgis swmm
-        filename = self.input_file
+        Returns:
+        array: ("template", name) for the sections copied from the template,
+               ("table", name, hierarchy, state, selection) for the sections
+               extracted from a swmm view
+        """
         state = self.state
 
         selected_ws_re = None
         if selected_structures and selected_reaches:
             selected_ws_re = selected_structures + selected_reaches
 
-        with codecs.open(filename, "w", encoding="utf-8") as f:
-
-            # Title / Notes
-            # --------------
-            f.write("[TITLE]\n")
-            f.write(self.title + "\n\n")
-
+        # Sections of the input file, either copied from the template or
+        # extracted from a swmm view with its filters (hierarchy, state, selection)
+        sections = [
             # Options
             # --------
-            f.write(self.copy_parameters_from_template("OPTIONS"))
-            f.write(self.copy_parameters_from_template("REPORT"))
-            f.write(self.copy_parameters_from_template("FILES"))
-            f.write(self.copy_parameters_from_template("EVENTS"))
-
+            ("template", "OPTIONS"),
+            ("template", "REPORT"),
+            ("template", "FILES"),
+            ("template", "EVENTS"),
             # Climatology
             # ------------
-            f.write(self.copy_parameters_from_template("HYDROGRAPHS"))
-            f.write(self.copy_parameters_from_template("EVAPORATION"))
-            f.write(self.copy_parameters_from_template("TEMPERATURE"))
-
+            ("template", "HYDROGRAPHS"),
+            ("template", "EVAPORATION"),
+            ("template", "TEMPERATURE"),
             # Hydrology
             # ----------
-            self.feedback_set_progress(5)
-            f.write(self.swmm_table("RAINGAGES", hierarchy, state, selected_structures))
-            f.write(self.swmm_table("SYMBOLS", hierarchy, state, selected_structures))
-            self.feedback_set_progress(10)
-            f.write(
-                self.swmm_table("SUBCATCHMENTS", hierarchy, state, selected_structures)
-            )
-            self.feedback_set_progress(15)
-            f.write(self.swmm_table("SUBAREAS", hierarchy, state, selected_structures))
-            self.feedback_set_progress(20)
-            f.write(self.swmm_table("AQUIFERS"))
-            self.feedback_set_progress(25)
-            f.write(
-                self.swmm_table("INFILTRATION", hierarchy, state, selected_structures)
-            )
-            self.feedback_set_progress(30)
-            f.write(self.swmm_table("POLYGONS"))
-
-            f.write(self.copy_parameters_from_template("GROUNDWATER"))
-            f.write(self.copy_parameters_from_template("SNOWPACKS"))
-            f.write(self.copy_parameters_from_template("HYDROGAPHS"))
-            f.write(self.copy_parameters_from_template("LID_CONTROLS"))
-            f.write(self.copy_parameters_from_template("LID_USAGE"))
-
+            ("table", "RAINGAGES", hierarchy, state, selected_structures),
+            ("table", "SYMBOLS", hierarchy, state, selected_structures),
+            ("table", "SUBCATCHMENTS", hierarchy, state, selected_structures),
+            ("table", "SUBAREAS", hierarchy, state, selected_structures),
+            ("table", "AQUIFERS"),
+            ("table", "INFILTRATION", hierarchy, state, selected_structures),
+            ("table", "POLYGONS"),
+            ("template", "GROUNDWATER"),
+            ("template", "SNOWPACKS"),
+            ("template", "HYDROGAPHS"),
+            ("template", "LID_CONTROLS"),
+            ("template", "LID_USAGE"),
             # Hydraulics: nodes
             # ------------------
-            self.feedback_set_progress(35)
-            f.write(self.swmm_table("JUNCTIONS", hierarchy, state, selected_ws_re))
-            self.feedback_set_progress(40)
-            f.write(self.swmm_table("OUTFALLS", hierarchy, state, selected_structures))
-            self.feedback_set_progress(45)
-            f.write(self.swmm_table("STORAGES", hierarchy, state, selected_structures))
-            self.feedback_set_progress(50)
-            f.write(self.swmm_table("COORDINATES", hierarchy, state, selected_ws_re))
-            self.feedback_set_progress(55)
-            f.write(self.swmm_table("DWF", hierarchy, state, selected_structures))
-
-            f.write(self.copy_parameters_from_template("INFLOWS"))
-            f.write(self.swmm_table("DIVIDERS"))
-
+            ("table", "JUNCTIONS", hierarchy, state, selected_ws_re),
+            ("table", "OUTFALLS", hierarchy, state, selected_structures),
+            ("table", "STORAGES", hierarchy, state, selected_structures),
+            ("table", "COORDINATES", hierarchy, state, selected_ws_re),
+            ("table", "DWF", hierarchy, state, selected_structures),
+            ("template", "INFLOWS"),
+            ("table", "DIVIDERS"),
             # Hydraulics: links
             # ------------------
-            self.feedback_set_progress(60)
-            f.write(self.swmm_table("CONDUITS", hierarchy, state, selected_reaches))
-            self.feedback_set_progress(65)
-            f.write(self.swmm_table("LOSSES", hierarchy, state, selected_structures))
-            self.feedback_set_progress(70)
-            f.write(self.swmm_table("PUMPS", hierarchy, state, selected_structures))
-            f.write(self.swmm_table("ORIFICES", hierarchy, state, selected_structures))
-            f.write(self.swmm_table("WEIRS", hierarchy, state, selected_structures))
-            self.feedback_set_progress(75)
-            f.write(self.swmm_table("XSECTIONS", hierarchy, state, selected_reaches))
-            self.feedback_set_progress(80)
-            f.write(self.swmm_table("LOSSES", hierarchy, state, selected_structures))
-            f.write(self.swmm_table("OUTLETS"))
-            self.feedback_set_progress(85)
-            f.write(self.swmm_table("VERTICES", hierarchy, state, selected_reaches))
-            f.write(self.copy_parameters_from_template("TRANSECTS"))
-            f.write(self.copy_parameters_from_template("CONTROLS"))
-
+            ("table", "CONDUITS", hierarchy, state, selected_reaches),
+            ("table", "LOSSES", hierarchy, state, selected_structures),
+            ("table", "PUMPS", hierarchy, state, selected_structures),
+            ("table", "ORIFICES", hierarchy, state, selected_structures),
+            ("table", "WEIRS", hierarchy, state, selected_structures),
+            ("table", "XSECTIONS", hierarchy, state, selected_reaches),
+            ("table", "LOSSES", hierarchy, state, selected_structures),
+            ("table", "OUTLETS"),
+            ("table", "VERTICES", hierarchy, state, selected_reaches),
+            ("template", "TRANSECTS"),
+            ("template", "CONTROLS"),
             # Quality
             # --------
-            self.feedback_set_progress(90)
-            f.write(self.swmm_table("LANDUSES"))
-            self.feedback_set_progress(93)
-            f.write(self.swmm_table("COVERAGES", None, None, selected_structures))
-
-            f.write(self.copy_parameters_from_template("POLLUTANTS"))
-            f.write(self.copy_parameters_from_template("BUILDUP"))
-            f.write(self.copy_parameters_from_template("WASHOFF"))
-            f.write(self.copy_parameters_from_template("TREATMENT"))
-            f.write(self.copy_parameters_from_template("RDII"))
-            f.write(self.copy_parameters_from_template("LOADINGS"))
-
+            ("table", "LANDUSES"),
+            ("table", "COVERAGES", None, None, selected_structures),
+            ("template", "POLLUTANTS"),
+            ("template", "BUILDUP"),
+            ("template", "WASHOFF"),
+            ("template", "TREATMENT"),
+            ("template", "RDII"),
+            ("template", "LOADINGS"),
             # Curves
             # -------
-            f.write(self.swmm_table("CURVES"))
-
+            ("table", "CURVES"),
             # Time series
             # ------------
-            f.write(self.copy_parameters_from_template("TIMESERIES"))
-
+            ("template", "TIMESERIES"),
             # Time patterns
             # --------------
-            f.write(self.copy_parameters_from_template("PATTERNS"))
-
+            ("template", "PATTERNS"),
             # Map labels
             # -----------
-            f.write(self.copy_parameters_from_template("LABELS"))
-            self.feedback_set_progress(96)
-
+            ("template", "LABELS"),
             # Tags
             # ----
-            f.write(self.swmm_table("TAGS", state, selected_ws_re))
-        f.close()
+            ("table", "TAGS", state, selected_ws_re),
+        ]
+        return sections
+
+    def write_input_sections(self, sections, contents=None):
+        """
+        Write the sections of the swmm input file
+
+        Parameters:
+        sections (array): sections of the file, see input_sections
+        contents ([file]): content of the table sections as returned by
+                           extract_swmm_tables, the views are read if None.
+                           The files are not closed, several input files can be
+                           written from one extraction.
+        """
+        tables = [section for section in sections if section[0] == "table"]
+        if contents is not None:
+            contents = iter(contents)
+
+        # Newlines are written as is, as in the template
+        with open(
+            self.input_file,
+            "w",
+            encoding="utf-8",
+            newline="",
+            buffering=INPUT_FILE_BUFFER_SIZE,
+        ) as f:
+
+            # Title / Notes
+            # --------------
+            f.write("[TITLE]\n")
+            f.write(self.title + "\n\n")
+
+            counter = 0
+            for section in sections:
+                if section[0] == "template":
+                    f.write(self.copy_parameters_from_template(section[1]))
+                elif contents is not None:
+                    content = next(contents)
+                    content.seek(0)
+                    shutil.copyfileobj(content, f)
+                else:
+                    counter += 1
+                    self.write_swmm_table(f, *section[1:])
+                    self.feedback_set_progress(5 + counter * 90 / len(tables))
         return
 
+    def extract_swmm_tables(self, tables):
+        """
+        Extract the swmm views concurrently, each one into a temporary file
+
+        The views are read by a small pool of connections, all sharing the snapshot
+        exported by a first connection, so that the sections are consistent as if
+        they were read in a single transaction.
+
+        Parameters:
+        tables (array): table name and filters (hierarchy, state, selection) of
+                        each view
+
+        Returns:
+        [file]: content of each view, in the order of the tables
+        """
+        worker_count = max(1, min(SWMM_EXTRACTION_WORKERS, len(tables)))
+        # One more connection holds the exported snapshot
+        pool = psycopg2.pool.ThreadedConnectionPool(
+            worker_count + 1, worker_count + 1, service=self.service
+        )
+        try:
+            snapshot_con = pool.getconn()
+            snapshot_con.set_session(isolation_level="REPEATABLE READ", readonly=True)
+            cur = snapshot_con.cursor()
+            cur.execute("SELECT pg_export_snapshot()")
+            snapshot = cur.fetchone()[0]
+
+            def extract(table):
+                con = pool.getconn()
+                try:
+                    # Each view is read in its own transaction on the shared snapshot
+                    con.rollback()
+                    con.set_session(isolation_level="REPEATABLE READ", readonly=True)
+                    con.cursor().execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+                    content = tempfile.SpooledTemporaryFile(
+                        max_size=SECTION_SPOOL_SIZE,
+                        mode="w+",
+                        encoding="utf-8",
+                        newline="",
+                    )
+                    try:
+                        self.write_swmm_table(content, *table, con=con)
+                    except BaseException:
+                        content.close()
+                        raise
+                    return content
+                finally:
+                    con.rollback()
+                    pool.putconn(con)
+
+            with concurrent.futures.ThreadPoolExecutor(worker_count) as executor:
+                futures = [executor.submit(extract, table) for table in tables]
+                try:
+                    for counter, future in enumerate(
+                        concurrent.futures.as_completed(futures), 1
+                    ):
+                        future.result()
+                        self.feedback_set_progress(5 + counter * 90 / len(tables))
+                except BaseException:
+                    # The pending views are not extracted, the files of the views
+                    # extracted anyway are closed
+                    for future in futures:
+                        future.cancel()
+                    concurrent.futures.wait(futures)
+                    for future in futures:
+                        if not future.cancelled() and future.exception() is None:
+                            future.result().close()
+                    raise
+                return [future.result() for future in futures]
+        finally:
+            pool.closeall()
+
     def extract_time_series_indexes(self):
         """
-        Extract full time series from swmm report file
+        Extract full time series from swmm binary output file if available, else
+        from swmm report file
 
         Returns:
-        data_indexes (dictionary): dictionary of the object id with data indexes
-
-        """
-
-        o = codecs.open(self.rpt_file, "r", encoding="utf-8")
-        line = o.readline()
-        title_found = False
-        line_number = -1
-        data_indexes = {}
-        heading_lines = 5
-        while line:
-            line_number += 1
-            line = line.rstrip()
-            # Search for the table title
-            if line.find("*****") != -1:
-                # The following title is found: stop the recording of the indexes
-                title_found = False
-
-            if line.find("<<< Link ") != -1 or line.find("<<< Node ") != -1:
-                title_found = True
-                line_after_title = 0
-                obj_id = line.strip().split(" ")[2]
-                data_indexes[obj_id] = {}
-                data_indexes[obj_id]["title_index"] = line_number
-                data_indexes[obj_id]["start_index"] = line_number + heading_lines
-                if line.find("Link") != -1:
-                    data_indexes[obj_id]["type"] = "link"
-                if line.find("Node") != -1:
-                    data_indexes[obj_id]["type"] = "node"
-
-            if title_found and line_after_title > heading_lines and line.strip() == "":
-                data_indexes[obj_id]["end_index"] = line_number - 1
-
-            if title_found:
-                line_after_title += 1
-
-            line = o.readline()
-        o.close()
-        return data_indexes
+        data_indexes (dictionary): dictionary of the object id with the type and
+                                   the position of the data in the file
+        """
+
+        if self.use_output():
+            return self.get_output().time_series_indexes
+        return self.get_report().time_series_indexes
 
     def extract_summary_lines(self, table_title):
         """
@@ -516,34 +868,7 @@ class QgepSwmm:
 
         """
 
-        o = codecs.open(self.rpt_file, "r", encoding="utf-8")
-
-        line = o.readline()
-        no_line = 0
-        lines = []
-        title_found = False
-        end_table_found = False
-        while line:
-            line = line.rstrip()
-            # Search for the table title
-            if line.find(table_title) != -1:
-                title_found = True
-                line_after_title = 0
-
-            if title_found and line_after_title > 7 and line == "":
-                end_table_found = True
-
-            if title_found and end_table_found is False and line_after_title > 7:
-                lines.append(line.split())
-
-            if title_found:
-                line_after_title += 1
-
-            no_line += 1
-            line = o.readline()
-        o.close()
-
-        return lines
+        return self.get_report().section_lines(table_title)
 
     def extract_node_depth_summary(self):
         """
@@ -600,39 +925,164 @@ class QgepSwmm:
             result.append(curres)
         return result
 
+    def swmm_command(self):
+        """
+        Command line running SWMM on the input file
+
+        Returns:
+        [string]: the executable and its arguments
+        """
+        command = [self.bin_file, self.input_file, self.rpt_file]
+        if self.out_file is not None:
+            command.append(self.out_file)
+        return command
+
     def execute_swmm(self):
         """
         Execute SWMM
 
-        Parameters:
-        dic: Extracted computed values
+        SWMM runs in its own process, its output is read as it is printed to report
+        the progress. The process is terminated if the feedback is canceled.
+
+        Returns:
+        string: output of swmm
 
         """
 
-        command = [self.bin_file, self.input_file, self.rpt_file]
+        # The report and the output are about to be rewritten
+        self.close_report()
+        self.close_output()
+
+        command = self.swmm_command()
         self.feedback_push("info", "command: " + " ".join(map(str, command)))
-        proc = subprocess.run(
+        duration = self.simulation_duration()
+        proc = subprocess.Popen(
             command,
-            shell=True,
             stdout=subprocess.PIPE,
-            stdin=subprocess.PIPE,
+            stdin=subprocess.DEVNULL,
             stderr=subprocess.STDOUT,
-            universal_newlines=True,
-        ).stdout
+        )
+
+        # The progress is printed without new lines, the output is read by chunks
+        chunks = queue.Queue()
+
+        def read_output():
+            for chunk in iter(lambda: proc.stdout.read1(SWMM_PROGRESS_WINDOW), b""):
+                chunks.put(chunk)
+            chunks.put(None)
+
+        reader = threading.Thread(target=read_output, daemon=True)
+        reader.start()
+
+        output = bytearray()
+        finished = False
+        canceled = False
+        try:
+            while not finished:
+                try:
+                    chunk = chunks.get(timeout=SWMM_POLL_INTERVAL)
+                except queue.Empty:
+                    chunk = b""
+                if chunk is None:
+                    finished = True
+                if chunk:
+                    output += chunk
+                    progress = self.parse_swmm_progress(
+                        output[-SWMM_PROGRESS_WINDOW:], duration
+                    )
+                    if progress is not None:
+                        self.feedback_set_progress(progress)
+                if (
+                    not canceled
+                    and self.feedback is not None
+                    and self.feedback.isCanceled()
+                ):
+                    canceled = True
+                    self.feedback_push("warning", "SWMM execution canceled")
+                    proc.terminate()
+                    break
+        finally:
+            if not finished and not canceled:
+                proc.terminate()
+            try:
+                proc.wait(timeout=None if finished else SWMM_TERMINATE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+            reader.join()
+            proc.stdout.close()
+
+        # As with universal newlines
+        return (
+            output.decode(locale.getpreferredencoding(False), errors="replace")
+            .replace("\r\n", "\n")
+            .replace("\r", "\n")
+        )
+
+    def parse_swmm_progress(self, output, duration):
+        """
+        Progress of swmm from the end of its output
+
+        Parameters:
+        output (bytes): end of the output of swmm
+        duration (number): duration of the simulation in hours, None if unknown
 
-        return proc
+        Returns:
+        number: progress between 0 and 100, None if not found
+        """
+        percents = SWMM_PERCENT_PATTERN.findall(output)
+        if percents:
+            return min(100.0, float(percents[-1]))
+        days_hours = SWMM_DAY_HOUR_PATTERN.findall(output)
+        if days_hours and duration:
+            day, hour = days_hours[-1]
+            return min(100.0, (int(day) * 24 + int(hour)) * 100 / duration)
+        return None
+
+    def simulation_duration(self):
+        """
+        Duration of the simulation, read from the options of the input file
+
+        Returns:
+        number: duration in hours, None if unknown
+        """
+        # The input file can be large, it is read line by line up to the end of
+        # the options, which come first
+        options = {}
+        in_options = False
+        try:
+            with open(self.input_file, "r") as f:
+                for line in f:
+                    stripped = line.strip()
+                    if stripped.startswith("["):
+                        if in_options:
+                            break
+                        in_options = stripped[1 : stripped.find("]")] == "OPTIONS"
+                        continue
+                    if in_options:
+                        values = stripped.split(";")[0].split()
+                        if len(values) >= 2:
+                            options[values[0].upper()] = values[1]
+        except (OSError, UnicodeDecodeError):
+            return None
+
+        dates = []
+        for date, time in (("START_DATE", "START_TIME"), ("END_DATE", "END_TIME")):
+            if date not in options:
+                return None
+            text = options[date] + " " + options.get(time, "00:00:00")
+            for date_format in ("%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M"):
+                try:
+                    dates.append(datetime.strptime(text, date_format))
+                    break
+                except ValueError:
+                    pass
+            else:
+                return None
+        return (dates[1] - dates[0]).total_seconds() / 3600
 
     def get_analysis_option(self, parameter):
-        o = codecs.open(self.rpt_file, "r", encoding="utf-8")
-        line = o.readline()
-        while line:
-            line = line.rstrip()
-            # Search for the analyis option
-            if line.find(parameter) != -1:
-                value = line.split(".")[-1].strip()
-            line = o.readline()
-        o.close()
-        return value
+        return self.get_report().analysis_option(parameter)
 
     def convert_to_datetime(self, str_date):
         date = datetime.strptime(str_date, "%d/%m/%Y %H:%M:%S")
@@ -640,19 +1090,26 @@ class QgepSwmm:
 
     def import_full_results(self, sim_description):
         """
-        Import the full results from an SWMM report file
+        Import the full results from an SWMM binary output file if available,
+        else from the report file
 
         Parameters:
         sim_description (string): Title of the simulation
 
         """
 
-        simulation_start_date = self.convert_to_datetime(
-            self.get_analysis_option("Starting Date")
-        )
-        simulation_end_date = self.convert_to_datetime(
-            self.get_analysis_option("Ending Date")
-        )
+        if self.use_output():
+            simulation_start_date = self.get_output().report_start
+            simulation_end_date = max(
+                self.get_output().times(), default=simulation_start_date
+            )
+        else:
+            simulation_start_date = self.convert_to_datetime(
+                self.get_analysis_option("Starting Date")
+            )
+            simulation_end_date = self.convert_to_datetime(
+                self.get_analysis_option("Ending Date")
+            )
         simulation_duration = simulation_end_date - simulation_start_date
         measuring_duration = simulation_duration.total_seconds()
 
@@ -660,86 +1117,239 @@ class QgepSwmm:
 
         ndata = len(data_indexes.keys())
         self.feedback_push("info", "Import full results")
-        counter = 0
-        for obj_id in data_indexes.keys():
-            counter += 1
-            self.feedback_set_progress(counter * 100 / ndata)
-            # Create measuring point if necessary
-            if data_indexes[obj_id]["type"] == "node":
-                mp_obj_id = self.create_measuring_point_node(obj_id, sim_description)
-            if data_indexes[obj_id]["type"] == "link":
-                mp_obj_id = self.create_measuring_point_link(obj_id, sim_description)
-            if mp_obj_id:
-                # Create measuring device
-                self.create_measuring_device(mp_obj_id)
-                # Get measurement data of the current object
-                measurement_data = self.get_full_results(
-                    data_indexes[obj_id]["start_index"],
-                    data_indexes[obj_id]["end_index"],
-                    data_indexes[obj_id]["type"],
+
+        # Everything is imported in a single transaction
+        cur = self.con.cursor()
+        try:
+            measuring_points = self.create_measuring_points_node(
+                cur,
+                [o for o, i in data_indexes.items() if i["type"] == "node"],
+                sim_description,
+            )
+            measuring_points.update(
+                self.create_measuring_points_link(
+                    cur,
+                    [o for o, i in data_indexes.items() if i["type"] == "link"],
+                    sim_description,
                 )
-                # Record each measurement
-                m_counter = 0
-                for m in measurement_data:
-                    m_counter += 1
-                    time = self.convert_to_datetime(
-                        m["date"] + " " + m["time"]
-                    ).isoformat()
-                    for k in m.keys():
-                        if k in SWMM_RESULTS_PARAMETERS.keys():
-                            if SWMM_RESULTS_PARAMETERS[k]["recorded"]:
-                                ms_obj_id = self.create_measurement_series(
-                                    mp_obj_id,
-                                    k,
-                                    SWMM_RESULTS_PARAMETERS[k]["dimension"],
-                                )
-                                self.create_measurement_result(
-                                    ms_obj_id,
-                                    SWMM_RESULTS_PARAMETERS[k]["qgep_measurement_type"],
-                                    measuring_duration,
-                                    time,
-                                    m[k],
-                                )
+            )
+            self.create_measuring_devices(cur, measuring_points.values())
+            series = self.create_measurement_series_batch(
+                cur,
+                [
+                    (
+                        measuring_points[obj_id],
+                        parameter_name,
+                        SWMM_RESULTS_PARAMETERS[parameter_name]["dimension"],
+                    )
+                    for obj_id, data_index in data_indexes.items()
+                    if obj_id in measuring_points
+                    for parameter_name in SWMM_TIME_SERIES_PARAMETERS[
+                        data_index["type"]
+                    ]
+                    if SWMM_RESULTS_PARAMETERS[parameter_name]["recorded"]
+                ],
+            )
+            self.create_measurement_results_table(cur)
+
+            rows = io.StringIO()
+            row_count = 0
+            counter = 0
+            for obj_id, data_index in data_indexes.items():
+                counter += 1
+                self.feedback_set_progress(counter * 90 / ndata)
+                if self.feedback is not None and self.feedback.isCanceled():
+                    self.con.rollback()
+                    return
+                mp_obj_id = measuring_points.get(obj_id)
+                if mp_obj_id is None:
+                    continue
+                for time, values in self.get_time_series(obj_id, data_index["type"]):
+                    for k, value in values.items():
+                        ms_obj_id = series.get((mp_obj_id, k))
+                        if ms_obj_id is None:
+                            continue
+                        rows.write(
+                            self.format_measurement_result(
+                                ms_obj_id,
+                                SWMM_RESULTS_PARAMETERS[k]["qgep_measurement_type"],
+                                measuring_duration,
+                                time,
+                                value,
+                            )
+                        )
+                        row_count += 1
+                if row_count >= COPY_BATCH_SIZE:
+                    self.copy_measurement_results(cur, rows)
+                    rows = io.StringIO()
+                    row_count = 0
+            if row_count:
+                self.copy_measurement_results(cur, rows)
+
+            self.feedback_push("info", "Write full results")
+            self.merge_measurement_results(cur)
+            self.con.commit()
+        except psycopg2.Error as e:
+            self.con.rollback()
+            self.feedback_push("error", str(e))
+        finally:
+            del cur
+        self.feedback_set_progress(100)
         return
 
-    def get_full_results(self, start_index, end_index, swmm_type):
+    def create_measurement_results_table(self, cur):
+        """
+        Creates the temporary table the measurement results are copied to
+        """
+        cur.execute(
+            """
+            CREATE TEMP TABLE _swmm_measurement_result (
+            fk_measurement_series text, measurement_type integer,
+            measuring_duration numeric, time timestamp without time zone, value real,
+            row_number serial) ON COMMIT DROP
+            """
+        )
+
+    def format_measurement_result(
+        self, ms_obj_id, measurement_type, measuring_duration, time, value
+    ):
+        """
+        Formats a measurement result as a line of the COPY text format
+
+        Returns:
+        string: tab separated values, missing values as \\N
+        """
+        return (
+            "\t".join(
+                "\\N" if v is None else str(v)
+                for v in (ms_obj_id, measurement_type, measuring_duration, time, value)
+            )
+            + "\n"
+        )
+
+    def copy_measurement_results(self, cur, rows):
+        """
+        Streams tab separated measurement results to the temporary table with COPY
+
+        Parameters:
+        cur (cursor): cursor of the import transaction
+        rows (StringIO): one line per result
+        """
+        rows.seek(0)
+        cur.copy_expert(
+            """
+            COPY _swmm_measurement_result
+            (fk_measurement_series, measurement_type, measuring_duration, time, value)
+            FROM STDIN
+            """,
+            rows,
+        )
+
+    def merge_measurement_results(self, cur):
+        """
+        Updates the existing measurement results (same measurement serie, same time,
+        same type) and inserts the others, from the temporary table
+        """
+        cur.execute("ANALYZE _swmm_measurement_result")
+        # Several objects can share a measuring point, the last result wins
+        cur.execute(
+            """
+            CREATE TEMP TABLE _swmm_measurement_result_distinct ON COMMIT DROP AS
+            SELECT DISTINCT ON (fk_measurement_series, time, measurement_type) *
+            FROM _swmm_measurement_result
+            ORDER BY fk_measurement_series, time, measurement_type, row_number DESC
+            """
+        )
+        cur.execute(
+            """
+            UPDATE qgep_od.measurement_result mr
+            SET measuring_duration = r.measuring_duration, value = r.value
+            FROM _swmm_measurement_result_distinct r
+            WHERE mr.fk_measurement_series = r.fk_measurement_series
+            AND mr.time = r.time
+            AND mr.measurement_type = r.measurement_type
+            """
+        )
+        cur.execute(
+            """
+            INSERT INTO qgep_od.measurement_result
+            (identifier, measurement_type, measuring_duration,
+            time, value, fk_measurement_series)
+            SELECT NULL, r.measurement_type, r.measuring_duration,
+            r.time, r.value, r.fk_measurement_series
+            FROM _swmm_measurement_result_distinct r
+            WHERE NOT EXISTS (
+                SELECT 1 FROM qgep_od.measurement_result mr
+                WHERE mr.fk_measurement_series = r.fk_measurement_series
+                AND mr.time = r.time
+                AND mr.measurement_type = r.measurement_type
+            )
+            """
+        )
+
+    def get_full_results(self, obj_id, swmm_type):
         """
         Get the full result of a node or link
 
         Parameters:
-        start_index (integer): Index of the first line containing the data
-        end_index (integer): Index of the last line containing the data
+        obj_id (string): Id of the node or link
+        swmm_type (string): node or link
 
         Returns:
         datas: array of dictionnary containing the data
         """
-        o = codecs.open(self.rpt_file, "r", encoding="utf-8")
-        line = o.readline()
-        no_line = -1
         datas = []
-        while line:
-            no_line += 1
-            if no_line >= start_index and no_line < end_index:
-                values = line.strip().split()
-                data = {}
-                if len(values) != 0:
-                    data["date"] = values[0]
-                    data["time"] = values[1]
-                    if swmm_type == "node":
-                        data["inflow"] = values[2]
-                        data["flooding"] = values[3]
-                        data["depth"] = values[4]
-                        data["head"] = values[5]
-                    if swmm_type == "link":
-                        data["flow"] = values[2]
-                        data["velocity"] = values[3]
-                        data["depth"] = values[4]
-                        data["capacity"] = values[5]
-                    datas.append(data)
-            line = o.readline()
-        o.close()
+        for values in self.get_report().time_series(obj_id):
+            data = {}
+            data["date"] = values[0]
+            data["time"] = values[1]
+            data.update(zip(SWMM_TIME_SERIES_PARAMETERS[swmm_type], values[2:]))
+            datas.append(data)
         return datas
 
+    def get_time_series(self, obj_id, swmm_type):
+        """
+        Get the full result of a node or link, from the binary output file if
+        available, else from the report
+
+        Parameters:
+        obj_id (string): Id of the node or link
+        swmm_type (string): node or link
+
+        Returns:
+        iterator: (time in ISO format, dictionary of the values) of each time step
+        """
+        parameters = SWMM_TIME_SERIES_PARAMETERS[swmm_type]
+        if self.use_output():
+            output = self.get_output()
+            values = output.time_series(obj_id, parameters)
+            for time, row in zip(output.times(), values):
+                yield time.isoformat(), dict(zip(parameters, row))
+        else:
+            for m in self.get_full_results(obj_id, swmm_type):
+                time = self.convert_to_datetime(m["date"] + " " + m["time"])
+                yield time.isoformat(), {k: m[k] for k in parameters if k in m}
+
+    def extract_time_series(self, swmm_type):
+        """
+        Extract the full results of all nodes or links from swmm binary output file
+
+        Parameters:
+        swmm_type (string): node or link
+
+        Returns:
+        iterator: dictionary of the id, the time and the values of each time step
+        """
+        output = self.get_output()
+        parameters = SWMM_TIME_SERIES_PARAMETERS[swmm_type]
+        times = output.times()
+        for obj_id in output.node_ids if swmm_type == "node" else output.link_ids:
+            values = output.time_series(obj_id, parameters)
+            for time, row in zip(times, values):
+                data = {"id": obj_id, "time": time}
+                data.update(zip(parameters, map(float, row)))
+                yield data
+
     def import_summary(self, sim_description):
         """
         Import the summary results from an SWMM report file
@@ -844,37 +1454,77 @@ class QgepSwmm:
         """
 
         ndata = len(data)
-        # Loop over each line of the node summary
-        counter = 0
-        for ws in data:
-            counter += 1
+        if ndata == 0:
+            return
+
+        # The whole summary is recorded in a single transaction
+        cur = self.con.cursor()
+        try:
             if obj_type == "node":
-                self.feedback_set_progress(counter * 50 / ndata)
-                mp_obj_id = self.create_measuring_point_node(ws["id"], sim_description)
+                measuring_points = self.create_measuring_points_node(
+                    cur, [ws["id"] for ws in data], sim_description
+                )
             else:
-                self.feedback_set_progress(50 + counter * 50 / ndata)
-                mp_obj_id = self.create_measuring_point_link(ws["id"], sim_description)
-            if mp_obj_id:
-                self.create_measuring_device(mp_obj_id)
+                measuring_points = self.create_measuring_points_link(
+                    cur, [ws["id"] for ws in data], sim_description
+                )
+            self.create_measuring_devices(cur, measuring_points.values())
+            series = self.create_measurement_series_batch(
+                cur,
+                [
+                    (
+                        measuring_points[ws["id"]],
+                        k,
+                        SWMM_SUMMARY_PARAMETERS[k]["dimension"],
+                    )
+                    for ws in data
+                    if ws["id"] in measuring_points
+                    for k in ws.keys()
+                    if k in SWMM_SUMMARY_PARAMETERS.keys()
+                    and SWMM_SUMMARY_PARAMETERS[k]["recorded"]
+                ],
+            )
+            self.create_measurement_results_table(cur)
+
+            rows = io.StringIO()
+            # Loop over each line of the node summary
+            counter = 0
+            for ws in data:
+                counter += 1
+                if obj_type == "node":
+                    self.feedback_set_progress(counter * 50 / ndata)
+                else:
+                    self.feedback_set_progress(50 + counter * 50 / ndata)
+                mp_obj_id = measuring_points.get(ws["id"])
+                if mp_obj_id is None:
+                    continue
                 delta = timedelta(
                     days=int(ws["time_max_day"]),
                     hours=int(ws["time_max_time"].split(":")[0]),
                     minutes=int(ws["time_max_time"].split(":")[1]),
                 )
+                time = (simulation_start_date + delta).isoformat()
                 for k in ws.keys():
-                    if k in SWMM_SUMMARY_PARAMETERS.keys():
-                        if SWMM_SUMMARY_PARAMETERS[k]["recorded"]:
-                            ms_obj_id = self.create_measurement_series(
-                                mp_obj_id, k, SWMM_SUMMARY_PARAMETERS[k]["dimension"]
-                            )
-                            time = (simulation_start_date + delta).isoformat()
-                            self.create_measurement_result(
-                                ms_obj_id,
-                                SWMM_SUMMARY_PARAMETERS[k]["qgep_measurement_type"],
-                                measuring_duration,
-                                time,
-                                ws[k],
-                            )
+                    ms_obj_id = series.get((mp_obj_id, k))
+                    if ms_obj_id is None:
+                        continue
+                    rows.write(
+                        self.format_measurement_result(
+                            ms_obj_id,
+                            SWMM_SUMMARY_PARAMETERS[k]["qgep_measurement_type"],
+                            measuring_duration,
+                            time,
+                            ws[k],
+                        )
+                    )
+            self.copy_measurement_results(cur, rows)
+            self.merge_measurement_results(cur)
+            self.con.commit()
+        except psycopg2.Error as e:
+            self.con.rollback()
+            self.feedback_push("error", str(e))
+        finally:
+            del cur
         return
 
     def populate_attribute(self, data, table_name, attribute_name, swmm_attribute):
@@ -929,345 +1579,243 @@ class QgepSwmm:
 
         return
 
-    def create_measuring_point_node(self, node_obj_id, sim_description):
+    def create_measuring_points_node(self, cur, node_obj_ids, sim_description):
 
         """
-        For a node creates a measuring point or get its id.
+        For many nodes creates the missing measuring points and get their ids.
 
         Parameters:
-        node_obj_id (string): wastewater node object ID
+        cur (cursor): cursor of the import transaction
+        node_obj_ids (list): wastewater node object IDs
         sim_description (string): name of the simulation
 
         Returns:
-        me_obj_id: measuring point object ID
+        dictionary: measuring point object ID by wastewater node object ID
 
         """
 
-        # Connects to service and get data and attributes from tableName
-        cur = self.con.cursor()
-
-        # Test if the measuring point exists
-        sql = """
-        SELECT mp.obj_id
-        FROM qgep_od.measuring_point mp
-        JOIN qgep_od.wastewater_structure ws on mp.fk_wastewater_structure = ws.obj_id
-        WHERE ws.fk_main_wastewater_node = '{node_obj_id}'
-        AND mp.remark = '{sim_description}'
-        """.format(
-            sim_description=sim_description, node_obj_id=node_obj_id
+        return self.create_measuring_points(
+            cur,
+            """
+            SELECT o.obj_id, ws.obj_id AS ws_obj_id
+            FROM o
+            JOIN qgep_od.wastewater_structure ws ON ws.fk_main_wastewater_node = o.obj_id
+            """,
+            node_obj_ids,
+            sim_description,
         )
-        cur.execute(sql)
-        res = cur.fetchone()
 
-        if res is None:
-            # Measuring point doesnt exists, must be created
-            # 4594 = technical purpose [TO VALIDATE]
-            sql = """
-            INSERT INTO qgep_od.measuring_point
-            (damming_device, identifier, kind,
-            purpose, remark, fk_wastewater_structure)
-            SELECT 5721, NULL, '{MEASURING_POINT_KIND}', 4594,
-            '{sim_description}', ws.obj_id
-            FROM qgep_od.wastewater_structure ws
-            WHERE fk_main_wastewater_node = '{node_obj_id}'
-            RETURNING obj_id
-            """.format(
-                MEASURING_POINT_KIND=MEASURING_POINT_KIND,
-                node_obj_id=node_obj_id,
-                sim_description=sim_description,
-            )
-            try:
-                cur.execute(sql)
-            except psycopg2.ProgrammingError:
-                self.feedback_push(
-                    "error", "Error while excecuting: {sql}".format(sql=sql)
-                )
-                self.feedback_push("error", str(psycopg2.ProgrammingError))
-                return None, None
-            res = cur.fetchone()
-            if res is None:
-                mp_obj_id = None
-            else:
-                mp_obj_id = res[0]
-                self.con.commit()
-            del cur
-        else:
-            mp_obj_id = res[0]
-        return mp_obj_id
-
-    def create_measuring_point_link(self, reach_obj_id, sim_description):
+    def create_measuring_points_link(self, cur, reach_obj_ids, sim_description):
 
         """
-        For a node creates a measuring point or get its id.
+        For many links creates the missing measuring points and get their ids.
 
         Parameters:
-        reach_obj_id (string): reach object ID
+        cur (cursor): cursor of the import transaction
+        reach_obj_ids (list): reach object IDs
         sim_description (string): name of the simulation
 
         Returns:
-        me_obj_id: measuring point object ID
+        dictionary: measuring point object ID by reach object ID
 
         """
 
-        # Connects to service and get data and attributes from tableName
-        cur = self.con.cursor()
-
-        # Test if the measuring point exists
-        sql = """
-        SELECT mp.obj_id
-        FROM qgep_od.measuring_point mp
-        JOIN qgep_od.wastewater_networkelement ne ON
-        ne.fk_wastewater_structure = mp.fk_wastewater_structure
-        WHERE ne.obj_id = '{reach_obj_id}'
-        AND mp.remark = '{sim_description}'
-        """.format(
-            sim_description=sim_description, reach_obj_id=reach_obj_id
+        return self.create_measuring_points(
+            cur,
+            """
+            SELECT o.obj_id, ne.fk_wastewater_structure AS ws_obj_id
+            FROM o
+            JOIN qgep_od.wastewater_networkelement ne ON ne.obj_id = o.obj_id
+            WHERE ne.fk_wastewater_structure IS NOT NULL
+            """,
+            reach_obj_ids,
+            sim_description,
         )
-        cur.execute(sql)
-        res = cur.fetchone()
-
-        if res is None:
-            # Measuring point doesnt exists, must be created
-            # 4594 = technical purpose [TO VALIDATE]
-            sql = """
-            INSERT INTO qgep_od.measuring_point
-            (damming_device, identifier, kind, purpose, remark,
-            fk_wastewater_structure)
-            SELECT 5721, NULL, '{MEASURING_POINT_KIND}', 4594,
-            '{sim_description}', ne.fk_wastewater_structure
-            FROM qgep_od.wastewater_networkelement ne
-            WHERE ne.obj_id = '{reach_obj_id}'
-            RETURNING obj_id
-            """.format(
-                MEASURING_POINT_KIND=MEASURING_POINT_KIND,
-                sim_description=sim_description,
-                reach_obj_id=reach_obj_id,
-            )
-            try:
-                cur.execute(sql)
-            except psycopg2.ProgrammingError:
-                self.feedback_push(
-                    "error", "Error while excecuting: {sql}".format(sql=sql)
-                )
-                self.feedback_push("error", str(psycopg2.ProgrammingError))
-                return None
-            res = cur.fetchone()
-            mp_obj_id = res[0]
-            self.con.commit()
-            del cur
-        else:
-            mp_obj_id = res[0]
-        return mp_obj_id
 
-    def create_measuring_device(self, mp_obj_id):
+    def create_measuring_points(self, cur, structure_sql, obj_ids, sim_description):
 
         """
-        For a measuring point creates a measuring device or get its id.
+        Creates the missing measuring points of the wastewater structures of many
+        objects in a single statement and get their ids.
 
         Parameters:
-        mp_obj_id (string): measuring point object ID
+        cur (cursor): cursor of the import transaction
+        structure_sql (string): query of the (obj_id, ws_obj_id) of the objects in o
+        obj_ids (list): object IDs
+        sim_description (string): name of the simulation
 
         Returns:
-        md_obj_id: measuring device object ID
+        dictionary: measuring point object ID by object ID
 
         """
 
-        cur = self.con.cursor()
+        obj_ids = list(obj_ids)
+        if not obj_ids:
+            return {}
 
-        # Test if the measuring device exists
+        # Rows inserted in a CTE are not visible to the rest of the statement,
+        # the existing and the inserted measuring points are merged instead
+        # 4594 = technical purpose [TO VALIDATE]
         sql = """
-        SELECT md.obj_id
-        FROM qgep_od.measuring_device md
-        WHERE md.fk_measuring_point = '{mp_obj_id}'
-        AND remark = '{MEASURING_DEVICE_REMARK}'
+        WITH o AS (
+            SELECT DISTINCT unnest(%(obj_ids)s::text[]) AS obj_id
+        ),
+        structure AS (
+            {structure_sql}
+        ),
+        inserted AS (
+            INSERT INTO qgep_od.measuring_point
+            (damming_device, identifier, kind, purpose, remark, fk_wastewater_structure)
+            SELECT DISTINCT 5721, NULL, %(kind)s, 4594, %(remark)s, s.ws_obj_id
+            FROM structure s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM qgep_od.measuring_point mp
+                WHERE mp.fk_wastewater_structure = s.ws_obj_id
+                AND mp.remark = %(remark)s
+            )
+            RETURNING obj_id, fk_wastewater_structure
+        ),
+        measuring_point AS (
+            SELECT mp.obj_id, mp.fk_wastewater_structure
+            FROM qgep_od.measuring_point mp
+            WHERE mp.remark = %(remark)s
+            UNION ALL
+            SELECT obj_id, fk_wastewater_structure FROM inserted
+        )
+        SELECT DISTINCT ON (s.obj_id) s.obj_id, mp.obj_id
+        FROM structure s
+        JOIN measuring_point mp ON mp.fk_wastewater_structure = s.ws_obj_id
+        ORDER BY s.obj_id, mp.obj_id
         """.format(
-            MEASURING_DEVICE_REMARK=MEASURING_DEVICE_REMARK, mp_obj_id=mp_obj_id
+            structure_sql=structure_sql
         )
-        cur.execute(sql)
-        res = cur.fetchone()
-
-        if res is None:
-            # Measuring device doesnt exists, must be created
-            sql = """
-            INSERT INTO qgep_od.measuring_device
-            (kind, remark, fk_measuring_point)
-            VALUES
-            (5702, '{MEASURING_DEVICE_REMARK}','{mp_obj_id}')
-            RETURNING obj_id
-            """.format(
-                MEASURING_DEVICE_REMARK=MEASURING_DEVICE_REMARK, mp_obj_id=mp_obj_id
-            )
-            try:
-                cur.execute(sql)
-            except psycopg2.ProgrammingError:
-                self.feedback_push(
-                    "error", "Error while excecuting: {sql}".format(sql=sql)
-                )
-                self.feedback_push("error", str(psycopg2.ProgrammingError))
-                return None, None
-            res = cur.fetchone()
-            if res is None:
-                mp_obj_id = None
-            else:
-                mp_obj_id = res[0]
-                self.con.commit()
-            del cur
-        else:
-            mp_obj_id = res[0]
-        return mp_obj_id
+        cur.execute(
+            sql,
+            {
+                "obj_ids": obj_ids,
+                "kind": MEASURING_POINT_KIND,
+                "remark": sim_description,
+            },
+        )
+        return dict(cur.fetchall())
 
-    def create_measurement_series(self, mp_obj_id, parameter_name, parameter_dimension):
+    def create_measuring_devices(self, cur, mp_obj_ids):
 
         """
-        Creates a measurement serie or get its id.
+        For many measuring points creates the missing measuring devices in a single
+        statement and get their ids.
 
         Parameters:
-        mp_obj_id (string): measurement point object ID
-        parameter_name (string): name of the parameter
-        parameter_dimension (string): dimension of the parameter
+        cur (cursor): cursor of the import transaction
+        mp_obj_ids (list): measuring point object IDs
 
         Returns:
-        mp_obj_id: measuring point object ID
+        dictionary: measuring device object ID by measuring point object ID
 
         """
 
-        # Connects to service
-        cur = self.con.cursor()
+        mp_obj_ids = list(set(mp_obj_ids))
+        if not mp_obj_ids:
+            return {}
 
-        # Test if the measurement serie exists
         sql = """
-        SELECT obj_id FROM qgep_od.measurement_series
-        WHERE remark = '{parameter_name}'
-        AND fk_measuring_point = '{mp_obj_id}'
-        """.format(
-            parameter_name=parameter_name, mp_obj_id=mp_obj_id
-        )
-        cur.execute(sql)
-        res = cur.fetchone()
-
-        if res is None:
-            # Measuring point doesnt exists, must be created
-            # 3217 = other [TO VALIDATE]
-            # No dimension, else we would need to create four measurements
-            # series l/s m/s m - [TO VALIDATE]
-            sql = """
-            INSERT INTO qgep_od.measurement_series
-            (identifier, dimension, kind, remark, fk_measuring_point)
-            VALUES
-            (null, '{parameter_dimension}', 3217,
-            '{parameter_name}', '{mp_obj_id}')
-            RETURNING obj_id
-            """.format(
-                parameter_dimension=parameter_dimension,
-                parameter_name=parameter_name,
-                mp_obj_id=mp_obj_id,
+        WITH mp AS (
+            SELECT unnest(%(mp_obj_ids)s::text[]) AS obj_id
+        ),
+        inserted AS (
+            INSERT INTO qgep_od.measuring_device (kind, remark, fk_measuring_point)
+            SELECT 5702, %(remark)s, mp.obj_id
+            FROM mp
+            WHERE NOT EXISTS (
+                SELECT 1 FROM qgep_od.measuring_device md
+                WHERE md.fk_measuring_point = mp.obj_id
+                AND md.remark = %(remark)s
             )
+            RETURNING obj_id, fk_measuring_point
+        ),
+        measuring_device AS (
+            SELECT md.obj_id, md.fk_measuring_point
+            FROM qgep_od.measuring_device md
+            JOIN mp ON mp.obj_id = md.fk_measuring_point
+            WHERE md.remark = %(remark)s
+            UNION ALL
+            SELECT obj_id, fk_measuring_point FROM inserted
+        )
+        SELECT DISTINCT ON (fk_measuring_point) fk_measuring_point, obj_id
+        FROM measuring_device
+        ORDER BY fk_measuring_point, obj_id
+        """
+        cur.execute(sql, {"mp_obj_ids": mp_obj_ids, "remark": MEASURING_DEVICE_REMARK})
+        return dict(cur.fetchall())
 
-            try:
-                cur.execute(sql)
-            except psycopg2.ProgrammingError:
-                self.feedback_push(
-                    "error", "Error while excecuting: {sql}".format(sql=sql)
-                )
-                self.feedback_push("error", str(psycopg2.ProgrammingError))
-                return None
-            ms_obj_id = cur.fetchone()[0]
-            self.con.commit()
-        else:
-            ms_obj_id = res[0]
-        del cur
-        return ms_obj_id
-
-    def create_measurement_result(
-        self, ms_obj_id, measurement_type, measuring_duration, time, value
-    ):
+    def create_measurement_series_batch(self, cur, series):
 
         """
-        Creates a measurement result or update it.
+        Creates the missing measurement series in a single statement and get their ids.
 
         Parameters:
-        ms_obj_id (string): measurement serie object ID
-        measurement_type (integer): type of measurement 5733=flow, 5734=level, 5732=other
-        measuring_duration (integer): Time step of the simulation in seconds
-        time (string): timestamp of the recorded result
-        value (float): value of the measurement
+        cur (cursor): cursor of the import transaction
+        series (list): (measuring point object ID, parameter name, parameter dimension)
 
         Returns:
-        mr_obj_id: measurement result object ID
+        dictionary: measurement serie object ID by
+                    (measuring point object ID, parameter name)
 
         """
 
-        # Connects to service
-        cur = self.con.cursor()
+        # The first dimension given for a serie is kept
+        series_by_key = {}
+        for mp_obj_id, parameter_name, parameter_dimension in series:
+            series_by_key.setdefault((mp_obj_id, parameter_name), parameter_dimension)
+        if not series_by_key:
+            return {}
 
-        # Test if the measurement result exists (same measurement serie, same time, same type)
+        # 3217 = other [TO VALIDATE]
         sql = """
-        SELECT obj_id FROM qgep_od.measurement_result
-        WHERE fk_measurement_series = '{ms_obj_id}'
-        AND time = '{time}'
-        AND measurement_type = {measurement_type}
-        """.format(
-            ms_obj_id=ms_obj_id, time=time, measurement_type=measurement_type
-        )
-        try:
-            cur.execute(sql)
-        except psycopg2.ProgrammingError:
-            self.feedback_push("error", "Error while excecuting: {sql}".format(sql=sql))
-            self.feedback_push("error", (str(psycopg2.ProgrammingError)))
-            return None
-        res = cur.fetchone()
-
-        if res is None:
-            # Measurement result doesnt exists, must be created
-
-            sql = """
-            INSERT INTO qgep_od.measurement_result
-            (identifier, measurement_type, measuring_duration,
-            time, value, fk_measurement_series)
-            VALUES
-            (null, {measurement_type}, {measuring_duration}, '{time}', {value}, '{ms_obj_id}')
-            RETURNING obj_id
-            """.format(
-                measurement_type=measurement_type,
-                measuring_duration=measuring_duration,
-                time=time,
-                value=value,
-                ms_obj_id=ms_obj_id,
-            )
-
-            try:
-                cur.execute(sql)
-            except psycopg2.ProgrammingError:
-                self.feedback_push(
-                    "error", "Error while excecuting: {sql}".format(sql=sql)
-                )
-                self.feedback_push("error", (str(psycopg2.ProgrammingError)))
-                return None
-            mr_obj_id = cur.fetchone()[0]
-            self.con.commit()
-        else:
-            mr_obj_id = res[0]
-            # Measurement result exists, must be updated
-            sql = """
-            UPDATE qgep_od.measurement_result
-            SET measuring_duration={measuring_duration}, value={value}
-            WHERE obj_id = '{mr_obj_id}'
-            RETURNING obj_id
-            """.format(
-                measuring_duration=measuring_duration, value=value, mr_obj_id=mr_obj_id
+        WITH s AS (
+            SELECT *
+            FROM unnest(
+                %(mp_obj_ids)s::text[],
+                %(parameter_names)s::text[],
+                %(parameter_dimensions)s::text[]
+            ) AS s(mp_obj_id, parameter_name, parameter_dimension)
+        ),
+        inserted AS (
+            INSERT INTO qgep_od.measurement_series
+            (identifier, dimension, kind, remark, fk_measuring_point)
+            SELECT NULL, s.parameter_dimension, 3217, s.parameter_name, s.mp_obj_id
+            FROM s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM qgep_od.measurement_series ms
+                WHERE ms.fk_measuring_point = s.mp_obj_id
+                AND ms.remark = s.parameter_name
             )
-            try:
-                cur.execute(sql)
-            except psycopg2.ProgrammingError:
-                self.feedback_push(
-                    "error", "Error while excecuting: {sql}".format(sql=sql)
-                )
-                self.feedback_push("error", (str(psycopg2.ProgrammingError)))
-                return None
-            mr_obj_id = cur.fetchone()[0]
-            self.con.commit()
-        del cur
-        return mr_obj_id
+            RETURNING obj_id, fk_measuring_point, remark
+        ),
+        measurement_series AS (
+            SELECT ms.obj_id, ms.fk_measuring_point, ms.remark
+            FROM qgep_od.measurement_series ms
+            JOIN s ON s.mp_obj_id = ms.fk_measuring_point
+            AND s.parameter_name = ms.remark
+            UNION ALL
+            SELECT obj_id, fk_measuring_point, remark FROM inserted
+        )
+        SELECT DISTINCT ON (fk_measuring_point, remark) fk_measuring_point, remark, obj_id
+        FROM measurement_series
+        ORDER BY fk_measuring_point, remark, obj_id
+        """
+        cur.execute(
+            sql,
+            {
+                "mp_obj_ids": [k[0] for k in series_by_key],
+                "parameter_names": [k[1] for k in series_by_key],
+                "parameter_dimensions": list(series_by_key.values()),
+            },
+        )
+        return {
+            (mp_obj_id, parameter_name): ms_obj_id
+            for mp_obj_id, parameter_name, ms_obj_id in cur.fetchall()
+        }
 
     def disable_reach_trigger(self):
 
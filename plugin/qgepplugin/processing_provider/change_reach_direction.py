@@ -19,7 +19,14 @@
  ***************************************************************************/
 """
 
-from qgis.core import QgsProcessingAlgorithm, QgsProcessingParameterVectorLayer
+import psycopg2
+from qgis.core import (
+    QgsDataSourceUri,
+    QgsFeatureRequest,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterVectorLayer,
+)
 
 from .qgep_algorithm import QgepAlgorithm
 
@@ -66,26 +73,52 @@ class ChangeReachDirection(QgepAlgorithm):
         """Here is where the processing itself takes place."""
         reach_layer = self.parameterAsVectorLayer(parameters, self.REACH_LAYER, context)
 
-        reach_layer.startEditing()
-
-        # feature_count = 0
-
-        iterator = reach_layer.getSelectedFeatures()
-        # feature_count = reach_layer.selectedFeatureCount()
+        selected_obj_ids = [
+            feature["obj_id"]
+            for feature in reach_layer.getSelectedFeatures(
+                QgsFeatureRequest()
+                .setFlags(QgsFeatureRequest.NoGeometry)
+                .setSubsetOfAttributes(["obj_id"], reach_layer.fields())
+            )
+        ]
+        if not selected_obj_ids:
+            feedback.pushInfo(self.tr("No reach selected"))
+            return {}
 
-        # Loop through relevant reaches
-        reach_layer.beginEditCommand("change directions")
         transaction = reach_layer.dataProvider().transaction()
-        # if not transaction:
-        #    raise Exception: if there is no transaction, complain to the user!
-        selected_obj_ids = [feature["obj_id"] for feature in iterator]
-        transaction.executeSql(
-            "SELECT qgep_od.reach_direction_change('{{{obj_ids}}}');".format(
-                obj_ids=",".join(selected_obj_ids)
-            ),
-            True,
-        )
-        reach_layer.endEditCommand()
+        if transaction:
+            reach_layer.startEditing()
+            reach_layer.beginEditCommand("change directions")
+            # The transaction does not support bound parameters, pass the obj_ids as a
+            # quoted array literal
+            success, error = transaction.executeSql(
+                "SELECT qgep_od.reach_direction_change(ARRAY[{obj_ids}]::text[]);".format(
+                    obj_ids=",".join(
+                        "'{}'".format(obj_id.replace("'", "''"))
+                        for obj_id in selected_obj_ids
+                    )
+                ),
+                True,
+            )
+            reach_layer.endEditCommand()
+            if not success:
+                raise QgsProcessingException(error)
+        else:
+            connection = psycopg2.connect(
+                QgsDataSourceUri(reach_layer.source()).connectionInfo(True)
+            )
+            try:
+                with connection:
+                    connection.cursor().execute(
+                        "SELECT qgep_od.reach_direction_change(%s)",
+                        (selected_obj_ids,),
+                    )
+            except psycopg2.Error as e:
+                raise QgsProcessingException(str(e))
+            finally:
+                connection.close()
+            reach_layer.reload()
+
         feedback.setProgress(100)
 
         return {}
@@ -19,9 +19,10 @@
  ***************************************************************************/
 """
 
-import qgis.utils as qgis_utils
+import networkx as nx
 from PyQt5.QtCore import QVariant
 from qgis.core import (
+    NULL,
     QgsExpression,
     QgsFeature,
     QgsFeatureRequest,
@@ -29,13 +30,13 @@ from qgis.core import (
     QgsField,
     QgsFields,
     QgsProcessing,
-    QgsProcessingAlgorithm,
     QgsProcessingContext,
     QgsProcessingException,
     QgsProcessingFeedback,
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterField,
     QgsProcessingParameterVectorLayer,
+    QgsVectorLayerFeatureSource,
     QgsWkbTypes,
 )
 
@@ -49,15 +50,56 @@ __copyright__ = "(C) 2018 by OPENGIS.ch"
 
 __revision__ = "$Format:%H$"
 
+FILTER_BATCH_SIZE = 1000
+
+
+def load_flow_times(source, fields, fk_reach_field, flow_time_field, reach_obj_ids):
+    """
+    Loads the flow times of a set of reaches. The reaches are requested in batches
+    with an IN filter, which is compiled and evaluated by the data provider.
+    :param source: The flow times layer or a feature source of it
+    :param fields: The fields of the flow times layer
+    :return: A dict of flow time by reach obj_id
+    """
+    request = QgsFeatureRequest()
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes([fk_reach_field, flow_time_field], fields)
+
+    flow_times = dict()
+    reach_obj_ids = list(reach_obj_ids)
+    for i in range(0, len(reach_obj_ids), FILTER_BATCH_SIZE):
+        request.setFilterExpression(
+            "{} IN ({})".format(
+                QgsExpression.quotedColumnRef(fk_reach_field),
+                ",".join(
+                    QgsExpression.quotedValue(obj_id)
+                    for obj_id in reach_obj_ids[i : i + FILTER_BATCH_SIZE]
+                ),
+            )
+        )
+        for flow_time_feature in source.getFeatures(request):
+            # Like a single lookup, the first flow time found for a reach is used
+            flow_times.setdefault(
+                flow_time_feature[fk_reach_field], flow_time_feature[flow_time_field]
+            )
+    return flow_times
+
 
 class FlowTimesAlgorithm(QgepAlgorithm):
-    """"""
+    """
+    Accumulates flow times downstream of every selected reach.
+
+    The network graph is built from the segment layer by the algorithm itself, the
+    layers are only accessed through feature sources, so it runs in a background
+    thread and does not depend on the network of the plugin.
+    """
 
     DISTANCE = "DISTANCE"
     REACH_LAYER = "REACH_LAYER"
     FLOWTIMES_LAYER = "FLOWTIMES_LAYER"
     FK_REACH_FIELD = "FK_REACH_FIELD"
     FLOWTIMES_FIELD = "FLOWTIMES_FIELD"
+    SEGMENT_LAYER = "SEGMENT_LAYER"
     OUTPUT = "OUTPUT"
 
     def name(self):
@@ -66,8 +108,15 @@ class FlowTimesAlgorithm(QgepAlgorithm):
     def displayName(self):
         return self.tr("Flow times downstream")
 
-    def flags(self):
-        return super().flags() | QgsProcessingAlgorithm.FlagNoThreading
+    def shortHelpString(self):
+        return self.tr(
+            """
+        Accumulates the flow times downstream of every selected reach.
+        One feature is created per start reach and downstream reach segment, with the
+        flow time at its end. Where paths join, the shortest flow time is used.
+        The accumulation stops at reaches without a flow time.
+        """
+        )
 
     def initAlgorithm(self, config=None):
         """Here we define the inputs and output of the algorithm, along
@@ -75,7 +124,9 @@ class FlowTimesAlgorithm(QgepAlgorithm):
         """
 
         # The parameters
-        description = self.tr("Reach layer")
+        description = self.tr(
+            "Reach layer (the selected reaches are the start reaches)"
+        )
         self.addParameter(
             QgsProcessingParameterVectorLayer(
                 self.REACH_LAYER,
@@ -108,24 +159,68 @@ class FlowTimesAlgorithm(QgepAlgorithm):
                 type=QgsProcessingParameterField.Numeric,
             )
         )
+        description = self.tr("Network segment layer")
+        self.addParameter(
+            QgsProcessingParameterVectorLayer(
+                self.SEGMENT_LAYER,
+                description=description,
+                types=[QgsProcessing.TypeVectorLine],
+                defaultValue="vw_network_segment",
+            )
+        )
 
         self.addParameter(
             QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr("Flow times"))
         )
 
+    def prepareAlgorithm(self, parameters, context, feedback):
+        """
+        Runs in the main thread: reads the selection and creates thread safe
+        feature sources of the layers.
+        """
+        reach_layer = self.parameterAsVectorLayer(parameters, self.REACH_LAYER, context)
+        flow_layer = self.parameterAsVectorLayer(
+            parameters, self.FLOWTIMES_LAYER, context
+        )
+        segment_layer = self.parameterAsVectorLayer(
+            parameters, self.SEGMENT_LAYER, context
+        )
+        if reach_layer is None or reach_layer.selectedFeatureCount() == 0:
+            raise QgsProcessingException(
+                self.invalidSourceError(parameters, self.REACH_LAYER)
+            )
+        if flow_layer is None:
+            raise QgsProcessingException(
+                self.invalidSourceError(parameters, self.FLOWTIMES_LAYER)
+            )
+        if segment_layer is None:
+            raise QgsProcessingException(
+                self.invalidSourceError(parameters, self.SEGMENT_LAYER)
+            )
+
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(["obj_id"], reach_layer.fields())
+        self.start_reach_obj_ids = [
+            reach_feature["obj_id"]
+            for reach_feature in reach_layer.getSelectedFeatures(request)
+        ]
+        self.crs = reach_layer.sourceCrs()
+
+        self.flow_source = QgsVectorLayerFeatureSource(flow_layer)
+        self.flow_fields = flow_layer.fields()
+        self.segment_source = QgsVectorLayerFeatureSource(segment_layer)
+        self.segment_fields = segment_layer.fields()
+        return True
+
     def processAlgorithm(
         self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback
     ):
         """Here is where the processing itself takes place."""
 
         feedback.setProgress(0)
-        na = qgis_utils.plugins["qgepplugin"].network_analyzer
 
         # init params
-        reach_layer = self.parameterAsVectorLayer(parameters, self.REACH_LAYER, context)
-        flow_layer = self.parameterAsVectorLayer(
-            parameters, self.FLOWTIMES_LAYER, context
-        )
         fk_reach_field = self.parameterAsFields(
             parameters, self.FK_REACH_FIELD, context
         )[0]
@@ -136,91 +231,149 @@ class FlowTimesAlgorithm(QgepAlgorithm):
         # create feature sink
         fields = QgsFields()
         fields.append(QgsField("flow_time", QVariant.Double))
+        fields.append(QgsField("start_reach", QVariant.String))
         (sink, dest_id) = self.parameterAsSink(
             parameters,
             self.OUTPUT,
             context,
             fields,
             QgsWkbTypes.LineString,
-            reach_layer.sourceCrs(),
+            self.crs,
         )
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
-        # get selected reach
-        iterator = reach_layer.getSelectedFeatures()
-        feature_count = reach_layer.selectedFeatureCount()
-        if feature_count != 1:
-            raise QgsProcessingException(
-                self.invalidSourceError(parameters, self.REACH_LAYER)
-            )
-        reach_feature = QgsFeature()
-        iterator.nextFeature(reach_feature)
-        assert reach_feature.isValid()
-        qgep_reach_obj_id = reach_feature.attribute("obj_id")
-
-        # get top node
-        reach_features = na.getFeaturesByAttr(
-            na.getEdgeLayer(), "obj_id", [qgep_reach_obj_id]
-        ).asDict()
-        assert len(reach_features) > 0
-        from_pos = 1
-        top_node = None
-        for fid, reach_feature in reach_features.items():
-            if from_pos > reach_feature.attribute("from_pos"):
-                top_node = reach_feature.attribute("from_obj_id_interpolate")
-                from_pos = reach_feature.attribute("from_pos")
-        assert top_node is not None
-        nodes = na.getFeaturesByAttr(na.getNodeLayer(), "obj_id", [top_node]).asDict()
-        assert len(nodes) == 1
-        top_node_id = next(iter(nodes.values())).id()
-
         # create graph
-        _, edges = na.getTree(top_node_id)
-        feedback.setProgress(50)
-        cache_edge_features = na.getFeaturesById(
-            na.getEdgeLayer(), [edge[2]["feature"] for edge in edges]
-        ).asDict()
-
-        # join and accumulate flow times
-        i = -1
-        flow_time = 0.0
-        while True:
-            i += 1
-            feedback.setProgress(50 + i / len(edges) * 50)
-            if i >= len(edges):
-                break
-
-            edge = edges[i]
-            edge_feature = cache_edge_features[edge[2]["feature"]]
-            # TODO: if top_pos != 1 => merge
-            if edge_feature.attribute("type") != "reach":
-                continue
-            rate = edge_feature.attribute("to_pos") - edge_feature.attribute("from_pos")
-            assert 0 < rate <= 1
+        feedback.setProgressText(self.tr("Creating network graph"))
+        graph = nx.DiGraph()
+        reach_segments = dict()
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(
+            [
+                "obj_id",
+                "type",
+                "from_obj_id",
+                "to_obj_id",
+                "from_pos",
+                "to_pos",
+                "length_calc",
+                "length_full",
+            ],
+            self.segment_fields,
+        )
+        for segment in self.segment_source.getFeatures(request):
+            if feedback.isCanceled():
+                return {}
+            graph.add_edge(
+                segment["from_obj_id"],
+                segment["to_obj_id"],
+                feature=segment.id(),
+                obj_id=segment["obj_id"],
+                type=segment["type"],
+                rate=self.segment_rate(segment),
+            )
+            if segment["type"] == "reach":
+                reach_segments.setdefault(segment["obj_id"], []).append(
+                    (segment["from_obj_id"], segment["to_obj_id"])
+                )
+        feedback.setProgress(20)
 
-            expression = QgsExpression(
-                "{fk_reach} = '{obj_id}'".format(
-                    fk_reach=fk_reach_field, obj_id=edge_feature["obj_id"]
+        # The top node of a reach is the start of its first segment
+        start_nodes = dict()
+        for obj_id in self.start_reach_obj_ids:
+            segments = reach_segments.get(obj_id)
+            if not segments:
+                feedback.reportError(
+                    self.tr("Reach {} is not part of the network").format(obj_id)
                 )
+                continue
+            to_nodes = {to_node for _, to_node in segments}
+            start_nodes[obj_id] = next(
+                (from_node for from_node, _ in segments if from_node not in to_nodes),
+                segments[0][0],
             )
-            print(expression.expression())
-            request = QgsFeatureRequest(expression)
-            flow_time_feature = next(flow_layer.getFeatures(request))
 
-            if not flow_time_feature.isValid():
-                break
+        # load the flow times of all reaches downstream of any start reach
+        downstream_nodes = set(start_nodes.values())
+        for node in start_nodes.values():
+            downstream_nodes.update(nx.descendants(graph, node))
+        reach_obj_ids = {
+            data["obj_id"]
+            for _, _, data in graph.edges(downstream_nodes, data=True)
+            if data["type"] == "reach"
+        }
+        flow_times = load_flow_times(
+            self.flow_source,
+            self.flow_fields,
+            fk_reach_field,
+            flow_time_field,
+            reach_obj_ids,
+        )
+        feedback.setProgress(40)
 
-            flow_time += rate * flow_time_feature.attribute(flow_time_field)
+        # Reaches without flow time stop the accumulation
+        for _, _, data in graph.edges(downstream_nodes, data=True):
+            if data["type"] != "reach":
+                data["flow_time"] = 0
+            elif flow_times.get(data["obj_id"], NULL) != NULL:
+                data["flow_time"] = data["rate"] * flow_times[data["obj_id"]]
+            else:
+                data["flow_time"] = None
 
+        # accumulate flow times, one traversal per start reach
+        feedback.setProgressText(self.tr("Accumulating flow times"))
+        results = []
+        for i, (obj_id, start_node) in enumerate(start_nodes.items()):
+            if feedback.isCanceled():
+                return {}
+            arrival_times = nx.single_source_dijkstra_path_length(
+                graph, start_node, weight=lambda u, v, data: data["flow_time"]
+            )
+            for u, v, data in graph.edges(arrival_times.keys(), data=True):
+                if data["type"] == "reach" and data["flow_time"] is not None:
+                    results.append(
+                        (obj_id, data["feature"], arrival_times[u] + data["flow_time"])
+                    )
+            feedback.setProgress(40 + (i + 1) / len(start_nodes) * 30)
+
+        # write the features
+        feedback.setProgressText(self.tr("Writing flow times"))
+        geometries = self.segment_geometries({result[1] for result in results})
+        for i, (obj_id, feature_id, flow_time) in enumerate(results):
+            if feedback.isCanceled():
+                break
             sf = QgsFeature()
             sf.setFields(fields)
             sf.setAttribute("flow_time", flow_time)
-            sf.setGeometry(edge_feature.geometry())
+            sf.setAttribute("start_reach", obj_id)
+            sf.setGeometry(geometries.get(feature_id))
             sink.addFeature(sf, QgsFeatureSink.FastInsert)
-
-        # f.setAttributes(attrs)
-        # sink.addFeature(f, QgsFeatureSink.FastInsert)
-        # feedback.setProgress(int(current * total))
+            feedback.setProgress(70 + (i + 1) / len(results) * 30)
 
         return {self.OUTPUT: dest_id}
+
+    @staticmethod
+    def segment_rate(segment):
+        """
+        The part of the reach a segment covers
+        """
+        if segment["length_full"] and segment["length_calc"] != NULL:
+            return min(segment["length_calc"] / segment["length_full"], 1)
+        return segment["to_pos"] - segment["from_pos"]
+
+    def segment_geometries(self, feature_ids):
+        """
+        Fetches the geometries of segments by feature id, one request per batch
+        :return: A dict of geometry by feature id
+        """
+        feature_ids = list(feature_ids)
+        geometries = dict()
+        for i in range(0, len(feature_ids), FILTER_BATCH_SIZE):
+            request = QgsFeatureRequest().setFilterFids(
+                feature_ids[i : i + FILTER_BATCH_SIZE]
+            )
+            request.setNoAttributes()
+            for segment in self.segment_source.getFeatures(request):
+                geometries[segment.id()] = segment.geometry()
+        return geometries
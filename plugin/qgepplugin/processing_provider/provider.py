@@ -35,6 +35,7 @@ from .swmm_create_input import SwmmCreateInputAlgorithm
 from .swmm_execute import SwmmExecuteAlgorithm
 from .swmm_extract_results import SwmmExtractResultsAlgorithm
 from .swmm_import_results import SwmmImportResultsAlgorithm
+from .swmm_run_scenarios import SwmmRunScenariosAlgorithm
 from .swmm_set_friction import SwmmSetFrictionAlgorithm
 
 __author__ = "Matthias Kuhn"
@@ -65,6 +66,7 @@ class QgepProcessingProvider(QgsProcessingProvider):
             SwmmExtractResultsAlgorithm(),
             SwmmImportResultsAlgorithm(),
             SwmmExecuteAlgorithm(),
+            SwmmRunScenariosAlgorithm(),
             SwmmSetFrictionAlgorithm(),
         ]
         try:
@@ -89,6 +91,7 @@ class QgepProcessingProvider(QgsProcessingProvider):
             SwmmExtractResultsAlgorithm(),
             SwmmImportResultsAlgorithm(),
             SwmmExecuteAlgorithm(),
+            SwmmRunScenariosAlgorithm(),
             SwmmSetFrictionAlgorithm(),
         ]
         try:
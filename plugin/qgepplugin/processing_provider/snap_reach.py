@@ -19,15 +19,23 @@
  ***************************************************************************/
 """
 
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import psycopg2
 from qgis.core import (
-    QgsExpression,
     QgsFeatureRequest,
     QgsGeometry,
     QgsPointXY,
+    QgsProcessingException,
     QgsProcessingParameterBoolean,
+    QgsProcessingParameterEnum,
     QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
     QgsProcessingParameterVectorLayer,
+    QgsVectorLayerFeatureSource,
 )
+from qgis.PyQt.QtCore import QThread
 
 from .qgep_algorithm import QgepAlgorithm
 
@@ -39,14 +47,57 @@ __copyright__ = "(C) 2017 by OPENGIS.ch"
 
 __revision__ = "$Format:%H$"
 
+BATCH_SIZE = 2000
+FROM_FK_FIELD = "rp_from_fk_wastewater_networkelement"
+TO_FK_FIELD = "rp_to_fk_wastewater_networkelement"
+
+
+def feature_ids_by_obj_id(source, fields):
+    """
+    Reads the obj_id of all features of a source, without geometries
+    :return: A dict of feature id by obj_id
+    """
+    request = QgsFeatureRequest()
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes(["obj_id"], fields)
+    return {feature["obj_id"]: feature.id() for feature in source.getFeatures(request)}
+
+
+def geometries_by_id(source, feature_ids):
+    """
+    Fetches the geometries of some features by their id, without attributes
+    :return: A dict of geometry by feature id
+    """
+    if not feature_ids:
+        return dict()
+    request = QgsFeatureRequest().setFilterFids(list(feature_ids))
+    request.setNoAttributes()
+    return {feature.id(): feature.geometry() for feature in source.getFeatures(request)}
+
 
 class SnapReachAlgorithm(QgepAlgorithm):
-    """"""
+    """
+    Snaps the start and end vertices of reaches to the wastewater nodes or reaches
+    they are connected to.
+
+    The layers are read through feature sources on the processing thread, feature
+    sources must not be iterated from several threads at once. The snapped
+    geometries are then calculated in parallel batches. They are written in the
+    main thread at the end: into the edit buffer if the reach layer is in edit
+    mode, otherwise directly to the data provider with a single
+    changeGeometryValues call.
+
+    In server execution mode, qgep_od.reach_snap snaps the reaches in the database
+    in a single set based query instead.
+    """
 
     DISTANCE = "DISTANCE"
     REACH_LAYER = "REACH_LAYER"
     WASTEWATER_NODE_LAYER = "WASTEWATER_NODE_LAYER"
     ONLY_SELECTED = "ONLY_SELECTED"
+    DRY_RUN = "DRY_RUN"
+    EXECUTION_MODE = "EXECUTION_MODE"
+    DATABASE = "DATABASE"
 
     def name(self):
         return self.tr("qgep_snap_rach")
@@ -93,131 +144,342 @@ class SnapReachAlgorithm(QgepAlgorithm):
                 ),
             )
         )
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.DRY_RUN,
+                description=self.tr(
+                    "Dry run, only report the reaches which would be snapped"
+                ),
+                defaultValue=False,
+            )
+        )
+        description = self.tr(
+            "Execution mode. On the server, the reaches are snapped in the database "
+            "with qgep_od.reach_snap, the edit buffer of the reach layer is bypassed "
+            "and the wastewater node layer is ignored. Reaches with circular arcs are "
+            "not snapped on the server."
+        )
+        self.addAdvancedParameter(
+            QgsProcessingParameterEnum(
+                self.EXECUTION_MODE,
+                description=description,
+                options=[self.tr("Client (QGIS)"), self.tr("Server (PostgreSQL)")],
+                defaultValue=0,
+            )
+        )
+        description = self.tr("Database (server execution mode only)")
+        self.addAdvancedParameter(
+            QgsProcessingParameterString(
+                self.DATABASE, description=description, defaultValue="pg_qgep"
+            )
+        )
 
-    def processAlgorithm(self, parameters, context, feedback):
-        """Here is where the processing itself takes place."""
-
-        reach_layer = self.parameterAsVectorLayer(parameters, self.REACH_LAYER, context)
+    def prepareAlgorithm(self, parameters, context, feedback):
+        """
+        Runs in the main thread: creates thread safe feature sources of the layers
+        and reads the selection.
+        """
+        self.reach_layer = self.parameterAsVectorLayer(
+            parameters, self.REACH_LAYER, context
+        )
         wastewater_node_layer = self.parameterAsVectorLayer(
             parameters, self.WASTEWATER_NODE_LAYER, context
         )
+        if self.reach_layer is None:
+            raise QgsProcessingException(
+                self.invalidSourceError(parameters, self.REACH_LAYER)
+            )
+        if wastewater_node_layer is None:
+            raise QgsProcessingException(
+                self.invalidSourceError(parameters, self.WASTEWATER_NODE_LAYER)
+            )
+
+        self.reach_source = QgsVectorLayerFeatureSource(self.reach_layer)
+        self.reach_fields = self.reach_layer.fields()
+        self.node_source = QgsVectorLayerFeatureSource(wastewater_node_layer)
+        self.node_fields = wastewater_node_layer.fields()
+
+        self.selected_ids = None
+        self.selected_obj_ids = None
+        if self.parameterAsBool(parameters, self.ONLY_SELECTED, context):
+            self.selected_ids = self.reach_layer.selectedFeatureIds()
+            self.selected_obj_ids = [
+                feature["obj_id"]
+                for feature in self.reach_layer.getSelectedFeatures(
+                    QgsFeatureRequest()
+                    .setFlags(QgsFeatureRequest.NoGeometry)
+                    .setSubsetOfAttributes(["obj_id"], self.reach_fields)
+                )
+            ]
+
+        self.dry_run = self.parameterAsBool(parameters, self.DRY_RUN, context)
+        self.server_side = (
+            self.parameterAsEnum(parameters, self.EXECUTION_MODE, context) == 1
+        )
+        self.snapped_geometries = dict()
+        # (obj_id, from distance, to distance) per snapped reach
+        self.snapped_reaches = list()
+        # obj_id of the reaches with arcs left untouched by the server
+        self.skipped_reaches = list()
+        return True
+
+    def processAlgorithm(self, parameters, context, feedback):
+        """Here is where the processing itself takes place."""
+
         distance = self.parameterAsDouble(parameters, self.DISTANCE, context)
-        only_selected = self.parameterAsBool(parameters, self.ONLY_SELECTED, context)
 
-        reach_layer.startEditing()
+        if self.server_side:
+            database = self.parameterAsString(parameters, self.DATABASE, context)
+            self.snapOnServer(database, distance, feedback)
+            return {}
 
-        feature_count = 0
-        if only_selected:
-            iterator = reach_layer.getSelectedFeatures()
-            feature_count = reach_layer.selectedFeatureCount()
+        # Lookups of all snapping targets, shared by all batches
+        feedback.setProgressText(self.tr("Indexing snapping targets"))
+        node_ids = feature_ids_by_obj_id(self.node_source, self.node_fields)
+        reach_ids = feature_ids_by_obj_id(self.reach_source, self.reach_fields)
+
+        request = QgsFeatureRequest()
+        request.setSubsetOfAttributes(
+            ["obj_id", FROM_FK_FIELD, TO_FK_FIELD], self.reach_fields
+        )
+        if self.selected_ids is not None:
+            request.setFilterFids(self.selected_ids)
+            feature_count = len(self.selected_ids)
         else:
-            iterator = reach_layer.getFeatures()
-            feature_count = reach_layer.featureCount()
+            feature_count = len(reach_ids)
 
-        # Loop through relevant reaches
-        reach_layer.beginEditCommand("Snap reaches to points")
-        try:
+        # Snapped geometries are calculated in parallel, batch by batch
+        feedback.setProgressText(self.tr("Snapping reaches"))
+        batch_count = max((feature_count + BATCH_SIZE - 1) // BATCH_SIZE, 1)
+        with ThreadPoolExecutor(max_workers=QThread.idealThreadCount()) as executor:
+            futures = list()
             reaches = list()
-            current_feature = 0
-            for reach in iterator:
-                reaches.append(reach)
-                # Batch processing: process blocks of 2000 reaches
-                if len(reaches) == 2000:
-                    self.processFeatures(
-                        reaches, reach_layer, wastewater_node_layer, distance
+            for reach in self.reach_source.getFeatures(request):
+                if feedback.isCanceled():
+                    break
+                reaches.append(
+                    (
+                        reach.id(),
+                        reach["obj_id"],
+                        reach.geometry(),
+                        reach[FROM_FK_FIELD],
+                        reach[TO_FK_FIELD],
+                    )
+                )
+                if len(reaches) == BATCH_SIZE:
+                    futures.append(
+                        self.submitBatch(
+                            executor, reaches, node_ids, reach_ids, distance
+                        )
                     )
                     reaches = list()
+            if reaches:
+                futures.append(
+                    self.submitBatch(executor, reaches, node_ids, reach_ids, distance)
+                )
+
+            for i, future in enumerate(as_completed(futures)):
+                snapped_geometries, snapped_reaches = future.result()
+                self.snapped_geometries.update(snapped_geometries)
+                self.snapped_reaches += snapped_reaches
+                feedback.setProgress((i + 1) * 100.0 / batch_count)
 
-                current_feature += 1
-                feedback.setProgress(current_feature * 100.0 / feature_count)
+        if feedback.isCanceled():
+            self.snapped_geometries = dict()
+            self.snapped_reaches = list()
+
+        return {}
 
-            self.processFeatures(reaches, reach_layer, wastewater_node_layer, distance)
-        except:  # NOQA
-            reach_layer.destroyEditCommand()
-            raise
-        reach_layer.endEditCommand()
+    def snapOnServer(self, database, distance, feedback):
+        """
+        Snaps the reaches with qgep_od.reach_snap on the database server
+        """
+        feedback.setProgressText(self.tr("Snapping reaches on the server"))
+        connection = psycopg2.connect(service=database)
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(
+                    "SELECT obj_id, from_distance, to_distance, skipped FROM qgep_od.reach_snap(%s, %s, %s)",
+                    (self.selected_obj_ids, distance, self.dry_run),
+                )
+            except psycopg2.Error as e:
+                raise QgsProcessingException(str(e))
+            for obj_id, from_distance, to_distance, skipped in cursor.fetchall():
+                if skipped:
+                    self.skipped_reaches.append(obj_id)
+                else:
+                    self.snapped_reaches.append((obj_id, from_distance, to_distance))
+            if feedback.isCanceled():
+                connection.rollback()
+                self.snapped_reaches = list()
+                self.skipped_reaches = list()
+            else:
+                connection.commit()
+        finally:
+            connection.close()
         feedback.setProgress(100)
 
+    def postProcessAlgorithm(self, context, feedback):
+        """
+        Runs in the main thread: reports and writes the snapped geometries
+        """
+        for obj_id in sorted(self.skipped_reaches):
+            feedback.pushWarning(
+                self.tr(
+                    "{}: not snapped on the server, the reach has circular arcs"
+                ).format(obj_id)
+            )
+
+        for obj_id, from_distance, to_distance in sorted(
+            self.snapped_reaches, key=lambda snapped_reach: snapped_reach[0]
+        ):
+            feedback.pushInfo(
+                self.tr("{}: start moved by {}, end moved by {}").format(
+                    obj_id,
+                    "-" if from_distance is None else round(from_distance, 3),
+                    "-" if to_distance is None else round(to_distance, 3),
+                )
+            )
+
+        if self.dry_run:
+            feedback.pushInfo(
+                self.tr("Dry run, {} reaches would be snapped").format(
+                    len(self.snapped_reaches)
+                )
+            )
+            return {}
+
+        if not self.snapped_reaches:
+            feedback.pushInfo(self.tr("No reach snapped"))
+            return {}
+
+        if self.server_side:
+            self.reach_layer.reload()
+        elif self.reach_layer.isEditable():
+            self.reach_layer.beginEditCommand("Snap reaches to points")
+            for fid, geometry in self.snapped_geometries.items():
+                self.reach_layer.changeGeometry(fid, geometry)
+            self.reach_layer.endEditCommand()
+        else:
+            data_provider = self.reach_layer.dataProvider()
+            if not data_provider.changeGeometryValues(self.snapped_geometries):
+                raise QgsProcessingException(
+                    self.tr("Could not write the snapped geometries: {}").format(
+                        "\n".join(data_provider.errors())
+                    )
+                )
+            self.reach_layer.triggerRepaint()
+
+        feedback.pushInfo(
+            self.tr("{} reaches snapped").format(len(self.snapped_reaches))
+        )
         return {}
 
-    def processFeatures(
-        self, reaches, reach_layer, wastewater_node_layer, distance_threshold
+    def submitBatch(self, executor, reaches, node_ids, reach_ids, distance):
+        """
+        Fetches the geometries of the snapping targets of a batch of reaches on the
+        calling thread and submits the calculation of the snapped geometries
+        :param reaches:   A list of (feature id, obj_id, geometry, from fk, to fk) tuples
+        :param node_ids:  A dict of node feature id by obj_id
+        :param reach_ids: A dict of reach feature id by obj_id
+        :return:          The future of snapBatch
+        """
+        # Only fetch the geometries of the targets of this batch
+        node_fids = dict()
+        target_reach_fids = dict()
+        for _, _, _, from_id, to_id in reaches:
+            if from_id in node_ids:
+                node_fids[from_id] = node_ids[from_id]
+            if to_id in node_ids:
+                node_fids[to_id] = node_ids[to_id]
+            elif to_id in reach_ids:
+                target_reach_fids[to_id] = reach_ids[to_id]
+        node_geometries = geometries_by_id(self.node_source, node_fids.values())
+        target_reach_geometries = geometries_by_id(
+            self.reach_source, target_reach_fids.values()
+        )
+
+        return executor.submit(
+            self.snapBatch,
+            reaches,
+            {
+                obj_id: node_geometries[fid]
+                for obj_id, fid in node_fids.items()
+                if fid in node_geometries
+            },
+            {
+                obj_id: target_reach_geometries[fid]
+                for obj_id, fid in target_reach_fids.items()
+                if fid in target_reach_geometries
+            },
+            distance,
+        )
+
+    def snapBatch(
+        self, reaches, node_geometries, target_reach_geometries, distance_threshold
     ):
-        ids = list()
-        to_ids = list()
-        # Gather ids of connected networkelements
-        # to_ids are also gathered separately, because they can be either
-        # reaches or nodes
-        for reach in reaches:
-            if reach["rp_from_fk_wastewater_networkelement"]:
-                ids.append(reach["rp_from_fk_wastewater_networkelement"])
-
-            if reach["rp_to_fk_wastewater_networkelement"]:
-                ids.append(reach["rp_to_fk_wastewater_networkelement"])
-                to_ids.append(reach["rp_to_fk_wastewater_networkelement"])
-
-        # Get all nodes on which to snap
-        quoted_ids = [QgsExpression.quotedValue(objid) for objid in ids]
-        node_request = QgsFeatureRequest()
-        filter_expression = '"obj_id" IN ({ids})'.format(ids=",".join(quoted_ids))
-        node_request.setFilterExpression(filter_expression)
-        node_request.setSubsetOfAttributes([])
-
-        nodes = dict()
-        for node in wastewater_node_layer.getFeatures(node_request):
-            nodes[node["obj_id"]] = node
-
-        # Get all reaches on which to snap
-        quoted_to_ids = [QgsExpression.quotedValue(objid) for objid in to_ids]
-        reach_request = QgsFeatureRequest()
-        filter_expression = '"obj_id" IN ({ids})'.format(ids=",".join(quoted_to_ids))
-        reach_request.setFilterExpression(filter_expression)
-        reach_request.setSubsetOfAttributes([])
-
-        target_reaches = dict()
-        for target_reach in reach_layer.getFeatures(reach_request):
-            target_reaches[target_reach["obj_id"]] = target_reach
-
-        for reach in reaches:
-            reach_geometry = QgsGeometry(reach.geometry())
-            from_id = reach["rp_from_fk_wastewater_networkelement"]
-            if from_id in list(nodes.keys()):
-                if (
-                    distance_threshold == 0
-                    or reach_geometry.sqrDistToVertexAt(
-                        nodes[from_id].geometry().asPoint(), 0
-                    )
-                    < distance_threshold
+        """
+        Calculates the snapped geometries of a batch of reaches, only does geometry
+        calculations and runs in the threads of the pool
+        :param reaches:                 A list of (feature id, obj_id, geometry, from fk, to fk) tuples
+        :param node_geometries:         A dict of node geometry by obj_id
+        :param target_reach_geometries: A dict of target reach geometry by obj_id
+        :return:                        A tuple with a dict of snapped geometry by feature id and a list
+                                        of (obj_id, from distance, to distance), for modified reaches
+        """
+        sqr_distance_threshold = distance_threshold * distance_threshold
+
+        snapped_geometries = dict()
+        snapped_reaches = list()
+        for fid, obj_id, geometry, from_id, to_id in reaches:
+            if geometry.isNull():
+                continue
+            reach_geometry = QgsGeometry(geometry)
+            from_distance = None
+            to_distance = None
+
+            node_geometry = node_geometries.get(from_id)
+            if node_geometry is not None and not node_geometry.isNull():
+                sqr_distance = reach_geometry.sqrDistToVertexAt(
+                    node_geometry.asPoint(), 0
+                )
+                if sqr_distance > 0 and (
+                    distance_threshold == 0 or sqr_distance < sqr_distance_threshold
                 ):
-                    reach_geometry.moveVertex(nodes[from_id].geometry().constGet(), 0)
-
-            to_id = reach["rp_to_fk_wastewater_networkelement"]
-            if to_id in list(nodes.keys()):
-                last_vertex = reach_geometry.constGet().nCoordinates() - 1
-                if (
-                    distance_threshold == 0
-                    or reach_geometry.sqrDistToVertexAt(
-                        nodes[to_id].geometry().asPoint(), last_vertex
-                    )
-                    < distance_threshold
+                    reach_geometry.moveVertex(node_geometry.constGet(), 0)
+                    from_distance = math.sqrt(sqr_distance)
+
+            last_vertex = reach_geometry.constGet().nCoordinates() - 1
+            node_geometry = node_geometries.get(to_id)
+            if node_geometry is not None and not node_geometry.isNull():
+                sqr_distance = reach_geometry.sqrDistToVertexAt(
+                    node_geometry.asPoint(), last_vertex
+                )
+                if sqr_distance > 0 and (
+                    distance_threshold == 0 or sqr_distance < sqr_distance_threshold
                 ):
-                    reach_geometry.moveVertex(
-                        nodes[to_id].geometry().constGet(), last_vertex
-                    )
+                    reach_geometry.moveVertex(node_geometry.constGet(), last_vertex)
+                    to_distance = math.sqrt(sqr_distance)
 
-            if to_id in list(target_reaches.keys()):
-                last_vertex = reach_geometry.constGet().nCoordinates() - 1
-                target_reach = target_reaches[to_id]
+            target_geometry = target_reach_geometries.get(to_id)
+            if target_geometry is not None and not target_geometry.isNull():
                 (
-                    distance,
+                    sqr_distance,
                     point,
                     min_distance_point,
                     after_vertex,
-                ) = target_reach.geometry().closestSegmentWithContext(
+                ) = target_geometry.closestSegmentWithContext(
                     QgsPointXY(reach_geometry.vertexAt(last_vertex))
                 )
-                if distance_threshold == 0 or distance < distance_threshold:
+                if sqr_distance > 0 and (
+                    distance_threshold == 0 or sqr_distance < sqr_distance_threshold
+                ):
                     reach_geometry.moveVertex(point.x(), point.y(), last_vertex)
+                    to_distance = math.sqrt(sqr_distance)
+
+            if from_distance is not None or to_distance is not None:
+                snapped_geometries[fid] = reach_geometry
+                snapped_reaches.append((obj_id, from_distance, to_distance))
 
-            reach.setGeometry(reach_geometry)
-            reach_layer.updateFeature(reach)
+        return snapped_geometries, snapped_reaches
@@ -22,12 +22,14 @@
 
 import statistics
 
+import psycopg2
 from PyQt5.QtCore import QVariant
 from qgis.core import (
     NULL,
     QgsExpression,
     QgsExpressionContext,
     QgsExpressionContextUtils,
+    QgsExpressionNodeColumnRef,
     QgsFeature,
     QgsFeatureRequest,
     QgsFeatureSink,
@@ -43,6 +45,8 @@ from qgis.core import (
     QgsProcessingParameterExpression,
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterField,
+    QgsProcessingParameterMatrix,
+    QgsProcessingParameterString,
     QgsProcessingParameterVectorLayer,
     QgsWkbTypes,
 )
@@ -59,11 +63,185 @@ __revision__ = "$Format:%H$"
 
 
 class Reach:
-    def __init__(self, from_id, to_id, value, geometry):
+    def __init__(self, from_id, to_id, value):
         self.from_id = from_id
         self.to_id = to_id
         self.value = value
-        self.geometry = geometry
+        # If this reach ends at a blind connection: the part of the connected
+        # reach downstream of the connection
+        self.blind_connection_ratio = 1
+
+
+def blind_connection_ratio(geometry, blind_geometry):
+    """
+    The part of blind_geometry downstream of the end point of geometry
+    """
+    length = blind_geometry.length()
+    if not length or geometry.isNull():
+        return 1
+    offset = blind_geometry.lineLocatePoint(QgsGeometry(geometry.constGet().endPoint()))
+    return 1 - offset / length
+
+
+BRANCH_BEHAVIORS = ["minimum", "maximum", "average"]
+AGGREGATE_METHODS = [min, max, statistics.mean]
+
+
+def add(values, other_values):
+    return tuple(value + other for value, other in zip(values, other_values))
+
+
+class UpstreamAccumulator:
+    """
+    Accumulates reach values in flow direction.
+
+    Reach values are tuples with one value per expression, each of them is
+    aggregated with its own method where branches join.
+
+    The network is traversed iteratively (depth first) and the value of every
+    node and the downstream value ("tail") of every reach is cached, so each
+    reach is only evaluated once, no matter how many upstream nodes drain
+    through it.
+
+    Nodes which are part of a loop are recorded in loop_nodes. The path closing a
+    loop contributes nothing and the values cached along a loop depend on where
+    the loop was entered first.
+    """
+
+    def __init__(
+        self, reaches_by_from_node, reaches_by_id, aggregate_methods, feedback
+    ):
+        self.reaches_by_from_node = reaches_by_from_node
+        self.reaches_by_id = reaches_by_id
+        self.aggregate_methods = aggregate_methods
+        self.feedback = feedback
+        self.zero = (0,) * len(aggregate_methods)
+
+        self.node_values = dict()
+        self.reach_tails = dict()
+        self.loop_nodes = set()
+
+    def node_value(self, node_id):
+        """
+        The aggregated values of all paths starting at a node
+
+        :return: A tuple with a value per expression or None if cancelled
+        """
+        if node_id in self.node_values:
+            return self.node_values[node_id]
+
+        on_path = {node_id}
+        # Every frame holds: node id, pending reaches, collected branch values and
+        # the blind connection chain waiting for the value of the next frame
+        stack = [[node_id, iter(self.reaches_by_from_node.get(node_id, [])), [], None]]
+
+        while stack:
+            if self.feedback.isCanceled():
+                return None
+
+            frame = stack[-1]
+            reach = next(frame[1], None)
+
+            if reach is None:
+                stack.pop()
+                on_path.discard(frame[0])
+                value = self.aggregate(frame[2])
+                self.node_values[frame[0]] = value
+                if stack:
+                    parent = stack[-1]
+                    chain, blind_ids = parent[3]
+                    parent[3] = None
+                    on_path.difference_update(blind_ids)
+                    parent[2].append(
+                        add(chain[0].value, self.resolve_chain(chain, value))
+                    )
+                continue
+
+            if reach in self.reach_tails:
+                frame[2].append(add(reach.value, self.reach_tails[reach]))
+                continue
+
+            chain, blind_ids, tail, pending_node_id = self.follow(reach, on_path)
+            if pending_node_id is None:
+                on_path.difference_update(blind_ids)
+                frame[2].append(add(reach.value, self.resolve_chain(chain, tail)))
+            else:
+                frame[3] = (chain, blind_ids)
+                on_path.add(pending_node_id)
+                stack.append(
+                    [
+                        pending_node_id,
+                        iter(self.reaches_by_from_node[pending_node_id]),
+                        [],
+                        None,
+                    ]
+                )
+
+        return self.node_values[node_id]
+
+    def follow(self, reach, on_path):
+        """
+        Follows a reach downstream through blind connections until a node with
+        outgoing reaches, an outlet, a loop or a cached result is met.
+
+        :return: A tuple (chain, blind_ids, tail, pending_node_id). chain lists the
+                 reaches passed, the first being reach. tail is the value downstream
+                 of the last reach in chain, unless pending_node_id is set: then the
+                 value of this node still has to be calculated.
+        """
+        chain = [reach]
+        blind_ids = []
+        while True:
+            last = chain[-1]
+            if last in self.reach_tails:
+                return chain, blind_ids, self.reach_tails[last], None
+
+            node_id = last.to_id
+            if node_id in self.node_values:
+                return chain, blind_ids, self.node_values[node_id], None
+            if node_id in on_path:
+                self.loop_nodes.add(node_id)
+                return chain, blind_ids, self.zero, None
+            if node_id in self.reaches_by_from_node:
+                return chain, blind_ids, None, node_id
+            if node_id in self.reaches_by_id:
+                # Blind connection: continue on the reach we are connected to
+                on_path.add(node_id)
+                blind_ids.append(node_id)
+                chain.append(self.reaches_by_id[node_id])
+                continue
+
+            # Outlet
+            return chain, blind_ids, self.zero, None
+
+    def resolve_chain(self, chain, tail):
+        """
+        Caches the tails of all reaches in a blind connection chain, given the tail
+        of its last reach.
+
+        :return: The tail of the first reach in chain
+        """
+        self.reach_tails[chain[-1]] = tail
+        for i in range(len(chain) - 2, -1, -1):
+            # Only the part of the blind reach below the connection is added
+            ratio = chain[i].blind_connection_ratio
+            tail = tuple(
+                ratio * value + downstream
+                for value, downstream in zip(chain[i + 1].value, tail)
+            )
+            self.reach_tails[chain[i]] = tail
+        return tail
+
+    def aggregate(self, values):
+        """
+        Aggregates the values of all branches leaving a node per expression
+        """
+        if not values:
+            return self.zero
+        return tuple(
+            aggregate_method(list(column))
+            for aggregate_method, column in zip(self.aggregate_methods, zip(*values))
+        )
 
 
 class SumUpUpstreamAlgorithm(QgepAlgorithm):
@@ -77,6 +255,9 @@ class SumUpUpstreamAlgorithm(QgepAlgorithm):
     NODE_FROM_FK_NAME = "NODE_FROM_FK_NAME"
     NODE_TO_FK_NAME = "NODE_TO_FK_NAME"
     BRANCH_BEHAVIOR = "BRANCH_BEHAVIOR"
+    ADDITIONAL_VALUES = "ADDITIONAL_VALUES"
+    EXECUTION_MODE = "EXECUTION_MODE"
+    DATABASE = "DATABASE"
     CREATE_LOOP_LAYER = "CREATE_LOOP_LAYER"
 
     OUTPUT = "OUTPUT"
@@ -112,6 +293,22 @@ class SumUpUpstreamAlgorithm(QgepAlgorithm):
                 options=[self.tr("Minimum"), self.tr("Maximum"), self.tr("Average")],
             )
         )
+        description = self.tr(
+            "Additional values, summed up in the same run. Branch behavior is one of "
+            "<code>Minimum</code>, <code>Maximum</code> or <code>Average</code>."
+        )
+        self.addParameter(
+            QgsProcessingParameterMatrix(
+                self.ADDITIONAL_VALUES,
+                description=description,
+                headers=[
+                    self.tr("Source value expression"),
+                    self.tr("Branch behavior"),
+                    self.tr("Output field"),
+                ],
+                optional=True,
+            )
+        )
 
         self.addParameter(
             QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr("Summed up"))
@@ -133,6 +330,26 @@ class SumUpUpstreamAlgorithm(QgepAlgorithm):
                 optional=True,
             )
         )
+        description = self.tr(
+            "Execution mode. On the server, the expressions are evaluated as SQL on "
+            "qgep_od.vw_qgep_reach and the network of qgep_network is used, the reach "
+            "and node layer options except the node primary key are ignored."
+        )
+        self.addAdvancedParameter(
+            QgsProcessingParameterEnum(
+                self.EXECUTION_MODE,
+                description=description,
+                options=[self.tr("Client (QGIS)"), self.tr("Server (PostgreSQL)")],
+                defaultValue=0,
+            )
+        )
+        description = self.tr("Database (server execution mode only)")
+        self.addAdvancedParameter(
+            QgsProcessingParameterString(
+                self.DATABASE, description=description, defaultValue="pg_qgep"
+            )
+        )
+
         description = self.tr("Reach Layer")
         self.addAdvancedParameter(
             QgsProcessingParameterVectorLayer(
@@ -226,24 +443,38 @@ class SumUpUpstreamAlgorithm(QgepAlgorithm):
         branch_behavior = self.parameterAsEnum(
             parameters, self.BRANCH_BEHAVIOR, context
         )
+        additional_values = self.parameterAsMatrix(
+            parameters, self.ADDITIONAL_VALUES, context
+        )
         create_loop_layer = self.parameterAsBool(
             parameters, self.CREATE_LOOP_LAYER, context
         )
-
-        if branch_behavior == 0:
-            aggregate_method = lambda values: min(values) if values else 0
-        elif branch_behavior == 1:
-            aggregate_method = lambda values: max(values) if values else 0
-        elif branch_behavior == 2:
-            aggregate_method = lambda values: statistics.mean(values) if values else 0
-        else:
-            aggregate_method = lambda values: feedback.pushError(
-                "Aggregate method not implemented"
+        execution_mode = self.parameterAsEnum(parameters, self.EXECUTION_MODE, context)
+        database = self.parameterAsString(parameters, self.DATABASE, context)
+
+        # (expression, branch behavior, output field name) per value
+        value_definitions = [(value_expression, branch_behavior, "value")]
+        for i in range(0, len(additional_values) - 2, 3):
+            expression, behavior, field_name = additional_values[i : i + 3]
+            if not expression:
+                continue
+            behavior = str(behavior).strip().lower()
+            if behavior not in BRANCH_BEHAVIORS:
+                raise QgsProcessingException(
+                    self.tr("Unknown branch behavior: {}").format(behavior)
+                )
+            value_definitions.append(
+                (
+                    expression,
+                    BRANCH_BEHAVIORS.index(behavior),
+                    field_name or "value_{}".format(len(value_definitions) + 1),
+                )
             )
 
         # create feature sink
         fields = wastewater_node_layer.fields()
-        fields.append(QgsField("value", QVariant.Double))
+        for _, _, field_name in value_definitions:
+            fields.append(QgsField(field_name, QVariant.Double))
         (sink, dest_id) = self.parameterAsSink(
             parameters,
             self.OUTPUT,
@@ -268,81 +499,50 @@ class SumUpUpstreamAlgorithm(QgepAlgorithm):
         if sink is None:
             raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
 
-        feature_count = reach_layer.featureCount()
-
-        reaches_by_from_node = dict()
-        reaches_by_id = dict()
-
-        expression = QgsExpression(value_expression)
-        context = QgsExpressionContext(
-            QgsExpressionContextUtils.globalProjectLayerScopes(reach_layer)
-        )
-        expression.prepare(context)
-
-        progress = 0
-        feedback.setProgressText(self.tr("Indexing reaches"))
-        for reach in reach_layer.getFeatures(QgsFeatureRequest()):
-            if reach[node_from_fk_name] == NULL:
-                continue
-
-            context.setFeature(reach)
-            value = expression.evaluate(context)
-            reach_obj = Reach(
-                reach[node_from_fk_name],
-                reach[node_to_fk_name],
-                value,
-                reach.geometry(),
+        if execution_mode == 1:
+            node_values, loop_nodes = self.sum_up_on_server(
+                database, value_definitions, feedback
             )
-            reaches_by_from_node.setdefault(reach_obj.from_id, []).append(reach_obj)
-            reaches_by_id[reach[reach_pk_name]] = reach_obj
-
-            feedback.setProgress(progress / feature_count * 10)
-            progress += 1
+            zero = (0,) * len(value_definitions)
+            node_value = lambda node_id: node_values.get(node_id, zero)
+        else:
+            accumulator = self.index_reaches(
+                reach_layer,
+                value_definitions,
+                reach_pk_name,
+                node_from_fk_name,
+                node_to_fk_name,
+                feedback,
+            )
+            if accumulator is None:
+                return {}
+            node_value = accumulator.node_value
+            loop_nodes = accumulator.loop_nodes
 
-        loop_nodes = []
-        current_feature = 0
-        calculated_values = {}
+        node_count = wastewater_node_layer.featureCount()
+        progress_step = max(node_count // 100, 1)
 
         feedback.setProgressText(self.tr("Analyzing network"))
-        for node in wastewater_node_layer.getFeatures():
-
-            from_node_id = node[node_pk_name]
-
-            processed_nodes = []
-            times = []
-            if from_node_id in reaches_by_from_node.keys():
-                for reach in reaches_by_from_node[from_node_id]:
-                    times.append(
-                        self.calculate_branch(
-                            reach,
-                            reaches_by_from_node,
-                            reaches_by_id,
-                            list(processed_nodes),
-                            calculated_values,
-                            aggregate_method,
-                            loop_nodes,
-                            feedback,
-                        )
-                    )
-
-            if times:
-                time = aggregate_method(times)
-            else:
-                time = 0
+        for progress, node in enumerate(wastewater_node_layer.getFeatures()):
+            if progress % progress_step == 0:
+                if feedback.isCanceled():
+                    break
+                feedback.setProgress(10 + progress / node_count * 90)
 
-            current_feature += 1
+            values = node_value(node[node_pk_name])
+            if values is None:
+                break
 
-            calculated_values[node[node_pk_name]] = time
             new_node = QgsFeature(node)
             new_node.setFields(fields)
-            new_node.setAttributes(node.attributes() + [time])
+            new_node.setAttributes(node.attributes() + list(values))
 
             sink.addFeature(new_node, QgsFeatureSink.FastInsert)
 
-            if create_loop_layer and from_node_id in loop_nodes:
-                loop_sink.addFeature(node, QgsFeatureSink.FastInsert)
-
-            feedback.setProgress(10 + current_feature / feature_count * 90)
+        if create_loop_layer:
+            for node in wastewater_node_layer.getFeatures():
+                if node[node_pk_name] in loop_nodes:
+                    loop_sink.addFeature(node, QgsFeatureSink.FastInsert)
 
         result = {self.OUTPUT: dest_id}
         if create_loop_layer:
@@ -350,95 +550,161 @@ class SumUpUpstreamAlgorithm(QgepAlgorithm):
 
         return result
 
-    def process_node(
-        self,
-        node_id,
-        previous_reach,
-        reaches_by_from_node,
-        reaches_by_id,
-        processed_nodes,
-        calculated_values,
-        aggregate_method,
-        loop_nodes,
-        feedback,
-    ):
-        time = 0
-
-        while node_id in reaches_by_from_node.keys() or node_id in reaches_by_id.keys():
-            if node_id in calculated_values:
-                return calculated_values[node_id] + time
-            if node_id in processed_nodes:
-                # feedback.reportError(self.tr('Loop at node: {}'.format(node_id)))
-                loop_nodes.append(node_id)
-                return 0
-
-            processed_nodes.append(node_id)
-
-            if feedback.isCanceled():
-                return NULL
-
-            if node_id not in reaches_by_from_node:
-                # Blind connection: add proportionally
-                reach = reaches_by_id[node_id]
-                offset = reach.geometry.lineLocatePoint(
-                    QgsGeometry(previous_reach.geometry.constGet().endPoint())
+    def sum_up_on_server(self, database, value_definitions, feedback):
+        """
+        Sums up the values with qgep_network.sum_up_upstream on the database server
+
+        :return: A tuple (node_values, loop_nodes). node_values maps the obj_id of
+                 wastewater nodes to a list with a value per expression.
+        """
+        node_values = dict()
+        loop_nodes = set()
+
+        # All the values are summed up in a single pass over the network
+        feedback.setProgressText(self.tr("Summing up on the server"))
+        connection = psycopg2.connect(service=database)
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(
+                    'SELECT obj_id, "values", in_loop FROM qgep_network.sum_up_upstream(%s::text[], %s::text[])',
+                    (
+                        [
+                            value_expression
+                            for value_expression, _, _ in value_definitions
+                        ],
+                        [
+                            BRANCH_BEHAVIORS[branch_behavior]
+                            for _, branch_behavior, _ in value_definitions
+                        ],
+                    ),
                 )
-                length = reach.geometry.length()
-                remaining_part = 1 - offset / length
-                # feedback.pushInfo('Length: {} Offset: {} Part: {}'.format(length, offset, remaining_part, reach.value * remaining_part))
-                time += reach.value * remaining_part
-                node_id = reach.to_id
-            else:
-                current_reaches = reaches_by_from_node[node_id]
-                if len(current_reaches) == 1:
-                    # In case there is just one downstream reach, calculate in here
-                    # Starting a recursive approach results in a maximum call stack exception
-                    time += current_reaches[0].value
-                    node_id = current_reaches[0].to_id
-                    previous_reach = current_reaches[0]
-                else:
-                    # Branching occurred: calculate every possible path and aggregate all values
-                    times = []
-                    for reach in current_reaches:
-                        times.append(
-                            self.calculate_branch(
-                                reach,
-                                reaches_by_from_node,
-                                reaches_by_id,
-                                list(processed_nodes),
-                                calculated_values,
-                                aggregate_method,
-                                loop_nodes,
-                                feedback,
-                            )
-                        )
-
-                    if times:
-                        time += aggregate_method(times)
-
-                    return time
-
-        return time
-
-    def calculate_branch(
+            except psycopg2.Error as e:
+                raise QgsProcessingException(str(e))
+
+            for obj_id, values, in_loop in cursor:
+                node_values[obj_id] = values
+                if in_loop:
+                    loop_nodes.add(obj_id)
+        finally:
+            connection.close()
+        feedback.setProgress(10)
+
+        return node_values, loop_nodes
+
+    def index_reaches(
         self,
-        reach,
-        reaches_by_from_node,
-        reaches_by_id,
-        processed_nodes,
-        calculated_values,
-        aggregate_method,
-        loop_nodes,
+        reach_layer,
+        value_definitions,
+        reach_pk_name,
+        node_from_fk_name,
+        node_to_fk_name,
         feedback,
     ):
-        return reach.value + self.process_node(
-            reach.to_id,
-            reach,
+        """
+        Reads the reaches and evaluates the value expressions on the client
+
+        :return: An UpstreamAccumulator or None if cancelled
+        """
+        feature_count = reach_layer.featureCount()
+
+        reaches_by_from_node = dict()
+        reaches_by_id = dict()
+        reach_fids = dict()
+
+        context = QgsExpressionContext(
+            QgsExpressionContextUtils.globalProjectLayerScopes(reach_layer)
+        )
+        reach_fields = reach_layer.fields()
+        from_index = reach_fields.lookupField(node_from_fk_name)
+        to_index = reach_fields.lookupField(node_to_fk_name)
+        pk_index = reach_fields.lookupField(reach_pk_name)
+
+        # (expression, field index) per value, plain field references are read
+        # from the attributes directly
+        expressions = []
+        for value_expression, _, _ in value_definitions:
+            expression = QgsExpression(value_expression)
+            if expression.hasParserError():
+                raise QgsProcessingException(expression.parserErrorString())
+            expression.prepare(context)
+            value_index = -1
+            if isinstance(expression.rootNode(), QgsExpressionNodeColumnRef):
+                value_index = reach_fields.lookupField(expression.rootNode().name())
+            expressions.append((expression, value_index))
+
+        # Only fetch what the expressions need, geometries for blind connections
+        # are fetched separately
+        request = QgsFeatureRequest()
+        if not any(expression.needsGeometry() for expression, _ in expressions):
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+        columns = set()
+        for expression, _ in expressions:
+            columns.update(expression.referencedColumns())
+        if QgsFeatureRequest.ALL_ATTRIBUTES not in columns:
+            columns.update((reach_pk_name, node_from_fk_name, node_to_fk_name))
+            request.setSubsetOfAttributes(list(columns), reach_fields)
+
+        progress_step = max(feature_count // 100, 1)
+        feedback.setProgressText(self.tr("Indexing reaches"))
+        for progress, reach in enumerate(reach_layer.getFeatures(request)):
+            if progress % progress_step == 0:
+                if feedback.isCanceled():
+                    return None
+                feedback.setProgress(progress / feature_count * 10)
+
+            attributes = reach.attributes()
+            if attributes[from_index] == NULL:
+                continue
+
+            context.setFeature(reach)
+            reach_obj = Reach(
+                attributes[from_index],
+                attributes[to_index],
+                tuple(
+                    attributes[value_index]
+                    if value_index >= 0
+                    else expression.evaluate(context)
+                    for expression, value_index in expressions
+                ),
+            )
+            reaches_by_from_node.setdefault(reach_obj.from_id, []).append(reach_obj)
+            reaches_by_id[attributes[pk_index]] = reach_obj
+            reach_fids[reach_obj] = reach.id()
+
+        # Split the reaches at blind connections once, geometries are not kept
+        blind_connections = [
+            (reach_obj, reaches_by_id[reach_obj.to_id])
+            for reach_obj in reaches_by_id.values()
+            if reach_obj.to_id in reaches_by_id
+            and reach_obj.to_id not in reaches_by_from_node
+        ]
+        if blind_connections:
+            feedback.setProgressText(self.tr("Locating blind connections"))
+            fids = set()
+            for reach_obj, blind_reach in blind_connections:
+                fids.add(reach_fids[reach_obj])
+                fids.add(reach_fids[blind_reach])
+            request = QgsFeatureRequest().setFilterFids(list(fids))
+            request.setNoAttributes()
+            geometries = {
+                reach.id(): reach.geometry()
+                for reach in reach_layer.getFeatures(request)
+            }
+            for reach_obj, blind_reach in blind_connections:
+                reach_obj.blind_connection_ratio = blind_connection_ratio(
+                    geometries[reach_fids[reach_obj]],
+                    geometries[reach_fids[blind_reach]],
+                )
+            del geometries
+        del reach_fids
+
+        return UpstreamAccumulator(
             reaches_by_from_node,
             reaches_by_id,
-            processed_nodes,
-            calculated_values,
-            aggregate_method,
-            loop_nodes,
+            [
+                AGGREGATE_METHODS[branch_behavior]
+                for _, branch_behavior, _ in value_definitions
+            ],
             feedback,
         )
@@ -26,6 +26,7 @@ from qgis.core import (
     QgsProcessingContext,
     QgsProcessingFeedback,
     QgsProcessingParameterBoolean,
+    QgsProcessingParameterDefinition,
     QgsProcessingParameterEnum,
     QgsProcessingParameterFile,
     QgsProcessingParameterFileDestination,
@@ -53,6 +54,7 @@ class SwmmCreateInputAlgorithm(QgepAlgorithm):
     INP_FILE = "INP_FILE"
     STATE = "STATE"
     ONLY_SELECTED = "ONLY_SELECTED"
+    SNAPSHOT = "SNAPSHOT"
 
     def name(self):
         return "swmm_create_input"
@@ -79,6 +81,12 @@ class SwmmCreateInputAlgorithm(QgepAlgorithm):
         with some other properties.
         """
         self.stateOptions = ["current", "planned"]
+        self.snapshotOptions = [
+            self.tr("SWMM views"),
+            self.tr("Snapshot tables"),
+            self.tr("Snapshot tables, refreshed for changed structures (audit log)"),
+            self.tr("Snapshot tables, fully refreshed"),
+        ]
         # The parameters
         description = self.tr("Database")
         self.addParameter(
@@ -120,6 +128,22 @@ class SwmmCreateInputAlgorithm(QgepAlgorithm):
             )
         )
 
+        description = self.tr("Read the network from")
+        self.addAdvancedParameter(
+            QgsProcessingParameterEnum(
+                self.SNAPSHOT,
+                description=description,
+                options=self.snapshotOptions,
+                defaultValue=0,
+            )
+        )
+
+    def addAdvancedParameter(self, parameter):
+        parameter.setFlags(
+            parameter.flags() | QgsProcessingParameterDefinition.FlagAdvanced
+        )
+        self.addParameter(parameter)
+
     def processAlgorithm(
         self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback
     ):
@@ -141,6 +165,7 @@ class SwmmCreateInputAlgorithm(QgepAlgorithm):
             )
             state = "current"
         only_selected = self.parameterAsBoolean(parameters, self.ONLY_SELECTED, context)
+        snapshot = self.parameterAsEnum(parameters, self.SNAPSHOT, context)
 
         # Get selection
         if only_selected:
@@ -176,7 +201,12 @@ class SwmmCreateInputAlgorithm(QgepAlgorithm):
             None,
             None,
             feedback,
+            use_snapshot=snapshot > 0,
         ) as qs:
+            if snapshot == 2:
+                qs.refresh_snapshot(changed_only=True)
+            elif snapshot == 3:
+                qs.refresh_snapshot()
             qs.write_input(hierarchy, selected_structures, selected_reaches)
         feedback.setProgress(100)
 
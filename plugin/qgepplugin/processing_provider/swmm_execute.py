@@ -48,6 +48,7 @@ class SwmmExecuteAlgorithm(QgepAlgorithm):
 
     INP_FILE = "INP_FILE"
     RPT_FILE = "RPT_FILE"
+    OUT_FILE = "OUT_FILE"
 
     def name(self):
         return "swmm_execute"
@@ -87,6 +88,17 @@ class SwmmExecuteAlgorithm(QgepAlgorithm):
             )
         )
 
+        description = self.tr("OUT File (binary results)")
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.OUT_FILE,
+                description=description,
+                fileFilter="out (*.out)",
+                optional=True,
+                createByDefault=False,
+            )
+        )
+
     def processAlgorithm(
         self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback
     ):
@@ -94,6 +106,7 @@ class SwmmExecuteAlgorithm(QgepAlgorithm):
 
         # init params
         rpt_file = self.parameterAsFile(parameters, self.RPT_FILE, context)
+        out_file = self.parameterAsFileOutput(parameters, self.OUT_FILE, context)
         inp_file = self.parameterAsFileOutput(parameters, self.INP_FILE, context)
         swmm_cli = os.path.abspath(ProcessingConfig.getSetting("SWMM_PATH"))
         if not swmm_cli:
@@ -108,7 +121,15 @@ class SwmmExecuteAlgorithm(QgepAlgorithm):
             )
 
         with QgepSwmm(
-            None, None, None, inp_file, None, rpt_file, swmm_cli, feedback
+            None,
+            None,
+            None,
+            inp_file,
+            None,
+            rpt_file,
+            swmm_cli,
+            feedback,
+            outfile=out_file or None,
         ) as qs:
             prompt = qs.execute_swmm()
 
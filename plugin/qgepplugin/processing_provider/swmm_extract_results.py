@@ -19,7 +19,7 @@
  ***************************************************************************/
 """
 
-from PyQt5.QtCore import QVariant
+from PyQt5.QtCore import QDateTime, QVariant
 from qgis.core import (
     QgsFeature,
     QgsFeatureSink,
@@ -33,7 +33,7 @@ from qgis.core import (
 )
 
 from .qgep_algorithm import QgepAlgorithm
-from .QgepSwmm import QgepSwmm
+from .QgepSwmm import SWMM_TIME_SERIES_PARAMETERS, QgepSwmm
 
 __author__ = "Timothée Produit"
 __date__ = "2019-08-01"
@@ -48,9 +48,12 @@ class SwmmExtractResultsAlgorithm(QgepAlgorithm):
     """"""
 
     RPT_FILE = "RPT_FILE"
+    OUT_FILE = "OUT_FILE"
     NODE_SUMMARY = "NODE_SUMMARY"
     LINK_SUMMARY = "LINK_SUMMARY"
     XSECTION_SUMMARY = "XSECTION_SUMMARY"
+    NODE_TIME_SERIES = "NODE_TIME_SERIES"
+    LINK_TIME_SERIES = "LINK_TIME_SERIES"
 
     def name(self):
         return "swmm_extract_results"
@@ -62,6 +65,7 @@ class SwmmExtractResultsAlgorithm(QgepAlgorithm):
         return self.tr(
             """
         Import SWMM results in QGIS temporary tables.
+        The time series of the nodes and links are read from the binary output file, if given.
         See: https://qgep.github.io/docs/qgep_swmm/Extract-Results.html
         """
         )
@@ -94,6 +98,34 @@ class SwmmExtractResultsAlgorithm(QgepAlgorithm):
             )
         )
 
+        description = self.tr("OUT File (binary results)")
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.OUT_FILE,
+                description=description,
+                fileFilter="out (*.out)",
+                optional=True,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.NODE_TIME_SERIES,
+                self.tr("Node time series"),
+                optional=True,
+                createByDefault=False,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.LINK_TIME_SERIES,
+                self.tr("Link time series"),
+                optional=True,
+                createByDefault=False,
+            )
+        )
+
     def processAlgorithm(
         self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback
     ):
@@ -103,6 +135,7 @@ class SwmmExtractResultsAlgorithm(QgepAlgorithm):
 
         # init params
         rpt_file = self.parameterAsFileOutput(parameters, self.RPT_FILE, context)
+        out_file = self.parameterAsFile(parameters, self.OUT_FILE, context)
 
         # create feature sink for node summary
         fields = QgsFields()
@@ -124,7 +157,17 @@ class SwmmExtractResultsAlgorithm(QgepAlgorithm):
             )
 
         # Get node summary from output file
-        qs = QgepSwmm(None, None, None, None, None, rpt_file, None, feedback)
+        qs = QgepSwmm(
+            None,
+            None,
+            None,
+            None,
+            None,
+            rpt_file,
+            None,
+            feedback,
+            outfile=out_file or None,
+        )
         node_summary = qs.extract_node_depth_summary()
 
         # Fill node summary with data
@@ -158,6 +201,7 @@ class SwmmExtractResultsAlgorithm(QgepAlgorithm):
 
         # Get link summary from output file
         link_summary = qs.extract_link_flow_summary()
+        qs.close_report()
 
         # Fill node summary with data
         for ns in link_summary:
@@ -168,6 +212,42 @@ class SwmmExtractResultsAlgorithm(QgepAlgorithm):
                 if index != -1:
                     sf.setAttribute(k, ns[k])
             sink_link.addFeature(sf, QgsFeatureSink.FastInsert)
+
+        results = {self.NODE_SUMMARY: sink_node, self.LINK_SUMMARY: sink_link}
+
+        # Time series from the binary output file, an invalid file is reported
+        if out_file and qs.use_output():
+            for swmm_type, output_name, progress in (
+                ("node", self.NODE_TIME_SERIES, 75),
+                ("link", self.LINK_TIME_SERIES, 100),
+            ):
+                fields = QgsFields()
+                fields.append(QgsField("id", QVariant.String))
+                fields.append(QgsField("time", QVariant.DateTime))
+                for parameter in SWMM_TIME_SERIES_PARAMETERS[swmm_type]:
+                    fields.append(QgsField(parameter, QVariant.Double))
+                (sink, dest_id) = self.parameterAsSink(
+                    parameters, output_name, context, fields
+                )
+                if sink is None:
+                    # Not requested
+                    continue
+
+                for ts in qs.extract_time_series(swmm_type):
+                    if feedback.isCanceled():
+                        break
+                    sf = QgsFeature()
+                    sf.setFields(fields)
+                    for k in ts.keys():
+                        if k == "time":
+                            sf.setAttribute(k, QDateTime(ts[k]))
+                        else:
+                            sf.setAttribute(k, ts[k])
+                    sink.addFeature(sf, QgsFeatureSink.FastInsert)
+                feedback.setProgress(progress)
+                results[output_name] = dest_id
+            qs.close_output()
+
         feedback.setProgress(100)
 
-        return {self.NODE_SUMMARY: sink_node, self.LINK_SUMMARY: sink_link}
+        return results
@@ -43,6 +43,7 @@ class SwmmImportResultsAlgorithm(QgepAlgorithm):
     """"""
 
     RPT_FILE = "RPT_FILE"
+    OUT_FILE = "OUT_FILE"
     DATABASE = "DATABASE"
     SIM_DESCRIPTION = "SIM_DESCRIPTION"
     IMPORT_SUMMARY = "IMPORT_SUMMARY"
@@ -78,6 +79,18 @@ class SwmmImportResultsAlgorithm(QgepAlgorithm):
             QgsProcessingParameterFile(self.RPT_FILE, description=description)
         )
 
+        description = self.tr(
+            "SWMM binary output file (.out), full results are read from it if given"
+        )
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.OUT_FILE,
+                description=description,
+                fileFilter="out (*.out)",
+                optional=True,
+            )
+        )
+
         description = self.tr("Database")
         self.addParameter(
             QgsProcessingParameterString(
@@ -140,6 +153,7 @@ class SwmmImportResultsAlgorithm(QgepAlgorithm):
 
         # init params
         rpt_file = self.parameterAsFileOutput(parameters, self.RPT_FILE, context)
+        out_file = self.parameterAsFile(parameters, self.OUT_FILE, context)
         database = self.parameterAsString(parameters, self.DATABASE, context)
         sim_description = self.parameterAsString(
             parameters, self.SIM_DESCRIPTION, context
@@ -159,7 +173,15 @@ class SwmmImportResultsAlgorithm(QgepAlgorithm):
 
         # Get node summary from output file
         with QgepSwmm(
-            sim_description, database, None, None, None, rpt_file, None, feedback
+            sim_description,
+            database,
+            None,
+            None,
+            None,
+            rpt_file,
+            None,
+            feedback,
+            outfile=out_file or None,
         ) as qs:
             if import_summary:
                 qs.import_summary(sim_description)
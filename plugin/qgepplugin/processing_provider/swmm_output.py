@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ QGEP-swmm processing provider
+                              -------------------
+        begin                : 10.2026
+        copyright            : (C) 2026 by the QGEP project
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import mmap
+import struct
+from datetime import datetime, timedelta
+
+try:
+    import numpy
+except ImportError:
+    # The time series are returned as lists of tuples
+    numpy = None
+
+# First and last record of a SWMM 5 binary output file
+MAGIC_NUMBER = 516114522
+# Size in bytes of the records of the file
+INTEGER_SIZE = 4
+REAL_SIZE = 4
+DATE_SIZE = 8
+# Number of records at the end of the file
+CLOSING_RECORDS = 6
+
+FLOW_UNITS = ["CFS", "GPM", "MGD", "CMS", "LPS", "MLD"]
+
+# Codes of the reported variables of nodes and links, the names are the ones
+# of the time series of the report (see SWMM_TIME_SERIES_PARAMETERS)
+NODE_VARIABLES = {
+    "depth": 0,
+    "head": 1,
+    "volume": 2,
+    "lateral_inflow": 3,
+    "inflow": 4,
+    "flooding": 5,
+}
+LINK_VARIABLES = {
+    "flow": 0,
+    "depth": 1,
+    "velocity": 2,
+    "volume": 3,
+    "capacity": 4,
+}
+
+# Origin of the dates of SWMM, in days
+SWMM_EPOCH = datetime(1899, 12, 30)
+
+
+class SwmmOutput:
+    """
+    Reader of a SWMM binary output (.out) file
+
+    The file has a fixed layout: the reported values of every object are
+    written period after period, each period having the same size. The value of
+    a variable of an object is therefore read at a computed offset, without
+    parsing the rest of the file. The file is memory mapped if possible and
+    the time series are returned as NumPy arrays if NumPy is available.
+    """
+
+    def __init__(self, out_file, use_mmap=True):
+        """
+        Parameters:
+        out_file (path): path of the binary output file
+        use_mmap (boolean): memory map the file instead of reading it with seeks
+        """
+        self.out_file = out_file
+        self.use_mmap = use_mmap
+        self.file = None
+        self.mmap = None
+        self.subcatchment_ids = []
+        self.node_ids = []
+        self.link_ids = []
+        # Codes of the reported variables
+        self.subcatchment_variables = []
+        self.node_variables = []
+        self.link_variables = []
+        self.system_variables = []
+        self.flow_units = None
+        self.report_start = None
+        # Reporting time step in seconds
+        self.report_step = None
+        self.period_count = 0
+        # Byte offset of the first period and size of a period
+        self.results_offset = None
+        self.period_size = None
+        # {"type", "index"} of the objects by object id
+        self.time_series_indexes = {}
+        self._times = None
+        try:
+            self.open()
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def read(self, offset, size):
+        """
+        Reads bytes at an offset of the file
+        """
+        if self.mmap is not None:
+            return self.mmap[offset : offset + size]
+        self.file.seek(offset)
+        return self.file.read(size)
+
+    def read_integers(self, offset, count):
+        """
+        Reads consecutive integers
+
+        Returns:
+        tuple: the integers
+        """
+        return struct.unpack(
+            "<{}i".format(count), self.read(offset, count * INTEGER_SIZE)
+        )
+
+    def open(self):
+        """
+        Opens the file and reads its header, the names of the objects and the
+        layout of the results
+        """
+        self.file = open(self.out_file, "rb")
+        if self.use_mmap:
+            try:
+                self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # Empty files can not be mapped
+                self.mmap = None
+
+        self.file.seek(0, 2)
+        file_size = self.file.tell()
+        closing_size = CLOSING_RECORDS * INTEGER_SIZE
+        if file_size < 7 * INTEGER_SIZE + closing_size:
+            raise ValueError(
+                "{} is not a SWMM binary output file".format(self.out_file)
+            )
+
+        (
+            magic_start,
+            _version,
+            flow_units,
+            subcatchment_count,
+            node_count,
+            link_count,
+            pollutant_count,
+        ) = self.read_integers(0, 7)
+        (
+            ids_offset,
+            properties_offset,
+            self.results_offset,
+            self.period_count,
+            error_code,
+            magic_end,
+        ) = self.read_integers(file_size - closing_size, CLOSING_RECORDS)
+
+        if magic_start != MAGIC_NUMBER or magic_end != MAGIC_NUMBER:
+            raise ValueError(
+                "{} is not a SWMM binary output file".format(self.out_file)
+            )
+        if error_code != 0:
+            raise ValueError(
+                "The simulation of {} ended with the error {}".format(
+                    self.out_file, error_code
+                )
+            )
+        if 0 <= flow_units < len(FLOW_UNITS):
+            self.flow_units = FLOW_UNITS[flow_units]
+
+        # Names of the objects, as a length followed by the characters
+        offset = ids_offset
+        names = []
+        for i in range(subcatchment_count + node_count + link_count + pollutant_count):
+            (length,) = self.read_integers(offset, 1)
+            offset += INTEGER_SIZE
+            names.append(self.read(offset, length).decode("utf-8"))
+            offset += length
+        nodes_start = subcatchment_count
+        links_start = nodes_start + node_count
+        self.subcatchment_ids = names[:nodes_start]
+        self.node_ids = names[nodes_start:links_start]
+        self.link_ids = names[links_start : links_start + link_count]
+
+        # Properties of the objects, a number of properties, their codes and
+        # their values for each object
+        offset = properties_offset
+        for object_count in (subcatchment_count, node_count, link_count):
+            (property_count,) = self.read_integers(offset, 1)
+            offset += (1 + property_count) * INTEGER_SIZE
+            offset += object_count * property_count * REAL_SIZE
+
+        # Reported variables, a number of variables and their codes
+        variables = []
+        for i in range(4):
+            (variable_count,) = self.read_integers(offset, 1)
+            variables.append(
+                list(self.read_integers(offset + INTEGER_SIZE, variable_count))
+            )
+            offset += (1 + variable_count) * INTEGER_SIZE
+        (
+            self.subcatchment_variables,
+            self.node_variables,
+            self.link_variables,
+            self.system_variables,
+        ) = variables
+
+        (report_start,) = struct.unpack("<d", self.read(offset, DATE_SIZE))
+        self.report_start = self.convert_to_datetime(report_start)
+        (self.report_step,) = self.read_integers(offset + DATE_SIZE, 1)
+
+        # A period is a date followed by the values of every object
+        self.period_size = DATE_SIZE + REAL_SIZE * (
+            subcatchment_count * len(self.subcatchment_variables)
+            + node_count * len(self.node_variables)
+            + link_count * len(self.link_variables)
+            + len(self.system_variables)
+        )
+
+        for index, obj_id in enumerate(self.node_ids):
+            self.time_series_indexes[obj_id] = {"type": "node", "index": index}
+        for index, obj_id in enumerate(self.link_ids):
+            self.time_series_indexes[obj_id] = {"type": "link", "index": index}
+
+    def convert_to_datetime(self, swmm_date):
+        """
+        Converts a SWMM date, in days since the 30/12/1899, to a datetime rounded
+        to the second
+        """
+        return SWMM_EPOCH + timedelta(seconds=round(swmm_date * 86400))
+
+    def times(self):
+        """
+        Dates of the reporting periods
+
+        Returns:
+        [datetime]: the dates
+        """
+        if self._times is None:
+            if numpy is not None and self.mmap is not None:
+                dates = numpy.ndarray(
+                    shape=(self.period_count,),
+                    dtype="<f8",
+                    buffer=self.mmap,
+                    offset=self.results_offset,
+                    strides=(self.period_size,),
+                ).tolist()
+            else:
+                dates = [
+                    struct.unpack(
+                        "<d",
+                        self.read(
+                            self.results_offset + period * self.period_size, DATE_SIZE
+                        ),
+                    )[0]
+                    for period in range(self.period_count)
+                ]
+            self._times = [self.convert_to_datetime(date) for date in dates]
+        return self._times
+
+    def time_series(self, obj_id, variables):
+        """
+        Values of variables of a node or link at every reporting period
+
+        Parameters:
+        obj_id (string): Id of the node or link
+        variables ([string]): names of the variables, e.g. ["depth", "head"]
+
+        Returns:
+        array: one row per period and one column per variable, a NumPy array or a
+               list of tuples if NumPy is not available
+        """
+        time_series = self.time_series_indexes[obj_id]
+        if time_series["type"] == "node":
+            offset = len(self.subcatchment_ids) * len(self.subcatchment_variables)
+            offset += time_series["index"] * len(self.node_variables)
+            codes = self.node_variables
+            names = NODE_VARIABLES
+        else:
+            offset = len(self.subcatchment_ids) * len(self.subcatchment_variables)
+            offset += len(self.node_ids) * len(self.node_variables)
+            offset += time_series["index"] * len(self.link_variables)
+            codes = self.link_variables
+            names = LINK_VARIABLES
+        offset = self.results_offset + DATE_SIZE + offset * REAL_SIZE
+        columns = [codes.index(names[variable]) for variable in variables]
+
+        if numpy is not None and self.mmap is not None:
+            # A strided view of the values of the object in every period
+            values = numpy.ndarray(
+                shape=(self.period_count, len(codes)),
+                dtype="<f4",
+                buffer=self.mmap,
+                offset=offset,
+                strides=(self.period_size, REAL_SIZE),
+            )
+            # Indexing with a list copies, the file can be closed afterwards
+            result = values[:, columns]
+            del values
+            return result
+
+        value_format = "<{}f".format(len(codes))
+        value_size = len(codes) * REAL_SIZE
+        rows = []
+        for period in range(self.period_count):
+            row = struct.unpack(
+                value_format, self.read(offset + period * self.period_size, value_size)
+            )
+            rows.append(tuple(row[column] for column in columns))
+        if numpy is not None:
+            return numpy.array(rows, dtype="<f4").reshape(
+                (self.period_count, len(columns))
+            )
+        return rows
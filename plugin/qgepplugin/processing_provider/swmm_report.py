@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ QGEP-swmm processing provider
+                              -------------------
+        begin                : 10.2026
+        copyright            : (C) 2026 by the QGEP project
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import mmap
+import re
+
+# Lines of an option in the "Analysis Options" section, e.g.
+#   Starting Date ............ 01/01/2020 00:00:00
+ANALYSIS_OPTION_PATTERN = re.compile(rb"^\s*(\S.*?)\s*\.{3,}\s*(.*?)\s*$")
+# Title of the time series of an object, e.g.
+#   <<< Node J1 >>>
+TIME_SERIES_PATTERN = re.compile(rb"^\s*<<< (Node|Link) (\S+)")
+
+# Number of lines between a summary title and its first data line
+SUMMARY_HEADING_LINES = 7
+# Number of lines between a time series title and its first data line
+TIME_SERIES_HEADING_LINES = 4
+
+
+class SwmmReport:
+    """
+    Index of a SWMM report (.rpt) file
+
+    The report is read once and the byte offsets of every section and of every
+    time series are recorded, the data of a section or an object is then read
+    by seeking directly to it. The file is memory mapped if possible.
+    """
+
+    def __init__(self, rpt_file, use_mmap=True):
+        """
+        Parameters:
+        rpt_file (path): path of the report file
+        use_mmap (boolean): memory map the file instead of reading it with seeks
+        """
+        self.rpt_file = rpt_file
+        self.use_mmap = use_mmap
+        self.file = None
+        self.mmap = None
+        self.analysis_options = {}
+        # (start offset, end offset) of the lines of the sections by title
+        self.sections = {}
+        # {"type", "start", "end"} byte offsets of the data lines by object id
+        self.time_series_indexes = {}
+        self.index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def lines(self):
+        """
+        Yields the (byte offset, line) of every line of the file
+        """
+        offset = 0
+        if self.mmap is not None:
+            self.mmap.seek(0)
+            lines = iter(self.mmap.readline, b"")
+        else:
+            self.file.seek(0)
+            lines = self.file
+        for line in lines:
+            yield offset, line
+            offset += len(line)
+
+    def index(self):
+        """
+        Reads the whole file once and records the byte offsets of its content
+        """
+        self.file = open(self.rpt_file, "rb")
+        if self.use_mmap:
+            try:
+                self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # Empty files can not be mapped
+                self.mmap = None
+
+        # Offset of the line of stars opening the current banner, a banner is a
+        # title surrounded by lines of stars
+        banner_offset = None
+        closing_banner_expected = False
+        section = None
+        time_series = None
+        # Number of lines since the title of the current time series
+        line_after_title = 0
+        end_of_file = 0
+        for offset, line in self.lines():
+            end_of_file = offset + len(line)
+            stripped_line = line.strip()
+
+            if stripped_line.startswith(b"*****"):
+                if closing_banner_expected:
+                    closing_banner_expected = False
+                else:
+                    banner_offset = offset
+                continue
+
+            if banner_offset is not None and stripped_line:
+                # A new section starts, the previous one ends with its banner
+                if section is not None:
+                    section[1] = banner_offset
+                section = [end_of_file, None]
+                self.sections[stripped_line.decode("utf-8")] = section
+                banner_offset = None
+                closing_banner_expected = True
+                time_series = None
+                continue
+
+            match = TIME_SERIES_PATTERN.match(line)
+            if match:
+                if time_series is not None and time_series["end"] is None:
+                    time_series["end"] = offset
+                time_series = {
+                    "type": match.group(1).decode("utf-8").lower(),
+                    "start": None,
+                    "end": None,
+                }
+                self.time_series_indexes[match.group(2).decode("utf-8")] = time_series
+                line_after_title = 0
+                continue
+
+            if time_series is not None and time_series["end"] is None:
+                line_after_title += 1
+                if line_after_title == TIME_SERIES_HEADING_LINES + 1:
+                    time_series["start"] = offset
+                if line_after_title > TIME_SERIES_HEADING_LINES and not stripped_line:
+                    time_series["end"] = offset
+                continue
+
+            match = ANALYSIS_OPTION_PATTERN.match(line)
+            if match:
+                self.analysis_options[match.group(1).decode("utf-8")] = match.group(
+                    2
+                ).decode("utf-8")
+
+        # Close what is still open at the end of the file
+        if section is not None:
+            section[1] = end_of_file
+        for time_series in self.time_series_indexes.values():
+            if time_series["start"] is None:
+                time_series["start"] = end_of_file
+            if time_series["end"] is None:
+                time_series["end"] = end_of_file
+
+    def read(self, start, end):
+        """
+        Reads the lines between two byte offsets
+
+        Returns:
+        [string]: the lines
+        """
+        if self.mmap is not None:
+            data = self.mmap[start:end]
+        else:
+            self.file.seek(start)
+            data = self.file.read(end - start)
+        return data.decode("utf-8").splitlines()
+
+    def analysis_option(self, parameter):
+        """
+        Value of an analysis option, e.g. "Starting Date"
+
+        Returns:
+        string: the value, None if the option is not in the report
+        """
+        if parameter in self.analysis_options:
+            return self.analysis_options[parameter]
+        for name, value in self.analysis_options.items():
+            if parameter in name:
+                return value
+        return None
+
+    def section_lines(self, title, heading_lines=SUMMARY_HEADING_LINES):
+        """
+        Data lines of a section, up to the first empty line after the heading
+
+        Parameters:
+        title (string): Title of the section, e.g. "Node Depth Summary"
+        heading_lines (integer): Number of lines between the title and the data
+
+        Returns:
+        Array of array: the values of each line
+        """
+        section = self.sections.get(title)
+        if section is None:
+            section = next(
+                (
+                    section
+                    for section_title, section in self.sections.items()
+                    if title in section_title
+                ),
+                None,
+            )
+        if section is None:
+            return []
+
+        lines = []
+        # The line of stars closing the title is the first heading line
+        for line in self.read(*section)[heading_lines:]:
+            if not line.strip():
+                break
+            lines.append(line.split())
+        return lines
+
+    def time_series(self, obj_id):
+        """
+        Data lines of the time series of a node or link
+
+        Returns:
+        Array of array: the values of each time step
+        """
+        time_series = self.time_series_indexes[obj_id]
+        return [
+            line.split()
+            for line in self.read(time_series["start"], time_series["end"])
+            if line.strip()
+        ]
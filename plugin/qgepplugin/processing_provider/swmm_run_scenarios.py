@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ QGEP-swmm processing provider
+                              -------------------
+        begin                : 10.2026
+        copyright            : (C) 2026 by the QGEP project
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import glob
+import os
+
+from processing.core.ProcessingConfig import ProcessingConfig
+from qgis.core import (
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingFeedback,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterFolderDestination,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
+)
+
+from .qgep_algorithm import QgepAlgorithm
+from .swmm_scenarios import SwmmScenario, SwmmScenarioRunner
+
+# This will get replaced with a git SHA1 when you do a git archive
+
+__revision__ = "$Format:%H$"
+
+
+class SwmmRunScenariosAlgorithm(QgepAlgorithm):
+    """"""
+
+    DATABASE = "DATABASE"
+    STATES = "STATES"
+    TEMPLATE_FOLDER = "TEMPLATE_FOLDER"
+    OUTPUT_FOLDER = "OUTPUT_FOLDER"
+    IMPORT_SUMMARY = "IMPORT_SUMMARY"
+    IMPORT_FULL_RESULTS = "IMPORT_FULL_RESULTS"
+    WORKERS = "WORKERS"
+    TIMEOUT = "TIMEOUT"
+
+    def name(self):
+        return "swmm_run_scenarios"
+
+    def displayName(self):
+        return self.tr("SWMM Run Scenarios")
+
+    def shortHelpString(self):
+        return self.tr(
+            """
+        Export, run and import several SWMM scenarios at once.
+        Each template INP file of the template folder is a rain event, a scenario is run for each rain event and each selected state.
+        The PRIMARY network is extracted once for each state, the simulations run in parallel and their results are imported as they finish.
+        The files of a scenario are named after the template and the state, e.g. T100_current.inp, and the simulation is named "SWMM simulation, T100, current".
+        """
+        )
+
+    def initAlgorithm(self, config=None):
+        """Here we define the inputs and output of the algorithm, along
+        with some other properties.
+        """
+        self.stateOptions = ["current", "planned"]
+        # The parameters
+        description = self.tr("Database")
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.DATABASE, description=description, defaultValue="pg_qgep"
+            )
+        )
+
+        description = self.tr("States")
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.STATES,
+                description=description,
+                options=self.stateOptions,
+                allowMultiple=True,
+                defaultValue=[0],
+            )
+        )
+
+        description = self.tr("Folder of the template INP files (one per rain event)")
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.TEMPLATE_FOLDER,
+                description=description,
+                behavior=QgsProcessingParameterFile.Folder,
+            )
+        )
+
+        description = self.tr("Destination folder of the INP, RPT and OUT files")
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                self.OUTPUT_FOLDER, description=description
+            )
+        )
+
+        description = self.tr("Import summary")
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.IMPORT_SUMMARY, description=description, defaultValue=True
+            )
+        )
+
+        description = self.tr("Import full results")
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.IMPORT_FULL_RESULTS, description=description, defaultValue=False
+            )
+        )
+
+        description = self.tr(
+            "Number of simultaneous simulations (0: number of processors)"
+        )
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.WORKERS,
+                description=description,
+                type=QgsProcessingParameterNumber.Integer,
+                minValue=0,
+                defaultValue=0,
+            )
+        )
+
+        description = self.tr("Maximum duration of a simulation in minutes (0: none)")
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.TIMEOUT,
+                description=description,
+                type=QgsProcessingParameterNumber.Double,
+                minValue=0,
+                defaultValue=0,
+            )
+        )
+
+    def processAlgorithm(
+        self, parameters, context: QgsProcessingContext, feedback: QgsProcessingFeedback
+    ):
+        """Here is where the processing itself takes place."""
+
+        feedback.setProgress(0)
+
+        # init params
+        database = self.parameterAsString(parameters, self.DATABASE, context)
+        states = [
+            self.stateOptions[int(state)]
+            for state in self.parameterAsEnums(parameters, self.STATES, context)
+        ]
+        template_folder = self.parameterAsFile(
+            parameters, self.TEMPLATE_FOLDER, context
+        )
+        output_folder = self.parameterAsString(parameters, self.OUTPUT_FOLDER, context)
+        import_summary = self.parameterAsBoolean(
+            parameters, self.IMPORT_SUMMARY, context
+        )
+        import_full_results = self.parameterAsBoolean(
+            parameters, self.IMPORT_FULL_RESULTS, context
+        )
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
+        timeout = self.parameterAsDouble(parameters, self.TIMEOUT, context)
+        swmm_cli = os.path.abspath(ProcessingConfig.getSetting("SWMM_PATH"))
+        if not swmm_cli:
+            raise QgsProcessingException(
+                self.tr(
+                    "Swmm command line tool is not configured.\n\
+                    Please configure it before running Swmm algorithms."
+                )
+            )
+
+        template_files = sorted(glob.glob(os.path.join(template_folder, "*.inp")))
+        if not template_files or not states:
+            raise QgsProcessingException(
+                self.tr("There is no template INP file or no state, nothing to run.")
+            )
+        os.makedirs(output_folder, exist_ok=True)
+
+        scenarios = []
+        for template_file in template_files:
+            rain = os.path.splitext(os.path.basename(template_file))[0]
+            for state in states:
+                scenarios.append(
+                    SwmmScenario(
+                        "{rain}_{state}".format(rain=rain, state=state),
+                        state,
+                        template_file,
+                        "SWMM simulation, {rain}, {state}".format(
+                            rain=rain, state=state
+                        ),
+                    )
+                )
+
+        runner = SwmmScenarioRunner(
+            database,
+            swmm_cli,
+            output_folder,
+            scenarios,
+            feedback,
+            workers=workers or None,
+            timeout=timeout * 60 or None,
+        )
+        runner.write_inputs("primary", None, None)
+        feedback.setProgress(10)
+        succeeded = runner.run(import_summary, import_full_results)
+        feedback.pushInfo(
+            "{succeeded} of {count} scenarios succeeded".format(
+                succeeded=len(succeeded), count=len(scenarios)
+            )
+        )
+
+        feedback.setProgress(100)
+
+        return {self.OUTPUT_FOLDER: output_folder}
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ QGEP-swmm processing provider
+                              -------------------
+        begin                : 10.2026
+        copyright            : (C) 2026 by the QGEP project
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import concurrent.futures
+import os
+import subprocess
+import threading
+
+try:
+    from .QgepSwmm import QgepSwmm
+except ImportError:
+    # Used as a standalone module, see swmm_templates/example_qgep_swmm_commands.py
+    from QgepSwmm import QgepSwmm
+
+# Interval in seconds at which the cancellation of the runs is checked
+CANCEL_CHECK_INTERVAL = 0.5
+
+
+class SwmmScenario:
+    """
+    A simulation of one rain event (template file) for one state of the network
+    """
+
+    def __init__(self, name, state, template_file, sim_description=None):
+        """
+        Parameters:
+        name (string): Name of the scenario, used to name its files
+        state (string): current or planned
+        template_file (path): path of the INP file which stores the simulation
+                              parameters, e.g. the rain event
+        sim_description (string): Title of the simulation in the database,
+                                  derived from the name by default
+        """
+        self.name = name
+        self.state = state
+        self.template_file = template_file
+        self.sim_description = sim_description or "SWMM simulation, {name}".format(
+            name=name
+        )
+
+    def qgep_swmm(self, service, directory, swmm_bin, feedback):
+        """
+        QgepSwmm handling the files of the scenario, which are named after the
+        scenario in the directory
+
+        Returns:
+        QgepSwmm
+        """
+        path = os.path.join(directory, self.name)
+        return QgepSwmm(
+            self.sim_description,
+            service,
+            self.state,
+            path + ".inp",
+            self.template_file,
+            path + ".rpt",
+            swmm_bin,
+            feedback,
+            outfile=path + ".out",
+        )
+
+
+class ScenarioFeedback:
+    """
+    Feedback of a single scenario, it forwards the messages to the feedback of
+    the runner which reports the progress of all the scenarios itself
+    """
+
+    def __init__(self, feedback):
+        self.feedback = feedback
+
+    def __getattr__(self, name):
+        return getattr(self.feedback, name)
+
+    def setProgress(self, progress):
+        pass
+
+
+class SwmmScenarioRunner:
+    """
+    Runs several SWMM scenarios
+
+    The swmm views are extracted once for each state and written in the input
+    files of all the scenarios of the state. SWMM is then executed for the
+    scenarios in parallel, each run in its own process, and the results of a run
+    are imported as soon as it is finished.
+    """
+
+    def __init__(
+        self,
+        service,
+        swmm_bin,
+        directory,
+        scenarios,
+        feedback,
+        workers=None,
+        timeout=None,
+    ):
+        """
+        Parameters:
+        service (string): name of the service to be used to connect to the QGEP database
+        swmm_bin (path): path of the swmm executable
+        directory (path): directory where the files of the scenarios are written
+        scenarios ([SwmmScenario]): the scenarios
+        feedback (pyQGIS feedback)
+        workers (integer): number of simultaneous runs, the number of processors
+                           by default
+        timeout (number): maximum duration of a run in seconds, unlimited if None
+        """
+        self.service = service
+        self.swmm_bin = swmm_bin
+        self.directory = directory
+        self.scenarios = scenarios
+        self.feedback = feedback
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.processes = set()
+        self.processes_lock = threading.Lock()
+        self.canceled = False
+        self.feedback_lock = threading.Lock()
+
+    def qgep_swmm(self, scenario, service=None):
+        return scenario.qgep_swmm(
+            service, self.directory, self.swmm_bin, self.scenario_feedback()
+        )
+
+    def scenario_feedback(self):
+        if self.feedback is None:
+            return None
+        return ScenarioFeedback(self.feedback)
+
+    def feedback_push(self, level, message):
+        if self.feedback is not None and message != "" and message is not None:
+            with self.feedback_lock:
+                if level == "info":
+                    self.feedback.pushInfo(message)
+                elif level == "warning":
+                    self.feedback.pushWarning(message)
+                elif level == "error":
+                    self.feedback.reportError(message)
+                else:
+                    self.feedback.pushInfo(message)
+        return
+
+    def feedback_set_progress(self, progress):
+        if self.feedback is not None:
+            with self.feedback_lock:
+                self.feedback.setProgress(progress)
+        return
+
+    def is_canceled(self):
+        return self.feedback is not None and self.feedback.isCanceled()
+
+    def write_inputs(self, hierarchy, selected_structures, selected_reaches):
+        """
+        Write the input files of all the scenarios, the swmm views are extracted
+        once for each state
+
+        Parameters:
+        hierarchy (string): hierarchy of the exported network, e.g. "primary"
+        selected_structures ([string]): List of obj_id of the selected structures
+        selected_reaches ([string]): List of obj_id of the selected reaches
+        """
+        states = []
+        for scenario in self.scenarios:
+            if scenario.state not in states:
+                states.append(scenario.state)
+
+        for state in states:
+            scenarios = [s for s in self.scenarios if s.state == state]
+            self.feedback_push(
+                "info",
+                "Extract the {state} network for {count} scenarios".format(
+                    state=state, count=len(scenarios)
+                ),
+            )
+            with QgepSwmm(
+                None,
+                self.service,
+                state,
+                None,
+                None,
+                None,
+                None,
+                self.scenario_feedback(),
+            ) as extraction:
+                sections = extraction.input_sections(
+                    hierarchy, selected_structures, selected_reaches
+                )
+                contents = extraction.extract_swmm_tables(
+                    [section[1:] for section in sections if section[0] == "table"]
+                )
+            try:
+                for scenario in scenarios:
+                    qs = self.qgep_swmm(scenario)
+                    qs.write_input_sections(sections, contents)
+            finally:
+                for content in contents:
+                    content.close()
+
+    def execute(self, scenario):
+        """
+        Execute SWMM for a scenario, runs in a thread of the pool
+
+        Returns:
+        string: output of swmm
+        """
+        command = self.qgep_swmm(scenario).swmm_command()
+        # Started under the lock, a cancellation either prevents or kills the run
+        with self.processes_lock:
+            if self.canceled:
+                return None
+            proc = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stdin=subprocess.DEVNULL,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+            )
+            self.processes.add(proc)
+        try:
+            try:
+                stdout, _ = proc.communicate(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.communicate()
+                raise
+        finally:
+            with self.processes_lock:
+                self.processes.discard(proc)
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, command, stdout)
+        return stdout
+
+    def cancel(self):
+        """
+        Stop the runs, the pending ones are not started
+        """
+        with self.processes_lock:
+            self.canceled = True
+            for proc in self.processes:
+                proc.kill()
+
+    def run(self, import_summary=True, import_full_results=False):
+        """
+        Execute SWMM for all the scenarios and import their results as the runs
+        finish
+
+        Parameters:
+        import_summary (boolean): import the summary of each run
+        import_full_results (boolean): import the full results of each run
+
+        Returns:
+        [SwmmScenario]: the scenarios which ran successfully
+        """
+        succeeded = []
+        finished = 0
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            # The runs are external processes, the threads only wait for them
+            futures = {
+                executor.submit(self.execute, scenario): scenario
+                for scenario in self.scenarios
+            }
+            pending = set(futures)
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending,
+                    timeout=CANCEL_CHECK_INTERVAL,
+                    return_when=concurrent.futures.FIRST_COMPLETED,
+                )
+                if self.is_canceled() and not self.canceled:
+                    self.feedback_push("warning", "Canceled, the runs are stopped")
+                    self.cancel()
+                for future in done:
+                    finished += 1
+                    scenario = futures[future]
+                    if self.import_results(
+                        scenario, future, import_summary, import_full_results
+                    ):
+                        succeeded.append(scenario)
+                    self.feedback_set_progress(10 + finished * 90 / len(self.scenarios))
+        return succeeded
+
+    def import_results(self, scenario, future, import_summary, import_full_results):
+        """
+        Import the results of a finished run
+
+        Returns:
+        boolean: whether the run succeeded
+        """
+        if self.canceled:
+            # The run was not started or was killed
+            return False
+        try:
+            prompt = future.result()
+        except subprocess.TimeoutExpired:
+            self.feedback_push(
+                "error",
+                "{name}: SWMM was stopped after {timeout} seconds".format(
+                    name=scenario.name, timeout=self.timeout
+                ),
+            )
+            return False
+        except (subprocess.CalledProcessError, OSError) as e:
+            self.feedback_push("error", "{name}: {e}".format(name=scenario.name, e=e))
+            return False
+        if "There are errors" in prompt:
+            self.feedback_push(
+                "error", "{name}: {prompt}".format(name=scenario.name, prompt=prompt)
+            )
+            return False
+
+        self.feedback_push("info", "{name}: simulation done".format(name=scenario.name))
+        if import_summary or import_full_results:
+            with self.qgep_swmm(scenario, self.service) as qs:
+                if import_summary:
+                    qs.import_summary(scenario.sim_description)
+                if import_full_results:
+                    qs.import_full_results(scenario.sim_description)
+        return True
@@ -26,11 +26,12 @@
 
 from __future__ import absolute_import, print_function
 
+import functools
 import logging
 import os
 from builtins import object, str
 
-from qgis.core import Qgis, QgsApplication
+from qgis.core import Qgis, QgsApplication, QgsProject
 from qgis.PyQt.QtCore import QLocale, QSettings, Qt
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction, QApplication, QToolBar
@@ -48,6 +49,7 @@ from .tools.qgepmaptools import (
     QgepTreeMapTool,
 )
 from .tools.qgepnetwork import QgepGraphManager
+from .tools.qgepterrain import QgepTerrainSamplingTask
 from .utils.plugin_utils import plugin_root_path
 from .utils.qgeplayermanager import QgepLayerManager, QgepLayerNotifier
 from .utils.qgeplogging import QgepQgsLogHandler
@@ -84,6 +86,11 @@ class QgepPlugin(object):
 
     profile = None
 
+    # The background task sampling the terrain model along the current profile
+    terrain_task = None
+    # Number of the current terrain sampling, chunks of older ones are dropped
+    terrain_request = 0
+
     def __init__(self, iface):
         self.iface = iface
         self.canvas = iface.mapCanvas()
@@ -257,7 +264,9 @@ class QgepPlugin(object):
         self.datamodelInitToolAction.triggered.connect(self.showDatamodelInitTool)
 
         # Add toolbar button and menu item
-        self.toolbar = QToolBar(QApplication.translate("TEKSI Wastewater", "TEKSI Wastewater"))
+        self.toolbar = QToolBar(
+            QApplication.translate("TEKSI Wastewater", "TEKSI Wastewater")
+        )
         self.toolbar.addAction(self.profileAction)
         self.toolbar.addAction(self.upstreamAction)
         self.toolbar.addAction(self.downstreamAction)
@@ -274,7 +283,9 @@ class QgepPlugin(object):
         if admin_mode and admin_mode != "false":
             self.toolbar.addAction(self.importAction)
             self.toolbar.addAction(self.exportAction)
-            self.iface.addPluginToMenu("TEKSI &Wastewater", self.datamodelInitToolAction)
+            self.iface.addPluginToMenu(
+                "TEKSI &Wastewater", self.datamodelInitToolAction
+            )
 
         self.iface.addToolBar(self.toolbar)
 
@@ -425,6 +436,8 @@ class QgepPlugin(object):
             )
             self.plotWidget.reachMouseOver.connect(self.highlightProfileElement)
             self.plotWidget.reachMouseOut.connect(self.unhighlightProfileElement)
+            self.plotWidget.reachPointMouseOver.connect(self.highlightProfileElement)
+            self.plotWidget.reachPointMouseOut.connect(self.unhighlightProfileElement)
             self.profile_dock.addPlotWidget(self.plotWidget)
             self.profile_dock.setTree(self.nodes, self.edges)
 
@@ -444,6 +457,52 @@ class QgepPlugin(object):
 
         if self.plotWidget:
             self.plotWidget.setProfile(profile)
+            self.sampleTerrain(self.profile_tool.pathPolyline)
+
+    def sampleTerrain(self, polyline):
+        """
+        Samples the configured terrain model along a path in the background
+        and streams the samples into the profile plot
+        @param polyline: The path of the profile
+        """
+        # Chunks of the previous task may already be queued, they are dropped
+        self.terrain_request += 1
+        if self.terrain_task is not None:
+            try:
+                self.terrain_task.samplesAvailable.disconnect()
+                self.terrain_task.cancel()
+            except RuntimeError:
+                # Already finished and deleted by the task manager
+                pass
+            self.terrain_task = None
+
+        project = QgsProject.instance()
+        terrain_layer_id, _ = project.readEntry("QGEP", "TerrainLayer")
+        terrain_layer = project.mapLayer(terrain_layer_id)
+        if terrain_layer is None or len(polyline) < 2:
+            return
+
+        spacing, _ = project.readDoubleEntry("QGEP", "TerrainSamplingDistance", 1.0)
+        self.terrain_task = QgepTerrainSamplingTask(
+            terrain_layer,
+            polyline,
+            self.network_analyzer.getNodeLayer().crs(),
+            spacing,
+        )
+        self.terrain_task.samplesAvailable.connect(
+            functools.partial(self.onTerrainSamples, self.terrain_request)
+        )
+        QgsApplication.taskManager().addTask(self.terrain_task)
+
+    def onTerrainSamples(self, request, samples):
+        """
+        Adds terrain samples to the profile plot, unless they belong to the
+        sampling of a previous profile
+        @param request: The number of the sampling the samples belong to
+        @param samples: The samples
+        """
+        if request == self.terrain_request and self.plotWidget:
+            self.plotWidget.addSurfaceSamples(samples)
 
     def onTreeChanged(self, nodes, edges):
         if self.profile_dock:
@@ -149,6 +149,15 @@ require( ["dojo/on", "dojo/ready", "dojo/_base/json", "dojo/_base/lang", "profil
         xAttr: "offset",
         yAttr: "backflowLevel"
       });
+
+      this.dem = new Surface({
+        svgProfile: this.profile,
+        x: this.x,
+        y: this.y,
+        className: "dem",
+        xAttr: "offset",
+        yAttr: "level"
+      });
     },
 
     onPrint: function ( mql )
@@ -261,6 +270,7 @@ require( ["dojo/on", "dojo/ready", "dojo/_base/json", "dojo/_base/lang", "profil
       this.specialStructure.redraw( duration );
       this.terrain.redraw( duration );
       this.backflow.redraw( duration );
+      this.dem.redraw( duration );
     }
   });
 
@@ -295,12 +305,22 @@ require( ["dojo/on", "dojo/ready", "dojo/_base/json", "dojo/_base/lang", "profil
           var nodeData = profileData.filter( function(d) { return d.type === 'node'; } );
           qgep.profilePlot.terrain.data( nodeData );
           qgep.profilePlot.backflow.data( nodeData );
+          // Terrain samples are streamed in later for the new path
+          qgep.profilePlot.dem.data( [] );
 
           qgep.profilePlot.scaleDomain();
           qgep.profilePlot.redraw();
         }
       );
 
+      profileProxy.surfaceSamplesAdded.connect(
+        function(data)
+        {
+          qgep.profilePlot.dem.appendData( dojo.fromJson(data) );
+          qgep.profilePlot.dem.redraw( 0 );
+        }
+      );
+
       profileProxy.verticalExaggerationChanged.connect(
         function(ve)
         {
@@ -38,6 +38,12 @@ define([ "dojo/_base/declare", "dojo/_base/lang", "profile/profileElement" ], fu
         .datum( surfaceData );
     },
 
+    // Add data to the already present data, used to stream in samples
+    appendData: function( data )
+    {
+      this.data( ( this.surface.datum() || [] ).concat( data ) );
+    },
+
     redraw: function( duration )
     {
       var opon = this.surface;
@@ -15,6 +15,8 @@ INPUT = "C:/temp/input.inp"
 TEMPLATEINP = "C:/temp/swmm_template.inp"
 # Path of the output report file
 REPORT = "C:/temp/summary.rpt"
+# Path of the binary output file, full results are read from it (optional)
+OUTPUT = "C:/temp/results.out"
 # Path of SWMM executable
 SWMM = "C:/Program Files (x86)/EPA SWMM 5.1.013/swmm5.exe"
 
@@ -27,6 +29,7 @@ with QgepSwmm(
     REPORT,
     SWMM,
     None,
+    outfile=OUTPUT,
 ) as qs:
     # Commands examples
 
@@ -38,3 +41,16 @@ with QgepSwmm(
     qs.import_summary("SWMM simulation, T100, current")
     # Import full results
     qs.import_full_results("SWMM simulation, T100, current")
+
+# Run several scenarios (rain events and states) in parallel
+#
+# from swmm_scenarios import SwmmScenario, SwmmScenarioRunner
+#
+# scenarios = [
+#     SwmmScenario("T10_current", "current", "C:/temp/T10.inp"),
+#     SwmmScenario("T100_current", "current", "C:/temp/T100.inp"),
+#     SwmmScenario("T100_planned", "planned", "C:/temp/T100.inp"),
+# ]
+# runner = SwmmScenarioRunner(PGSERVICE, SWMM, "C:/temp/scenarios", scenarios, None)
+# runner.write_inputs("primary", None, None)
+# runner.run(import_summary=True, import_full_results=False)
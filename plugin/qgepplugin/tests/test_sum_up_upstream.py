@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+#
+# Tests of the sum up upstream algorithm
+# -----------------------------------------------------------
+#
+# licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ---------------------------------------------------------------------
+
+"""
+Runs the client side execution mode of the sum up upstream algorithm on a small
+network in memory layers, no database is needed.
+
+    python3 -m unittest discover -s qgepplugin/tests -t .
+"""
+
+import os
+import unittest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from qgis.core import (  # noqa: E402
+    QgsApplication,
+    QgsFeature,
+    QgsField,
+    QgsGeometry,
+    QgsPointXY,
+    QgsProcessingFeedback,
+    QgsVectorLayer,
+)
+from qgis.PyQt.QtCore import QVariant  # noqa: E402
+
+from qgepplugin.processing_provider.sum_up_upstream import (  # noqa: E402
+    SumUpUpstreamAlgorithm,
+)
+
+# obj_id, from node, to node or reach of a blind connection, value, polyline
+REACHES = [
+    ("R1", "N1", "N2", 5, [(0, 0), (10, 0)]),
+    ("R2", "N2", "N3", 10, [(10, 0), (30, 0)]),
+    # Blind connection in the middle of R2
+    ("R3", "N4", "R2", 3, [(20, 10), (20, 0)]),
+]
+
+
+class TestSumUpUpstream(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QgsApplication([], False)
+        cls.app.initQgis()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.app.exitQgis()
+
+    def reach_layer(self):
+        layer = QgsVectorLayer("LineString?crs=EPSG:2056", "reach", "memory")
+        layer.dataProvider().addAttributes(
+            [
+                QgsField("obj_id", QVariant.String),
+                QgsField("rp_from_fk_wastewater_networkelement", QVariant.String),
+                QgsField("rp_to_fk_wastewater_networkelement", QVariant.String),
+                QgsField("value", QVariant.Double),
+            ]
+        )
+        layer.updateFields()
+        features = []
+        for obj_id, from_id, to_id, value, polyline in REACHES:
+            feature = QgsFeature(layer.fields())
+            feature.setAttributes([obj_id, from_id, to_id, value])
+            feature.setGeometry(
+                QgsGeometry.fromPolylineXY([QgsPointXY(x, y) for x, y in polyline])
+            )
+            features.append(feature)
+        layer.dataProvider().addFeatures(features)
+        return layer
+
+    def test_client_mode(self):
+        accumulator = SumUpUpstreamAlgorithm().index_reaches(
+            self.reach_layer(),
+            [("value", 0, "value"), ('"value" * 2', 1, "double")],
+            "obj_id",
+            "rp_from_fk_wastewater_networkelement",
+            "rp_to_fk_wastewater_networkelement",
+            QgsProcessingFeedback(),
+        )
+        self.assertIsNotNone(accumulator)
+        self.assertEqual(accumulator.node_value("N3"), (0, 0))
+        self.assertEqual(accumulator.node_value("N2"), (10, 20))
+        self.assertEqual(accumulator.node_value("N1"), (15, 30))
+        # Only the half of R2 downstream of the blind connection is added
+        self.assertEqual(accumulator.node_value("N4"), (8, 16))
+        self.assertEqual(accumulator.loop_nodes, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
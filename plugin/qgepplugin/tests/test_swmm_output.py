@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+#
+# Tests of the reader of SWMM binary output files
+# -----------------------------------------------------------
+#
+# licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ---------------------------------------------------------------------
+
+"""
+Reads a small SWMM binary output file written in a temporary directory, neither
+QGIS nor SWMM are needed.
+
+    python3 -m unittest discover -s qgepplugin/tests -t .
+"""
+
+import os
+import struct
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from qgepplugin.processing_provider import swmm_output
+from qgepplugin.processing_provider.swmm_output import MAGIC_NUMBER, SwmmOutput
+
+SUBCATCHMENT_IDS = ["S1"]
+NODE_IDS = ["J1", "J2"]
+LINK_IDS = ["C1"]
+# Codes of the reported variables, the order of the link ones is shuffled to
+# check that the variables are looked up by code
+SUBCATCHMENT_VARIABLES = [0, 1]
+NODE_VARIABLES = [0, 1, 2, 3, 4, 5]
+LINK_VARIABLES = [4, 0, 1, 2, 3]
+SYSTEM_VARIABLES = [0]
+# 01/01/2020 00:00:00 in days since the 30/12/1899
+REPORT_START = 43831.0
+REPORT_STEP = 300
+PERIOD_COUNT = 3
+
+
+def value(period, obj, code):
+    """
+    Value of a variable of an object in a period, exactly representable as a
+    4 byte real
+    """
+    return period * 100 + obj * 10 + code + 0.5
+
+
+def integers(*values):
+    return struct.pack("<{}i".format(len(values)), *values)
+
+
+def reals(*values):
+    return struct.pack("<{}f".format(len(values)), *values)
+
+
+def write_output(path, magic_number=MAGIC_NUMBER, error_code=0):
+    """
+    Writes a SWMM binary output file with values given by value()
+    """
+    data = integers(
+        magic_number,
+        51000,
+        4,
+        len(SUBCATCHMENT_IDS),
+        len(NODE_IDS),
+        len(LINK_IDS),
+        0,
+    )
+
+    ids_offset = len(data)
+    for name in SUBCATCHMENT_IDS + NODE_IDS + LINK_IDS:
+        data += integers(len(name)) + name.encode("utf-8")
+
+    # One property for the subcatchments, three for the nodes and five for
+    # the links
+    properties_offset = len(data)
+    for ids, codes in (
+        (SUBCATCHMENT_IDS, [1]),
+        (NODE_IDS, [0, 2, 3]),
+        (LINK_IDS, [0, 4, 4, 3, 5]),
+    ):
+        data += integers(len(codes), *codes)
+        data += reals(*[1.0] * (len(ids) * len(codes)))
+
+    for codes in (
+        SUBCATCHMENT_VARIABLES,
+        NODE_VARIABLES,
+        LINK_VARIABLES,
+        SYSTEM_VARIABLES,
+    ):
+        data += integers(len(codes), *codes)
+    data += struct.pack("<d", REPORT_START) + integers(REPORT_STEP)
+
+    results_offset = len(data)
+    # Objects are numbered across the types to give each one distinct values
+    objects = [
+        (SUBCATCHMENT_IDS, SUBCATCHMENT_VARIABLES),
+        (NODE_IDS, NODE_VARIABLES),
+        (LINK_IDS, LINK_VARIABLES),
+        (["system"], SYSTEM_VARIABLES),
+    ]
+    for period in range(PERIOD_COUNT):
+        data += struct.pack("<d", REPORT_START + (period + 1) * REPORT_STEP / 86400.0)
+        obj = 0
+        for ids, codes in objects:
+            for _obj_id in ids:
+                data += reals(*[value(period, obj, code) for code in codes])
+                obj += 1
+
+    data += integers(
+        ids_offset,
+        properties_offset,
+        results_offset,
+        PERIOD_COUNT,
+        error_code,
+        magic_number,
+    )
+    with open(path, "wb") as out_file:
+        out_file.write(data)
+
+
+class TestSwmmOutput(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.out_file = os.path.join(self.directory.name, "simulation.out")
+        write_output(self.out_file)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def check_output(self, use_mmap):
+        with SwmmOutput(self.out_file, use_mmap=use_mmap) as output:
+            self.assertEqual(output.flow_units, "LPS")
+            self.assertEqual(output.node_ids, NODE_IDS)
+            self.assertEqual(output.link_ids, LINK_IDS)
+            self.assertEqual(output.report_start, datetime(2020, 1, 1))
+            self.assertEqual(output.report_step, REPORT_STEP)
+            self.assertEqual(
+                output.times(),
+                [
+                    datetime(2020, 1, 1, 0, 5),
+                    datetime(2020, 1, 1, 0, 10),
+                    datetime(2020, 1, 1, 0, 15),
+                ],
+            )
+
+            # J2 is the third object, its head has the code 1 and its inflow
+            # the code 4
+            self.assertEqual(
+                [tuple(row) for row in output.time_series("J2", ["head", "inflow"])],
+                [(value(period, 2, 1), value(period, 2, 4)) for period in range(3)],
+            )
+            # C1 is the fourth object, its velocity has the code 2 and its
+            # flow the code 0, stored at the columns 3 and 1
+            self.assertEqual(
+                [tuple(row) for row in output.time_series("C1", ["velocity", "flow"])],
+                [(value(period, 3, 2), value(period, 3, 0)) for period in range(3)],
+            )
+            return output.time_series("J1", ["depth"])
+
+    @unittest.skipIf(swmm_output.numpy is None, "NumPy is not available")
+    def test_numpy(self):
+        for use_mmap in (True, False):
+            with self.subTest(use_mmap=use_mmap):
+                depths = self.check_output(use_mmap)
+                self.assertIsInstance(depths, swmm_output.numpy.ndarray)
+                self.assertEqual(depths.shape, (PERIOD_COUNT, 1))
+
+    def test_without_numpy(self):
+        with mock.patch.object(swmm_output, "numpy", None):
+            for use_mmap in (True, False):
+                with self.subTest(use_mmap=use_mmap):
+                    depths = self.check_output(use_mmap)
+                    self.assertEqual(
+                        depths, [(value(period, 1, 0),) for period in range(3)]
+                    )
+
+    def test_bad_magic_number(self):
+        write_output(self.out_file, magic_number=MAGIC_NUMBER + 1)
+        with self.assertRaises(ValueError):
+            SwmmOutput(self.out_file)
+
+    def test_error_code(self):
+        write_output(self.out_file, error_code=317)
+        with self.assertRaises(ValueError):
+            SwmmOutput(self.out_file)
+
+    def test_too_small(self):
+        with open(self.out_file, "wb") as out_file:
+            out_file.write(struct.pack("<i", MAGIC_NUMBER))
+        with self.assertRaises(ValueError):
+            SwmmOutput(self.out_file)
+
+
+if __name__ == "__main__":
+    unittest.main()
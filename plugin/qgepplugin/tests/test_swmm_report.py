@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+#
+# Tests of the reader of SWMM report files
+# -----------------------------------------------------------
+#
+# licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ---------------------------------------------------------------------
+
+"""
+Reads a small SWMM report file written in a temporary directory, neither QGIS
+nor SWMM are needed.
+
+    python3 -m unittest discover -s qgepplugin/tests -t .
+"""
+
+import os
+import tempfile
+import unittest
+
+from qgepplugin.processing_provider.swmm_report import SwmmReport
+
+REPORT = """
+  EPA STORM WATER MANAGEMENT MODEL - VERSION 5.1 (Build 5.1.015)
+  --------------------------------------------------------------
+
+  *********************************************************
+  NOTE: The summary statistics displayed in this report are
+  based on results found at every computational time step,
+  not just on results from each reporting time step.
+  *********************************************************
+
+  ****************
+  Analysis Options
+  ****************
+  Flow Units ............... LPS
+  Flow Routing Method ...... DYNWAVE
+  Starting Date ............ 01/01/2020 00:00:00
+  Ending Date .............. 01/01/2020 00:15:00
+  Report Time Step ......... 00:05:00
+
+
+  ******************
+  Node Depth Summary
+  ******************
+
+  ---------------------------------------------------------------------------------
+                                 Average  Maximum  Maximum  Time of Max    Reported
+                                   Depth    Depth      HGL   Occurrence   Max Depth
+  Node                 Type       Meters   Meters   Meters  days hr:min      Meters
+  ---------------------------------------------------------------------------------
+  J1                   JUNCTION     0.01     0.05   100.05     0  00:10        0.05
+  J2                   JUNCTION     0.02     0.08    99.08     0  00:10        0.08
+
+  Note: the summary is followed by a note.
+
+
+  ************
+  Node Results
+  ************
+
+  <<< Node J1 >>>
+  ----------------------------------------------------------
+                           Inflow  Flooding    Depth     Head
+  Date        Time            LPS       LPS        m        m
+  ----------------------------------------------------------
+  01/01/2020  00:05:00      1.000     0.000    0.010  100.010
+  01/01/2020  00:10:00      2.000     0.000    0.050  100.050
+  01/01/2020  00:15:00      1.500     0.000    0.020  100.020
+
+  <<< Node J2 >>>
+  ----------------------------------------------------------
+                           Inflow  Flooding    Depth     Head
+  Date        Time            LPS       LPS        m        m
+  ----------------------------------------------------------
+  01/01/2020  00:05:00      3.000     0.000    0.020   99.020
+  01/01/2020  00:10:00      4.000     0.500    0.080   99.080
+  01/01/2020  00:15:00      3.500     0.000    0.040   99.040
+
+
+  ************
+  Link Results
+  ************
+
+  <<< Link C1 >>>
+  ------------------------------------------------------
+                             Flow  Velocity     Depth   Capacity/
+  Date        Time            LPS       m/sec         m     Setting
+  ------------------------------------------------------
+  01/01/2020  00:05:00      3.000     0.500     0.020     0.100
+  01/01/2020  00:10:00      4.000     0.600     0.080     0.400
+  01/01/2020  00:15:00      3.500     0.550     0.040     0.200
+"""
+
+
+class TestSwmmReport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.rpt_file = os.path.join(self.directory.name, "simulation.rpt")
+        with open(self.rpt_file, "w") as rpt_file:
+            rpt_file.write(REPORT)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_report(self):
+        for use_mmap in (True, False):
+            with self.subTest(use_mmap=use_mmap), SwmmReport(
+                self.rpt_file, use_mmap=use_mmap
+            ) as report:
+                self.assertEqual(report.analysis_option("Flow Units"), "LPS")
+                self.assertEqual(
+                    report.analysis_option("Starting Date"), "01/01/2020 00:00:00"
+                )
+                # Options are also found by a part of their name
+                self.assertEqual(report.analysis_option("Routing"), "DYNWAVE")
+                self.assertIsNone(report.analysis_option("Wet Time Step"))
+
+                self.assertEqual(
+                    report.section_lines("Node Depth Summary"),
+                    [
+                        "J1 JUNCTION 0.01 0.05 100.05 0 00:10 0.05".split(),
+                        "J2 JUNCTION 0.02 0.08 99.08 0 00:10 0.08".split(),
+                    ],
+                )
+                # Sections are also found by a part of their title
+                self.assertEqual(len(report.section_lines("Depth Summary")), 2)
+                self.assertEqual(report.section_lines("Node Flooding Summary"), [])
+
+                self.assertEqual(
+                    report.time_series("J2"),
+                    [
+                        "01/01/2020 00:05:00 3.000 0.000 0.020 99.020".split(),
+                        "01/01/2020 00:10:00 4.000 0.500 0.080 99.080".split(),
+                        "01/01/2020 00:15:00 3.500 0.000 0.040 99.040".split(),
+                    ],
+                )
+                # The last time series ends with the file
+                self.assertEqual(report.time_series_indexes["C1"]["type"], "link")
+                self.assertEqual(
+                    [row[2] for row in report.time_series("C1")],
+                    ["3.000", "4.000", "3.500"],
+                )
+                with self.assertRaises(KeyError):
+                    report.time_series("J3")
+
+
+if __name__ == "__main__":
+    unittest.main()
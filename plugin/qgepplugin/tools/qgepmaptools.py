@@ -48,7 +48,7 @@ from qgis.gui import (
     QgsRubberBand,
     QgsVertexMarker,
 )
-from qgis.PyQt.QtCore import QCoreApplication, QSettings, Qt, pyqtSignal
+from qgis.PyQt.QtCore import QCoreApplication, QSettings, Qt, QTimer, pyqtSignal
 from qgis.PyQt.QtGui import QColor, QCursor
 from qgis.PyQt.QtWidgets import (
     QAction,
@@ -62,12 +62,7 @@ from qgis.PyQt.QtWidgets import (
 
 from ..utils.qgeplayermanager import QgepLayerManager
 from .qgepnetwork import QgepGraphManager
-from .qgepprofile import (
-    QgepProfile,
-    QgepProfileNodeElement,
-    QgepProfileReachElement,
-    QgepProfileSpecialStructureElement,
-)
+from .qgepprofile import QgepProfile
 
 
 class CounterMatchFilter(QgsPointLocator.MatchFilter):
@@ -370,65 +365,9 @@ class QgepProfileMapTool(QgepMapTool):
         if len(vertices) > 1:
             self.rubberBand.reset()
 
-            elem = QgepProfileNodeElement(
-                vertices[0], node_features, self.segmentOffset
+            self.segmentOffset = self.profile.addPath(
+                vertices, edges, node_features, edge_features, self.segmentOffset
             )
-            self.profile.addElement(vertices[0], elem)
-
-            for p1, p2, edge in edges:
-                from_offset = self.segmentOffset
-                to_offset = self.segmentOffset + edge["weight"]
-
-                if "reach" == edge["objType"]:
-                    if self.profile.hasElement(edge["baseFeature"]):
-                        self.profile[edge["baseFeature"]].addSegment(
-                            p1,
-                            p2,
-                            edge["feature"],
-                            node_features,
-                            edge_features,
-                            from_offset,
-                            to_offset,
-                        )
-                    else:
-                        elem = QgepProfileReachElement(
-                            p1,
-                            p2,
-                            edge["feature"],
-                            node_features,
-                            edge_features,
-                            from_offset,
-                            to_offset,
-                        )
-                        self.profile.addElement(elem.obj_id, elem)
-
-                elif "special_structure" == edge["objType"]:
-                    if self.profile.hasElement(edge["baseFeature"]):
-                        self.profile[edge["baseFeature"]].addSegment(
-                            p1,
-                            p2,
-                            edge["feature"],
-                            node_features,
-                            edge_features,
-                            from_offset,
-                            to_offset,
-                        )
-                    else:
-                        elem = QgepProfileSpecialStructureElement(
-                            p1,
-                            p2,
-                            edge["feature"],
-                            node_features,
-                            edge_features,
-                            from_offset,
-                            to_offset,
-                        )
-                        self.profile.addElement(elem.obj_id, elem)
-
-                elem = QgepProfileNodeElement(p2, node_features, to_offset)
-                self.profile.addElement(p2, elem)
-
-                self.segmentOffset = to_offset
 
             # Create rubberband geometry
             for feat_id in edge_ids:
@@ -500,12 +439,21 @@ class QgepTreeMapTool(QgepMapTool):
 
     treeChanged = pyqtSignal(list, list)
 
+    # Number of edges added to the rubberband per rendering step
+    RENDER_BATCH_SIZE = 500
+
     def __init__(self, canvas, button, network_analyzer):
         QgepMapTool.__init__(self, canvas, button, network_analyzer)
 
         self.direction = "downstream"
         self.saveTool = None
 
+        # Renders the tree step by step from the event loop, so the UI stays responsive
+        self.pendingGeometries = None
+        self.renderTimer = QTimer()
+        self.renderTimer.setInterval(0)
+        self.renderTimer.timeout.connect(self.renderNextBatch)
+
     def setDirection(self, direction):
         """
         Set the direction to track the graph.
@@ -521,24 +469,55 @@ class QgepTreeMapTool(QgepMapTool):
         QApplication.setOverrideCursor(Qt.WaitCursor)
         upstream = self.direction == "upstream"
 
+        self.cancelRendering()
         self.rubberBand.reset()
 
         nodes, edges = self.network_analyzer.getTree(node_id, upstream)
-        polylines = self.network_analyzer.getEdgeGeometry(
-            [edge[2]["feature"] for edge in edges]
+
+        # The edges are in the order in which they have been discovered, the
+        # rubberband grows from the start node outwards
+        self.pendingGeometries = self.network_analyzer.getEdgeGeometries(
+            [edge[2]["feature"] for edge in edges], self.RENDER_BATCH_SIZE
         )
+        self.renderTimer.start()
+
+        self.treeChanged.emit(nodes, edges)
+
+        QApplication.restoreOverrideCursor()
+
+    def renderNextBatch(self):
+        """
+        Adds the next batch of edges of the current tree to the rubberband.
+        """
+        try:
+            polylines = next(self.pendingGeometries)
+        except (StopIteration, TypeError):
+            self.cancelRendering()
+            return
 
         # Fix for QGIS < 2.0
         filtered_polylines = [pl for pl in polylines if pl]
 
-        self.rubberBand.addGeometry(
-            QgsGeometry.fromMultiPolylineXY(filtered_polylines),
-            self.network_analyzer.getNodeLayer(),
-        )
+        if filtered_polylines:
+            self.rubberBand.addGeometry(
+                QgsGeometry.fromMultiPolylineXY(filtered_polylines),
+                self.network_analyzer.getNodeLayer(),
+            )
 
-        self.treeChanged.emit(nodes, edges)
+    def cancelRendering(self):
+        """
+        Stops rendering the current tree. What has been rendered so far is kept.
+        """
+        self.renderTimer.stop()
+        self.pendingGeometries = None
 
-        QApplication.restoreOverrideCursor()
+    def keyPressEvent(self, event):
+        """
+        Escape cancels rendering a tree
+        :param event: QKeyEvent
+        """
+        if event.key() == Qt.Key_Escape:
+            self.cancelRendering()
 
     def canvasMoveEvent(self, event):
         """
@@ -566,6 +545,7 @@ class QgepTreeMapTool(QgepMapTool):
         Resets the rubberband on right clickl
         :param _: QMouseEvent
         """
+        self.cancelRendering()
         self.rubberBand.reset()
 
     def leftClicked(self, event):
@@ -590,6 +570,7 @@ class QgepTreeMapTool(QgepMapTool):
         Deactivates this map tool. Removes the rubberband etc.
         """
         QgepMapTool.deactivate(self)
+        self.cancelRendering()
         self.rubberBand.reset()
 
         for marker in self.highlightedPoints:
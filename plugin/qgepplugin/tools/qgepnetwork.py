@@ -37,7 +37,14 @@ from builtins import object, str, zip
 from collections import defaultdict
 
 import networkx as nx
-from qgis.core import NULL, Qgis, QgsGeometry, QgsMessageLog, QgsPointXY
+from qgis.core import (
+    NULL,
+    Qgis,
+    QgsFeatureRequest,
+    QgsGeometry,
+    QgsMessageLog,
+    QgsPointXY,
+)
 from qgis.PyQt.QtCore import QObject, Qt, pyqtSignal
 
 from qgepplugin.utils.qt_utils import OverrideCursor
@@ -318,11 +325,32 @@ class QgepGraphManager(QObject):
         :param edges:  A list of edges
         :return:       A list of polylines
         """
-        cache = self.getFeaturesById(self.edge_layer, edges)
-        polylines = [
-            feat.geometry().asPolyline() for feat in list(cache.asDict().values())
+        return [
+            polyline
+            for polylines in self.getEdgeGeometries(edges)
+            for polyline in polylines
         ]
-        return polylines
+
+    def getEdgeGeometries(self, edges, batch_size=1000):
+        """
+        Get the geometry for some edges in batches, in the order of the edges.
+        The features are requested by their id, one request per batch.
+        :param edges:      A list of edges
+        :param batch_size: The number of edges per batch
+        :return:           A generator yielding a list of polylines per batch
+        """
+        data_provider = self.edge_layer.dataProvider()
+        for i in range(0, len(edges), batch_size):
+            batch = edges[i : i + batch_size]
+            request = QgsFeatureRequest().setFilterFids(batch)
+            request.setNoAttributes()
+            # The provider returns the features in its own order
+            features = {feat.id(): feat for feat in data_provider.getFeatures(request)}
+            yield [
+                features[edge].geometry().asPolyline()
+                for edge in batch
+                if edge in features
+            ]
 
     # pylint: disable=no-self-use
     def getFeaturesById(self, layer, ids):
@@ -332,11 +360,11 @@ class QgepGraphManager(QObject):
         feat_cache = QgepFeatureCache(layer)
         data_provider = layer.dataProvider()
 
-        features = data_provider.getFeatures()
+        request = QgsFeatureRequest().setFilterFids(list(ids))
+        features = data_provider.getFeatures(request)
 
         for feat in features:
-            if feat.id() in ids:
-                feat_cache.addFeature(feat)
+            feat_cache.addFeature(feat)
 
         return feat_cache
 
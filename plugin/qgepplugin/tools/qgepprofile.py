@@ -37,6 +37,8 @@ class QgepProfileElement(object):
     """
 
     feat = None
+    obj_id = None
+    gid = None
 
     def __init__(self, element_type):
         self.type = element_type
@@ -53,11 +55,23 @@ class QgepProfileElement(object):
         """
         return self.feat
 
+    def highlightGeometry(self):
+        """
+        Override this method and return the geometry which represents
+        the feature of this element on the map
+        """
+        return None
+
     def highlight(self, rubberband):
         """
-        Override this method and update the rubberband so it will represent
-        the feature which this element represents
+        Update the rubberband so it will represent the feature which this
+        element represents
         """
+        geometry = self.highlightGeometry()
+        if geometry is None:
+            rubberband.reset()
+        else:
+            rubberband.setToGeometry(geometry, None)
 
 
 class QgepProfileEdgeElement(QgepProfileElement):
@@ -65,8 +79,6 @@ class QgepProfileEdgeElement(QgepProfileElement):
     Define the base attributes for all edge elements (reaches and special structures)
     """
 
-    obj_id = None
-    gid = None
     blind_connections = None
 
     def __init__(
@@ -284,11 +296,11 @@ class QgepProfileReachElement(QgepProfileEdgeElement):
         )
         return el
 
-    def highlight(self, rubberband):
+    def highlightGeometry(self):
         """
-        Highlights this element
+        The detail geometry of the reach
         """
-        rubberband.setToGeometry(self.detail_geometry, None)
+        return self.detail_geometry
 
 
 class QgepProfileSpecialStructureElement(QgepProfileEdgeElement):
@@ -404,11 +416,11 @@ class QgepProfileSpecialStructureElement(QgepProfileEdgeElement):
                 defining_wastewater_node, "detail_geometry"
             )
 
-    def highlight(self, rubberband):
+    def highlightGeometry(self):
         """
-        Highlights this element
+        The detail geometry of the defining wastewater node
         """
-        rubberband.setToGeometry(self.detailGeometry, None)
+        return self.detailGeometry
 
     def asDict(self):
         el = QgepProfileEdgeElement.asDict(self)
@@ -432,16 +444,26 @@ class QgepProfileNodeElement(QgepProfileElement):
 
     cover_level = None
     offset = None
+    geometry = None
 
     def __init__(self, point_id, node_cache, offset):
         QgepProfileElement.__init__(self, "node")
 
         point = node_cache.featureById(point_id)
 
+        self.obj_id = node_cache.attrAsUnicode(point, "obj_id")
+        self.gid = point_id
+        self.geometry = point.geometry()
         self.offset = offset
         self.cover_level = node_cache.attrAsFloat(point, "cover_level")
         self.backflow_level = node_cache.attrAsFloat(point, "backflow_level")
 
+    def highlightGeometry(self):
+        """
+        The point of the node
+        """
+        return self.geometry
+
     def asDict(self):
         el = QgepProfileElement.asDict(self)
         el.update(
@@ -465,6 +487,30 @@ class QgepProfile(object):
         if elements is None:
             elements = {}
         self.elements = elements
+        self.highlighted = None
+        self.buildIndex()
+
+    def buildIndex(self):
+        """
+        Index all elements by object id, so hovering elements in the plot does not
+        need any lookup besides a dict access.
+        """
+        self.elementsByObjId = {}
+        self.fidsByObjId = {}
+        self.highlightGeometries = {}
+        for elem in self.elements.values():
+            self.indexElement(elem)
+
+    def indexElement(self, elem):
+        """
+        Add an element to the object id index
+        :param elem: A subclass of QgepProfileElement
+        """
+        if elem.obj_id is None:
+            return
+        self.elementsByObjId[elem.obj_id] = elem
+        self.fidsByObjId[elem.obj_id] = elem.gid
+        self.highlightGeometries[elem.obj_id] = elem.highlightGeometry()
 
     def setRubberband(self, rubberband):
         """
@@ -500,6 +546,79 @@ class QgepProfile(object):
         :param elem: A subclass of QgepProfileElement
         """
         self.elements[key] = elem
+        self.indexElement(elem)
+
+    def elementByObjId(self, obj_id):
+        """
+        Get an element by the object id of the feature it represents
+        :param obj_id: An object id
+        :return:       A subclass of QgepProfileElement or None
+        """
+        return self.elementsByObjId.get(obj_id)
+
+    def featureId(self, obj_id):
+        """
+        Get the feature id of the network feature representing an object
+        :param obj_id: An object id
+        :return:       A feature id or None
+        """
+        return self.fidsByObjId.get(obj_id)
+
+    def addPath(self, vertices, edges, node_features, edge_features, offset=0):
+        """
+        Append a path found on the network graph to this profile
+        :param vertices:      The node ids of the path
+        :param edges:         The (from node id, to node id, edge data) tuples of the path
+        :param node_features: A QgepFeatureCache with all nodes of the path
+        :param edge_features: A QgepFeatureCache with all edges of the path
+        :param offset:        The offset of the first vertex relative to the start of the profile
+        :return:              The offset of the last vertex
+        """
+        elem = QgepProfileNodeElement(vertices[0], node_features, offset)
+        self.addElement(vertices[0], elem)
+
+        for p1, p2, edge in edges:
+            from_offset = offset
+            to_offset = offset + edge["weight"]
+
+            if "reach" == edge["objType"]:
+                element_class = QgepProfileReachElement
+            elif "special_structure" == edge["objType"]:
+                element_class = QgepProfileSpecialStructureElement
+            else:
+                element_class = None
+
+            if element_class is not None:
+                if self.hasElement(edge["baseFeature"]):
+                    self[edge["baseFeature"]].addSegment(
+                        p1,
+                        p2,
+                        edge["feature"],
+                        node_features,
+                        edge_features,
+                        from_offset,
+                        to_offset,
+                    )
+                    # The highlight geometry may have changed with the segment
+                    self.indexElement(self[edge["baseFeature"]])
+                else:
+                    elem = element_class(
+                        p1,
+                        p2,
+                        edge["feature"],
+                        node_features,
+                        edge_features,
+                        from_offset,
+                        to_offset,
+                    )
+                    self.addElement(elem.obj_id, elem)
+
+            elem = QgepProfileNodeElement(p2, node_features, to_offset)
+            self.addElement(p2, elem)
+
+            offset = to_offset
+
+        return offset
 
     def getElements(self):
         """
@@ -522,13 +641,21 @@ class QgepProfile(object):
         Reset the profile ( forget about all elements )
         """
         self.elements = {}
+        self.highlighted = None
+        self.buildIndex()
 
     def highlight(self, obj_id):
         """
         Update a rubberband to highlight a given object
         :param obj_id: the object id of the object to hihglight
         """
-        if obj_id is not None:
-            self.elements[obj_id].highlight(self.rubberband)
+        # Mouse over events are repeated while hovering the same element
+        if obj_id == self.highlighted:
+            return
+        self.highlighted = obj_id
+
+        geometry = self.highlightGeometries.get(obj_id)
+        if geometry is not None:
+            self.rubberband.setToGeometry(geometry, None)
         else:
             self.rubberband.reset()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+#
+# QGEP terrain
+# Copyright (C) 2026  by the QGEP project
+# -----------------------------------------------------------
+#
+# licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# ---------------------------------------------------------------------
+
+"""
+Samples a terrain model (DEM) along a profile path
+"""
+
+import math
+
+from qgis.core import (
+    QgsCoordinateTransform,
+    QgsPointXY,
+    QgsProject,
+    QgsRectangle,
+    QgsTask,
+)
+from qgis.PyQt.QtCore import pyqtSignal
+
+
+def densify_polyline(polyline, spacing):
+    """
+    Walks a polyline once and yields points at a fixed spacing
+    :param polyline: A list of QgsPointXY
+    :param spacing:  The distance between two samples
+    :return:         A generator of (offset, QgsPointXY) tuples
+    """
+    offset = 0.0
+    next_offset = 0.0
+    for start, end in zip(polyline[:-1], polyline[1:]):
+        segment_length = math.hypot(end.x() - start.x(), end.y() - start.y())
+        while segment_length and next_offset <= offset + segment_length:
+            ratio = (next_offset - offset) / segment_length
+            yield next_offset, QgsPointXY(
+                start.x() + ratio * (end.x() - start.x()),
+                start.y() + ratio * (end.y() - start.y()),
+            )
+            next_offset += spacing
+        offset += segment_length
+
+    # Always finish the surface at the end of the path
+    if polyline and next_offset - spacing < offset:
+        yield offset, QgsPointXY(polyline[-1])
+
+
+class QgepTerrainSamplingTask(QgsTask):
+    """
+    Samples a raster layer at a fixed spacing along a polyline.
+
+    The samples are emitted in chunks as lists of {"offset": ..., "level": ...}
+    dicts. Each chunk is served from a single raster block, so the data provider
+    is queried once per chunk instead of once per sampled point.
+    """
+
+    samplesAvailable = pyqtSignal(list)
+
+    # Upper bounds for the samples and raster cells served from a single block
+    MAX_CHUNK_SAMPLES = 1000
+    MAX_BLOCK_CELLS = 4000000
+
+    def __init__(self, raster_layer, polyline, crs, spacing, band=1):
+        """
+        :param raster_layer: The terrain model (QgsRasterLayer)
+        :param polyline:     The profile path as a list of QgsPointXY
+        :param crs:          The crs of the polyline
+        :param spacing:      The distance between two samples in map units of crs
+        :param band:         The raster band holding the elevation
+        """
+        QgsTask.__init__(self, "Sample terrain along profile", QgsTask.CanCancel)
+        # Data providers are not thread safe, work on a clone
+        self.provider = raster_layer.dataProvider().clone()
+        self.extent = self.provider.extent()
+        self.pixel_width = raster_layer.rasterUnitsPerPixelX()
+        self.pixel_height = raster_layer.rasterUnitsPerPixelY()
+        self.transform = QgsCoordinateTransform(
+            crs, raster_layer.crs(), QgsProject.instance()
+        )
+        self.polyline = list(polyline)
+        self.spacing = spacing
+        self.band = band
+
+    def run(self):
+        """
+        Samples the terrain. Runs in a background thread.
+        """
+        total_length = sum(
+            math.hypot(end.x() - start.x(), end.y() - start.y())
+            for start, end in zip(self.polyline[:-1], self.polyline[1:])
+        )
+
+        chunk = []
+        bbox = QgsRectangle()
+        for offset, point in densify_polyline(self.polyline, self.spacing):
+            if self.isCanceled():
+                return False
+
+            point = self.transform.transform(point)
+            extended_bbox = QgsRectangle(bbox) if chunk else QgsRectangle(point, point)
+            extended_bbox.combineExtentWith(point.x(), point.y())
+
+            if chunk and (
+                len(chunk) >= self.MAX_CHUNK_SAMPLES
+                or self._cells(extended_bbox) > self.MAX_BLOCK_CELLS
+            ):
+                self.samplesAvailable.emit(self._sample(chunk, bbox))
+                if total_length:
+                    self.setProgress(100.0 * offset / total_length)
+                chunk = []
+                extended_bbox = QgsRectangle(point, point)
+
+            chunk.append((offset, point))
+            bbox = extended_bbox
+
+        if chunk:
+            self.samplesAvailable.emit(self._sample(chunk, bbox))
+
+        return True
+
+    def _cells(self, bbox):
+        """
+        The number of raster cells covered by a bounding box
+        """
+        return (bbox.width() / self.pixel_width + 1) * (
+            bbox.height() / self.pixel_height + 1
+        )
+
+    def _cell(self, x, y):
+        """
+        The (column, row) of the raster cell containing a point
+        """
+        return (
+            int(math.floor((x - self.extent.xMinimum()) / self.pixel_width)),
+            int(math.floor((self.extent.yMaximum() - y) / self.pixel_height)),
+        )
+
+    def _sample(self, chunk, bbox):
+        """
+        Reads a single raster block covering all points of the chunk and looks up
+        the level of every point in it.
+        :param chunk: A list of (offset, QgsPointXY) in raster crs
+        :param bbox:  The bounding box of all points in the chunk
+        :return:      A list of samples
+        """
+        # Snap the block to the raster grid, so cells map 1:1 to the source
+        col_min, row_min = self._cell(bbox.xMinimum(), bbox.yMaximum())
+        col_max, row_max = self._cell(bbox.xMaximum(), bbox.yMinimum())
+        col_min, row_min = max(col_min, 0), max(row_min, 0)
+        col_max = min(col_max, self.provider.xSize() - 1)
+        row_max = min(row_max, self.provider.ySize() - 1)
+        cols = col_max - col_min + 1
+        rows = row_max - row_min + 1
+
+        block = None
+        if cols > 0 and rows > 0:
+            block_extent = QgsRectangle(
+                self.extent.xMinimum() + col_min * self.pixel_width,
+                self.extent.yMaximum() - (row_max + 1) * self.pixel_height,
+                self.extent.xMinimum() + (col_max + 1) * self.pixel_width,
+                self.extent.yMaximum() - row_min * self.pixel_height,
+            )
+            block = self.provider.block(self.band, block_extent, cols, rows)
+
+        samples = []
+        for offset, point in chunk:
+            level = None
+            if block is not None and block.isValid():
+                col, row = self._cell(point.x(), point.y())
+                col -= col_min
+                row -= row_min
+                if 0 <= col < cols and 0 <= row < rows and not block.isNoData(row, col):
+                    level = block.value(row, col)
+            samples.append({"offset": offset, "level": level})
+
+        return samples
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+#
+# Benchmark of the network tools on synthetic networks
+# -----------------------------------------------------------
+#
+# licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# ---------------------------------------------------------------------
+
+"""
+Measures how building the network graph, path finding, tree tracking and the
+profile generation scale with the size of the network.
+
+Synthetic networks with the layout of vw_network_node / vw_network_segment are
+generated in memory layers, no database and no QGIS GUI are needed. The results
+are written as JSON, so they can be compared between revisions.
+
+    python3 scripts/benchmark_network.py --sizes 1000 10000 100000 -o results.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import networkx as nx  # noqa: E402
+from qgis.core import (  # noqa: E402
+    Qgis,
+    QgsApplication,
+    QgsFeature,
+    QgsField,
+    QgsGeometry,
+    QgsPointXY,
+    QgsVectorLayer,
+)
+from qgis.PyQt.QtCore import QVariant  # noqa: E402
+
+from qgepplugin.tools.qgepnetwork import QgepGraphManager  # noqa: E402
+from qgepplugin.tools.qgepprofile import QgepProfile  # noqa: E402
+
+NODE_FIELDS = [
+    ("obj_id", QVariant.String),
+    ("type", QVariant.String),
+    ("node_type", QVariant.String),
+    ("level", QVariant.Double),
+    ("usage_current", QVariant.String),
+    ("cover_level", QVariant.Double),
+    ("backflow_level", QVariant.Double),
+    ("description", QVariant.String),
+    ("detail_geometry", QVariant.String),
+]
+
+SEGMENT_FIELDS = [
+    ("obj_id", QVariant.String),
+    ("type", QVariant.String),
+    ("clear_height", QVariant.Double),
+    ("length_calc", QVariant.Double),
+    ("length_full", QVariant.Double),
+    ("from_obj_id", QVariant.String),
+    ("to_obj_id", QVariant.String),
+    ("from_obj_id_interpolate", QVariant.String),
+    ("to_obj_id_interpolate", QVariant.String),
+    ("from_pos", QVariant.Double),
+    ("to_pos", QVariant.Double),
+    ("bottom_level", QVariant.Double),
+    ("usage_current", QVariant.Int),
+    ("material", QVariant.String),
+    ("detail_geometry", QVariant.String),
+]
+
+
+class SyntheticNetwork(object):
+    """
+    A random tree shaped wastewater network, draining to a single outlet.
+
+    Every manhole is a wastewater node connected to its reaches through reach
+    points and special structure segments, the same way qgep_network builds it.
+    Some reaches end in a blind connection on the outgoing reach of their
+    downstream manhole, which splits that reach into two segments.
+    """
+
+    def __init__(
+        self,
+        segment_count,
+        branch_ratio=0.3,
+        blind_ratio=0.05,
+        special_structure_ratio=0.05,
+        seed=0,
+    ):
+        self.random = random.Random(seed)
+        self.nodes = []
+        self.segments = []
+        # Roughly three segments per manhole: node -> reach point -> reach point -> node
+        self.manhole_count = max(2, segment_count // 3)
+        self.branch_ratio = branch_ratio
+        self.blind_ratio = blind_ratio
+        self.special_structure_ratio = special_structure_ratio
+
+        self._build()
+
+    def _add_node(self, obj_id, node_type, point, level, cover_level=None):
+        kind = (
+            "wastewater_node"
+            if node_type in ("manhole", "special_structure")
+            else node_type
+        )
+        self.nodes.append(
+            {
+                "obj_id": obj_id,
+                "type": kind,
+                "node_type": node_type,
+                "level": level,
+                "usage_current": None,
+                "cover_level": cover_level,
+                "backflow_level": None,
+                "description": obj_id,
+                "point": point,
+            }
+        )
+
+    def _add_segment(self, obj_id, segment_type, from_node, to_node, reach=None):
+        polyline = [from_node["point"], to_node["point"]]
+        length = math.hypot(
+            polyline[1].x() - polyline[0].x(), polyline[1].y() - polyline[0].y()
+        )
+        levels = [n["level"] for n in (from_node, to_node) if n["level"] is not None]
+        self.segments.append(
+            {
+                "obj_id": obj_id,
+                "type": segment_type,
+                "clear_height": 300.0 if reach else None,
+                "length_calc": length,
+                "length_full": reach["length"] if reach else None,
+                "from_obj_id": from_node["obj_id"],
+                "to_obj_id": to_node["obj_id"],
+                "from_obj_id_interpolate": from_node["obj_id"],
+                "to_obj_id_interpolate": to_node["obj_id"],
+                "from_pos": 0,
+                "to_pos": 1,
+                "bottom_level": None if reach or not levels else max(levels),
+                "usage_current": 4514 if reach else None,
+                "material": "PVC" if reach else None,
+                "polyline": polyline,
+            }
+        )
+
+    def _build(self):
+        rnd = self.random
+
+        # Place the manholes: each one drains into an earlier one, either
+        # continuing the current line or starting a new branch
+        points = [QgsPointXY(2600000, 1200000)]
+        parents = [None]
+        levels = [400.0]
+        for i in range(1, self.manhole_count):
+            if rnd.random() < self.branch_ratio:
+                parent = rnd.randrange(i)
+            else:
+                parent = i - 1
+            angle = rnd.uniform(0, 2 * math.pi)
+            distance = rnd.uniform(20, 60)
+            points.append(
+                QgsPointXY(
+                    points[parent].x() + distance * math.cos(angle),
+                    points[parent].y() + distance * math.sin(angle),
+                )
+            )
+            parents.append(parent)
+            levels.append(levels[parent] + distance * rnd.uniform(0.005, 0.03))
+
+        # The reach leaving manhole i ends at manhole parents[i], some reaches
+        # end blind on the reach leaving their parent instead
+        blind_targets = {}
+        for i in range(1, self.manhole_count):
+            parent = parents[i]
+            if parents[parent] is not None and rnd.random() < self.blind_ratio:
+                blind_targets.setdefault(parent, []).append(i)
+
+        manholes = []
+        for i, point in enumerate(points):
+            obj_id = "WN{:08d}".format(i)
+            node_type = (
+                "special_structure"
+                if rnd.random() < self.special_structure_ratio
+                else "manhole"
+            )
+            self._add_node(obj_id, node_type, point, levels[i], levels[i] + 2.5)
+            manholes.append(self.nodes[-1])
+
+        blind_nodes = {}
+        downstream_reach_points = []
+        for i in range(1, self.manhole_count):
+            parent = parents[i]
+            reach = {
+                "obj_id": "RE{:08d}".format(i),
+                "length": math.hypot(
+                    points[i].x() - points[parent].x(),
+                    points[i].y() - points[parent].y(),
+                ),
+            }
+            self._add_node(
+                "RPF{:08d}".format(i), "reach_point", points[i], levels[i] - 0.05
+            )
+            rp_from = self.nodes[-1]
+            self._add_node(
+                "RPT{:08d}".format(i),
+                "reach_point",
+                points[parent],
+                levels[parent] + 0.05,
+            )
+            rp_to = self.nodes[-1]
+
+            # Blind nodes on this reach, ordered along the reach
+            chain = [rp_from]
+            for n, upstream in enumerate(blind_targets.get(i, [])):
+                ratio = (n + 1.0) / (len(blind_targets[i]) + 1)
+                self._add_node(
+                    "{}-BLIND-{}".format(reach["obj_id"], n + 1),
+                    "blind_connection",
+                    QgsPointXY(
+                        points[i].x() + ratio * (points[parent].x() - points[i].x()),
+                        points[i].y() + ratio * (points[parent].y() - points[i].y()),
+                    ),
+                    None,
+                )
+                blind_nodes[upstream] = self.nodes[-1]
+                chain.append(self.nodes[-1])
+            chain.append(rp_to)
+
+            self._add_segment(
+                manholes[i]["obj_id"], "special_structure", manholes[i], rp_from
+            )
+            for from_node, to_node in zip(chain[:-1], chain[1:]):
+                self._add_segment(reach["obj_id"], "reach", from_node, to_node, reach)
+            downstream_reach_points.append((i, rp_to))
+
+        # Connect the downstream reach points, either to their manhole or blind
+        for i, rp_to in downstream_reach_points:
+            if i in blind_nodes:
+                self._add_segment("", "special_structure", rp_to, blind_nodes[i])
+            else:
+                target = manholes[parents[i]]
+                self._add_segment(target["obj_id"], "special_structure", rp_to, target)
+
+        # Keep the deepest manhole for the path benchmarks
+        depth = [0] * self.manhole_count
+        for i in range(1, self.manhole_count):
+            depth[i] = depth[parents[i]] + 1
+        self.outlet = manholes[0]["obj_id"]
+        self.deepest = manholes[max(range(self.manhole_count), key=depth.__getitem__)][
+            "obj_id"
+        ]
+
+    def layers(self):
+        """
+        Creates memory layers with the nodes and segments of this network
+        :return: A (node layer, segment layer) tuple
+        """
+        node_layer = self._layer("Point", "vw_network_node", NODE_FIELDS)
+        features = []
+        for node in self.nodes:
+            feature = QgsFeature(node_layer.fields())
+            geometry = QgsGeometry.fromPointXY(node["point"])
+            for name, _ in NODE_FIELDS[:-1]:
+                feature[name] = node[name]
+            feature["detail_geometry"] = "SRID=2056;" + geometry.asWkt()
+            feature.setGeometry(geometry)
+            features.append(feature)
+        node_layer.dataProvider().addFeatures(features)
+
+        segment_layer = self._layer("LineString", "vw_network_segment", SEGMENT_FIELDS)
+        features = []
+        for segment in self.segments:
+            feature = QgsFeature(segment_layer.fields())
+            geometry = QgsGeometry.fromPolylineXY(segment["polyline"])
+            for name, _ in SEGMENT_FIELDS[:-1]:
+                feature[name] = segment[name]
+            feature["detail_geometry"] = "SRID=2056;" + geometry.asWkt()
+            feature.setGeometry(geometry)
+            features.append(feature)
+        segment_layer.dataProvider().addFeatures(features)
+
+        return node_layer, segment_layer
+
+    @staticmethod
+    def _layer(geometry_type, name, fields):
+        layer = QgsVectorLayer("{}?crs=EPSG:2056".format(geometry_type), name, "memory")
+        layer.dataProvider().addAttributes(
+            [QgsField(name, field_type) for name, field_type in fields]
+        )
+        layer.updateFields()
+        return layer
+
+
+class Stopwatch(object):
+    """
+    Measures the wall time and the peak of python memory allocations of a block
+    """
+
+    def __init__(self, results, name, trace_memory):
+        self.results = results
+        self.name = name
+        self.trace_memory = trace_memory
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        result = {"seconds": time.perf_counter() - self.start}
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result["peak_memory_bytes"] = peak
+        self.results[self.name] = result
+
+
+def benchmark(network, trace_memory):
+    """
+    Runs all benchmarks on a synthetic network
+    :return: A dict with the measurements per stage
+    """
+    stages = {}
+    node_layer, segment_layer = network.layers()
+
+    manager = QgepGraphManager()
+    manager.setNodeLayer(node_layer)
+    with Stopwatch(stages, "graph_build", trace_memory):
+        manager.setReachLayer(segment_layer)
+
+    start = manager.vertexIds[network.deepest]
+    outlet = manager.vertexIds[network.outlet]
+
+    with Stopwatch(stages, "shortest_path", trace_memory):
+        vertices, edges = manager.shortestPath(start, outlet)
+    stages["shortest_path"]["edges"] = len(edges)
+
+    with Stopwatch(stages, "tree_downstream", trace_memory):
+        _, tree_edges = manager.getTree(start, False)
+    stages["tree_downstream"]["edges"] = len(tree_edges)
+
+    with Stopwatch(stages, "tree_upstream", trace_memory):
+        _, tree_edges = manager.getTree(outlet, True)
+    stages["tree_upstream"]["edges"] = len(tree_edges)
+
+    # The same steps as the profile map tool
+    with Stopwatch(stages, "profile_build", trace_memory):
+        edge_features = manager.getFeaturesById(
+            segment_layer, [edge["feature"] for _, _, edge in edges]
+        )
+        node_features = manager.getFeaturesById(node_layer, vertices)
+        profile = QgepProfile()
+        profile.addPath(vertices, edges, node_features, edge_features)
+
+    with Stopwatch(stages, "profile_as_json", trace_memory):
+        profile_json = profile.asJson()
+    stages["profile_as_json"]["bytes"] = len(profile_json)
+
+    return {
+        "segments": len(network.segments),
+        "nodes": len(network.nodes),
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="number of segments of the generated networks",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--branch-ratio", type=float, default=0.3)
+    parser.add_argument("--blind-ratio", type=float, default=0.05)
+    parser.add_argument("--special-structure-ratio", type=float, default=0.05)
+    parser.add_argument(
+        "--no-trace-memory",
+        action="store_true",
+        help="do not trace memory allocations, they slow down the measured code",
+    )
+    parser.add_argument("-o", "--output", help="JSON output file, default stdout")
+    args = parser.parse_args()
+
+    app = QgsApplication([], False)
+    app.initQgis()
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "qgis_version": Qgis.QGIS_VERSION,
+        "python_version": platform.python_version(),
+        "networkx_version": nx.__version__,
+        "platform": platform.platform(),
+        "runs": [],
+    }
+
+    for size in args.sizes:
+        network = SyntheticNetwork(
+            size,
+            branch_ratio=args.branch_ratio,
+            blind_ratio=args.blind_ratio,
+            special_structure_ratio=args.special_structure_ratio,
+            seed=args.seed,
+        )
+        run = benchmark(network, not args.no_trace_memory)
+        run["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results["runs"].append(run)
+        print(
+            "{} segments: {}".format(
+                run["segments"],
+                ", ".join(
+                    "{} {:.3f}s".format(name, stage["seconds"])
+                    for name, stage in run["stages"].items()
+                ),
+            ),
+            file=sys.stderr,
+        )
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    app.exitQgis()
+
+
+if __name__ == "__main__":
+    main()